@@ -0,0 +1,124 @@
+# bench_latex.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the cost per call of converting field values from LaTeX to unicode.
+
+Usage: python3 benchmarks/bench_latex.py [number of entries]
+
+Values are taken from generated entries in which journals, publishers and
+authors repeat, as they do in real libraries. The cached converter is modelled
+by a stand-in with the fast path and cache of latex_to_unicode in
+customization.py, since customization.py itself requires GTK.
+"""
+
+
+from functools import lru_cache
+
+from importlib.util import module_from_spec
+from importlib.util import spec_from_file_location
+
+from os.path import dirname
+from os.path import join
+
+from sys import argv
+
+from time import perf_counter
+
+from bibtexparser.latexenc import latex_to_unicode
+
+
+# latex.py only depends on bibtexparser, load it without the package
+spec = spec_from_file_location("latex", join(dirname(__file__), "..", "src", "latex.py"))
+latex = module_from_spec(spec)
+spec.loader.exec_module(latex)
+
+JOURNALS = ["Physical Review Letters", "Nature", "Journal of Applied Physics",
+            "Nano Letters", "{IEEE} Transactions on Electron Devices",
+            "Zeitschrift f{\\\"u}r Physik", "Applied Physics Letters",
+            "Journal de Physique {IV}"]
+PUBLISHERS = ["American Physical Society", "Springer", "Elsevier", "Wiley",
+              "{\\'E}ditions de Physique", "{IOP} Publishing"]
+AUTHORS = ["M{\\\"u}ller, J\\\"urgen", "Garc{\\'\\i}a, Mar{\\'\\i}a", "Smith, John",
+           "Nguy{\\~{\\^e}}n, Van", "Dvo{\\v{r}}{\\'a}k, Anton{\\'\\i}n",
+           "Brown, Alice", "Schr{\\\"o}dinger, Erwin", "Lee, Kim",
+           "{\\AA}str{\\\"o}m, Karl", "Ko{\\c{c}}, Ay{\\c{s}}e"]
+TITLES = ["On the properties of sample number {n} under various conditions",
+          "{Raman} spectroscopy of {$\\alpha$}-quartz, sample {n}",
+          "Electron transport in {GaAs} nanowires, part {n}",
+          "A study of the {\\em in situ} growth of sample {n}"]
+
+
+def generate_values(n):
+    """Values of the fields that are converted when an entry is shown."""
+    authors = " and ".join(AUTHORS[(n * k) % len(AUTHORS)] for k in (1, 3, 7))
+    return [
+        authors,
+        TITLES[n % len(TITLES)].replace("{n}", str(n)),
+        JOURNALS[n % len(JOURNALS)],
+        PUBLISHERS[n % len(PUBLISHERS)],
+        str(1950 + n % 70),
+        f"{n % 1000}--{n % 1000 + 12}",
+        f"10.1000/sample.{n}",
+    ]
+
+
+def make_cached(convert, maxsize):
+    """Stand-in for latex_to_unicode in customization.py"""
+    cached = lru_cache(maxsize=maxsize)(convert)
+
+    def cached_latex_to_unicode(string):
+        if "\\" not in string and "{" not in string and "}" not in string and string.isascii():
+            return string
+        return cached(string)
+    return cached_latex_to_unicode
+
+
+def measure(values, make_convert, repeat):
+    """Seconds per call, best of repeat passes over values."""
+    convert = make_convert()
+    best = None
+    for _n in range(repeat):
+        start = perf_counter()
+        for value in values:
+            convert(value)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(values)
+
+
+def main():
+    n_entries = int(argv[1]) if len(argv) > 1 else 10_000
+    values = [value for n in range(n_entries) for value in generate_values(n)]
+    with_latex = [value for value in values if "\\" in value or "{" in value]
+    print(f"{n_entries} entries, {len(values)} values, {len(with_latex)} with LaTeX")
+
+    # A warm cache is measured on a second pass, as when the itemlist is
+    # sorted or filtered again
+    cases = [
+        ("before: bibtexparser latex_to_unicode", lambda: latex_to_unicode, 1),
+        ("optimized converter", lambda: latex.convert_latex, 1),
+        ("optimized converter, cold cache", lambda: make_cached(latex.convert_latex, 65536), 1),
+        ("optimized converter, warm cache", lambda: make_cached(latex.convert_latex, 65536), 2),
+    ]
+    print("microseconds per call: all values, values with LaTeX")
+    for label, make_convert, repeat in cases:
+        all_cost = measure(values, make_convert, repeat) * 1e6
+        latex_cost = measure(with_latex, make_convert, repeat) * 1e6
+        print(f"    {label}: {all_cost:.2f}, {latex_cost:.2f}")
+
+
+if __name__ == "__main__":
+    main()
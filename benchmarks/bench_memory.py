@@ -0,0 +1,128 @@
+# bench_memory.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure memory per entry of the in-memory representations of a library.
+
+Usage: python3 benchmarks/bench_memory.py [number of entries]
+
+Entries are generated the way bibtexparser returns them: every entry holds its
+own copies of field names and values. Each entry is wrapped in a BadaBibItem
+with its sort keys in a SortKeyStore, as in an opened file. The modules are
+loaded from src with a stand-in for gi, since the GTK bindings are only used
+for the settings, which the benchmark does not read.
+"""
+
+
+import sys
+import tracemalloc
+
+from os.path import dirname
+from os.path import join
+
+from types import ModuleType
+
+from bibtexparser.bibdatabase import BibDatabase
+
+
+class Settings:
+    """Stand-in for Gio.Settings, config_manager creates one on import"""
+    @staticmethod
+    def new(_schema_id):
+        return Settings()
+
+
+gi = ModuleType("gi")
+gi.repository = ModuleType("gi.repository")
+gi.repository.Gio = ModuleType("gi.repository.Gio")
+gi.repository.Gio.Settings = Settings
+gi.repository.GLib = ModuleType("gi.repository.GLib")
+sys.modules["gi"] = gi
+sys.modules["gi.repository"] = gi.repository
+
+badabib = ModuleType("badabib")
+badabib.__path__ = [join(dirname(__file__), "..", "src")]
+sys.modules["badabib"] = badabib
+
+from badabib import compact     # noqa: E402
+from badabib.bibitem import BadaBibItem     # noqa: E402
+from badabib.sort_store import SortKeyStore     # noqa: E402
+
+JOURNALS = ["Physical Review Letters", "Nature", "Journal of Applied Physics",
+            "Nano Letters", "Science", "Applied Physics Letters"]
+PUBLISHERS = ["American Physical Society", "Springer", "Elsevier", "Wiley"]
+
+
+def copy(text):
+    """Fresh copy of a string, like the ones produced by the parser."""
+    return (text + ".")[:-1]
+
+
+def generate_entry(n):
+    fields = {
+        "ENTRYTYPE": "article",
+        "ID": f"Author{n}{1950 + n % 70}",
+        "author": f"Author{n}, Alice and Writer{n % 97}, Bob and Scribe{n % 13}, Carol",
+        "title": f"On the properties of sample number {n} under various conditions",
+        "journal": JOURNALS[n % len(JOURNALS)],
+        "publisher": PUBLISHERS[n % len(PUBLISHERS)],
+        "year": str(1950 + n % 70),
+        "volume": str(n % 120),
+        "pages": f"{n % 1000}--{n % 1000 + 12}",
+        "doi": f"10.1000/sample.{n}",
+    }
+    return {copy(field): copy(value) for field, value in fields.items()}
+
+
+class File:
+    """The parts of BadaBibFile a BadaBibItem uses when it is created"""
+    def __init__(self, entries):
+        self.database = BibDatabase()
+        self.database.entries = entries
+        self.sort_keys = SortKeyStore()
+        self.type_counts = {}
+
+    def count_item(self, entrytype, delta):
+        self.type_counts[entrytype] = self.type_counts.get(entrytype, 0) + delta
+
+
+def measure(n_entries, pack):
+    tracemalloc.start()
+    entries = [generate_entry(n) for n in range(n_entries)]
+    if pack is not None:
+        entries = [pack(entry) for entry in entries]
+    bibfile = File(entries)
+    items = [BadaBibItem(bibfile, idx) for idx in range(n_entries)]
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items, bibfile, entries
+    return size / n_entries
+
+
+def main():
+    n_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{n_entries} entries, bytes per entry")
+
+    cases = [
+        ("dict entries as returned by the parser", None),
+        ("interned dict entries", compact.compact_entry),
+        ("packed entries", compact.PackedEntry),
+    ]
+    for label, pack in cases:
+        print(f"    {label}: {measure(n_entries, pack):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,23 +19,28 @@ gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
 gi.require_version("GtkSource", "5")
 
-import badabib.customization
-import badabib.forms
+from .instrumentation import STATS_ENABLED
+from .instrumentation import PROFILE_STARTUP
+from .instrumentation import print_stats
+from .instrumentation import print_startup_profile
+from .instrumentation import profile_step
+
+with profile_step("import forms"):
+    import badabib.customization
+    import badabib.forms
 
 from gi.repository import GLib, Gtk, Gio, Adw
 
 from sys import argv
 
-from .window import BadaBibWindow
-
-from .layout_manager import LayoutManagerWindow
-
-from .string_manager import StringManagerWindow
-
-from .preferences import PreferencesWindow
+with profile_step("import window"):
+    from .window import BadaBibWindow
 
 from .dialogs import AboutDialog
 
+# The layout manager, string manager and preferences windows are imported
+# when they are first shown, as they are not needed to start up
+
 
 # Names of actions to customize fields
 menu_actions = [
@@ -64,6 +69,7 @@ class Application(Adw.Application):
             )
         self.window = None
         self.version = version
+        self.first_frame_handler = None     # (frame clock, handler id) for startup profile
 
         # Switch to turn customization menu on/off
         self.menu_actions_active = True
@@ -87,6 +93,15 @@ class Application(Adw.Application):
         # Install custom actions
         self.install_actions()
 
+    def do_shutdown(self):
+        """
+        Print statistics if requested via the BADABIB_STATS environment
+        variable, then shut down.
+        """
+        if STATS_ENABLED:
+            print_stats()
+        Adw.Application.do_shutdown(self)
+
     def do_activate(self):
         """
         Shows the default first window of the application (like a new document).
@@ -118,13 +133,24 @@ class Application(Adw.Application):
         if not self.window:
             # Files have no internal states yet (state = None)
             self.arg_files = {file.get_path() : None for file in gfiles}
-            self.window = BadaBibWindow(application=self)
+            with profile_step("build window"):
+                self.window = BadaBibWindow(application=self)
             self.window.present()
+            if PROFILE_STARTUP:
+                frame_clock = self.window.get_frame_clock()
+                handler_id = frame_clock.connect("after-paint", self.on_first_frame)
+                self.first_frame_handler = (frame_clock, handler_id)
 
         # Else, open files
         else:
             self.window.main_widget.open_files([file.get_path() for file in gfiles])
 
+    def on_first_frame(self, _frame_clock):
+        """Print startup profile once the first frame has been drawn."""
+        frame_clock, handler_id = self.first_frame_handler
+        frame_clock.disconnect(handler_id)
+        print_startup_profile()
+
     def get_actions(self):
         """List of all custom actions with shortcuts."""
         actions = [
@@ -142,6 +168,7 @@ class Application(Adw.Application):
             ("save",            None,                   self.on_save,           "<Control>s"),
             ("save_as",         None,                   self.on_save_as,        "<Control><Shift>s"),
             ("save_all",        None,                   self.on_save_all,       "<Control><Alt>s"),
+            ("restore_backup",  None,                   self.on_restore_backup, None),
             ("close",           None,                   self.on_close,          "<Control>w"),
             ("clear_recent",    None,                   self.on_clear_recent,   None),
             ("new_entry",       None,                   self.on_new_entry,      "<Control>n"),
@@ -160,7 +187,11 @@ class Application(Adw.Application):
             ("sanitize_range",  None,                   self.on_sanitize_range, "<Alt>r"),
             ("to_unicode",      None,                   self.on_to_unicode,     "<Alt>o"),
             ("to_latex",        None,                   self.on_to_latex,       "<Alt>l"),
+            ("bulk_transform",  None,                   self.on_bulk_transform, "<Control><Alt>t"),
+            ("import",          None,                   self.on_import,         "<Control>i"),
+            ("export",          None,                   self.on_export,         "<Control>e"),
             ("generate_key",    None,                   self.on_generate_key,   "<Alt>k"),
+            ("generate_keys",   None,                   self.on_generate_keys,  "<Alt><Shift>k"),
         ]
         return actions
 
@@ -242,6 +273,7 @@ class Application(Adw.Application):
 
     def on_show_prefs(self, action=None, data=None):
         """Show preferences window. See on_quit for parameters."""
+        from .preferences import PreferencesWindow
         PreferencesWindow(self.window)
 
     def on_show_about(self, action=None, data=None):
@@ -251,10 +283,12 @@ class Application(Adw.Application):
 
     def on_custom_editor(self, action=None, data=None):
         """Show editor layout manager. See on_quit for parameters."""
+        from .layout_manager import LayoutManagerWindow
         LayoutManagerWindow(self.window)
 
     def on_manage_strings(self, action=None, data=None):
         """Show string manager. See on_quit for parameters."""
+        from .string_manager import StringManagerWindow
         StringManagerWindow(self.window)
 
     # Files
@@ -291,6 +325,10 @@ class Application(Adw.Application):
         """Handle save_all signal. See on_quit for parameters."""
         self.window.main_widget.save_all_files()
 
+    def on_restore_backup(self, action=None, data=None):
+        """Handle restore_backup signal. See on_quit for parameters."""
+        self.window.main_widget.restore_backup()
+
     def on_close(self, action=None, data=None):
         """
         Handle close signal by closing currently selected tab.
@@ -316,7 +354,7 @@ class Application(Adw.Application):
         """
         items = self.window.main_widget.get_selected_items()
         if items:
-            self.window.main_widget.copy_paste_buffer = [item.entry.copy() for item in items]
+            self.window.main_widget.copy_items(items)
 
     def on_cut(self, action=None, data=None):
         """
@@ -325,7 +363,7 @@ class Application(Adw.Application):
         """
         items = self.window.main_widget.get_selected_items()
         if items:
-            self.window.main_widget.copy_paste_buffer = [item.entry.copy() for item in items]
+            self.window.main_widget.copy_items(items)
             self.window.main_widget.delete_items(items)
 
     def on_paste(self, action=None, data=None):
@@ -333,9 +371,7 @@ class Application(Adw.Application):
         Handle paste signal by pasting entries in copy/paste buffer to current
         file. See on_quit for parameters.
         """
-        entries = self.window.main_widget.copy_paste_buffer
-        if entries:
-            self.window.main_widget.add_items(entries=[entry.copy() for entry in entries])
+        self.window.main_widget.paste_items()
 
     def on_find(self, action=None, data=None):
         """Handle find signal. See on_quit for parameters."""
@@ -456,10 +492,26 @@ class Application(Adw.Application):
         """Handle to_latex signal. See on_quit for parameters."""
         self.apply_customization(badabib.customization.convert_to_latex)
 
+    def on_bulk_transform(self, action=None, data=None):
+        """Handle bulk_transform signal. See on_quit for parameters."""
+        self.window.main_widget.bulk_transform()
+
+    def on_import(self, action=None, data=None):
+        """Handle import signal. See on_quit for parameters."""
+        self.window.main_widget.import_entries()
+
+    def on_export(self, action=None, data=None):
+        """Handle export signal. See on_quit for parameters."""
+        self.window.main_widget.export_entries()
+
     def on_generate_key(self, action=None, data=None):
         """Handle generate_key signal. See on_quit for parameters."""
         self.window.main_widget.generate_key()
 
+    def on_generate_keys(self, action=None, data=None):
+        """Handle generate_keys signal. See on_quit for parameters."""
+        self.window.main_widget.generate_keys()
+
 
 def main(version):
     """
@@ -0,0 +1,339 @@
+# backup.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import lzma
+
+from os import listdir
+from os import makedirs
+from os import remove
+from os import replace
+from os.path import exists
+from os.path import getsize
+from os.path import join
+
+from hashlib import sha1
+from hashlib import sha256
+
+from shutil import copymode
+
+from threading import Lock
+from threading import Thread
+
+from time import time
+
+from gi.repository import GLib
+
+from .config_manager import get_backup_age_limit
+from .config_manager import get_backup_generations
+from .config_manager import get_backup_size_limit
+
+from .watcher import get_signature
+
+
+# Backups of each file live in their own directory. Snapshots are stored
+# compressed and named after the hash of their content, so that identical
+# generations share one snapshot. The index lists all generations, oldest first.
+BACKUP_DIR = join(GLib.get_user_data_dir(), "badabib", "backups")
+INDEX_NAME = "index.json"
+SNAPSHOT_SUFFIX = ".xz"
+TEMP_SUFFIX = ".tmp"
+
+# Fast preset, compressing a backup should not take longer than saving the file
+COMPRESSION_PRESET = 1
+
+CHUNK_SIZE = 1 << 20
+SECONDS_PER_DAY = 24 * 60 * 60
+
+lock = Lock()           # Serialize access to backup directories
+pending = {}            # {file name: (thread, result)} of backups in progress
+pending_lock = Lock()   # Guard pending, which is used by several threads
+
+
+def get_backup_dir(name):
+    """
+    Get directory holding the backups of a file.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+
+    Returns
+    -------
+    str
+    """
+    digest = sha1(name.encode("utf-8", "surrogateescape")).hexdigest()
+    return join(BACKUP_DIR, digest)
+
+
+def read_index(directory):
+    """
+    Read list of generations. Each generation is a dict with the keys "time",
+    "digest", "size", "compressed_size" and "signature".
+
+    Parameters
+    ----------
+    directory: str
+
+    Returns
+    -------
+    list of dict
+        Oldest generation first, empty if there are no backups
+    """
+    try:
+        with open(join(directory, INDEX_NAME), "r", encoding="utf-8") as file:
+            return json.load(file)["generations"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def write_index(directory, name, generations):
+    """Write list of generations, see read_index."""
+    path = join(directory, INDEX_NAME)
+    with open(path + TEMP_SUFFIX, "w", encoding="utf-8") as file:
+        json.dump({"file": name, "generations": generations}, file, indent=1)
+    replace(path + TEMP_SUFFIX, path)
+
+
+def write_snapshot(name, directory):
+    """
+    Compress file into the backup directory. The file is read only once and
+    hashed while it is compressed.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+    directory: str
+        Backup directory of the file
+
+    Returns
+    -------
+    digest: str
+        Hash of the file content
+    size: int
+        Size of the file in bytes
+    """
+    temp_path = join(directory, "snapshot" + TEMP_SUFFIX)
+    digest = sha256()
+    compressor = lzma.LZMACompressor(preset=COMPRESSION_PRESET)
+    size = 0
+
+    with open(name, "rb") as infile, open(temp_path, "wb") as outfile:
+        while chunk := infile.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            outfile.write(compressor.compress(chunk))
+        outfile.write(compressor.flush())
+
+    # Content-addressed: keep existing snapshot of identical content
+    replace(temp_path, join(directory, digest.hexdigest() + SNAPSHOT_SUFFIX))
+    return digest.hexdigest(), size
+
+
+def prune(directory, generations):
+    """
+    Discard oldest generations until the backups are within the generation,
+    size and age limits, then delete snapshots no generation refers to. The
+    most recent generation is always kept.
+
+    Parameters
+    ----------
+    directory: str
+    generations: list of dict
+        Modified in place
+    """
+    max_generations = max(get_backup_generations(), 1)
+    size_limit = get_backup_size_limit() * 1024 * 1024
+    age_limit = get_backup_age_limit() * SECONDS_PER_DAY
+    now = time()
+
+    def total_size():
+        sizes = {generation["digest"]: generation["compressed_size"] for generation in generations}
+        return sum(sizes.values())
+
+    while len(generations) > 1 and (
+        len(generations) > max_generations
+        or (size_limit and total_size() > size_limit)
+        or (age_limit and now - generations[0]["time"] > age_limit)
+    ):
+        generations.pop(0)
+
+    digests = {generation["digest"] for generation in generations}
+    for filename in listdir(directory):
+        if filename == INDEX_NAME:
+            continue
+        if filename.removesuffix(SNAPSHOT_SUFFIX) not in digests:
+            try:
+                remove(join(directory, filename))
+            except OSError:
+                pass
+
+
+def create_backup(name):
+    """
+    Add a new generation to the backups of a file, unless the file did not
+    change since the last backup. Intended to be run in a thread.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+
+    Returns
+    -------
+    bool
+        False if the backup failed
+    """
+    signature = get_signature(name)
+    if signature is None:
+        return False
+
+    with lock:
+        directory = get_backup_dir(name)
+        try:
+            makedirs(directory, exist_ok=True)
+            generations = read_index(directory)
+
+            # Skip reading the file if it is unchanged since the last backup
+            if generations and tuple(generations[-1]["signature"]) == signature:
+                return True
+
+            digest, size = write_snapshot(name, directory)
+            if generations and generations[-1]["digest"] == digest:
+                generations[-1]["signature"] = signature
+            else:
+                generations.append({
+                    "time": time(),
+                    "digest": digest,
+                    "size": size,
+                    "compressed_size": getsize(join(directory, digest + SNAPSHOT_SUFFIX)),
+                    "signature": signature,
+                })
+
+            prune(directory, generations)
+            write_index(directory, name, generations)
+        except OSError:
+            return False
+
+    return True
+
+
+def backup_in_background(name):
+    """
+    Back up file in a thread. Use wait_for_backup before overwriting the file.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+    """
+    result = [False]
+
+    def backup_thread():
+        result[0] = create_backup(name)
+
+    thread = Thread(target=backup_thread, daemon=True)
+    with pending_lock:
+        pending[name] = (thread, result)
+    thread.start()
+
+
+def wait_for_backup(name):
+    """
+    Wait until a backup started by backup_in_background is done.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+
+    Returns
+    -------
+    bool
+        False if the backup failed, True otherwise or if there was no backup
+        in progress
+    """
+    with pending_lock:
+        if name not in pending:
+            return True
+        thread, result = pending.pop(name)
+    thread.join()
+    return result[0]
+
+
+def list_backups(name):
+    """
+    List available backups of a file.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+
+    Returns
+    -------
+    list of dict
+        Generations, most recent first. See read_index for details.
+    """
+    # The index is replaced atomically, so reading it needs no lock and does
+    # not wait for a backup that is being compressed
+    generations = read_index(get_backup_dir(name))
+    return generations[::-1]
+
+
+def restore_backup(name, digest):
+    """
+    Overwrite file with a backup. The current content of the file is backed up
+    first, so that restoring can be undone. Intended to be run in a thread.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+    digest: str
+        Digest of the generation to restore
+
+    Returns
+    -------
+    bool
+        False if the backup could not be restored
+    """
+    wait_for_backup(name)
+    if get_signature(name) is not None and not create_backup(name):
+        return False
+
+    with lock:
+        snapshot = join(get_backup_dir(name), digest + SNAPSHOT_SUFFIX)
+        # The file may be mapped into memory, replace it instead of
+        # overwriting it in place
+        temp_name = name + ".restoring"
+        try:
+            with lzma.open(snapshot, "rb") as infile, open(temp_name, "wb") as outfile:
+                while chunk := infile.read(CHUNK_SIZE):
+                    outfile.write(chunk)
+            if exists(name):
+                copymode(name, temp_name)
+            replace(temp_name, name)
+        except (OSError, lzma.LZMAError):
+            try:
+                remove(temp_name)
+            except OSError:
+                pass
+            return False
+
+    return True
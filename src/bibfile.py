@@ -16,18 +16,23 @@
 
 from os.path import split
 
-from unicodedata import normalize
-
-from .customization import convert_to_unicode
-
 from .config_manager import get_default_entrytype
+from .config_manager import get_pack_entries
+
+from .compact import compact_entry
+from .compact import PackedEntry
 
 from .bibitem import BadaBibItem
 
+from .entry_parser import EntryParser
+
+from .keys import base_key
+from .keys import unique_key
+
+from .search import SearchIndex
+
+from .sort_store import SortKeyStore
 
-# 'a' and 'A' to create unique keys by iterating over ASCII characters
-UPPERCASE_A_ASCII = 65
-LOWERCASE_A_ASCII = 97
 
 # Editor shown when no entry is selected
 DEFAULT_EDITOR = get_default_entrytype()
@@ -38,7 +43,7 @@ class BadaBibFile:
     Representation of a .bib file and its entries. BadaBibFiles wrap around a
     bibtexparser database and are managed by a BadaBibStore.
     """
-    def __init__(self, store, name, database, created=False):
+    def __init__(self, store, name, database, created=False, lazy_index=None):
         """
         Initilize BadaBibFile.
 
@@ -52,6 +57,10 @@ class BadaBibFile:
             bibtexparser database
         created: bool, optional
             Was this file created by BadaBib!? The default value is 'False'.
+        lazy_index: LazyIndex, optional
+            Index of a file whose entries are parsed on demand. If given, the
+            database only contains strings, comments and preambles. The
+            default value is None.
         """
         self.store = store                          # Store managing this file
         self.name = name                            # Full path
@@ -61,10 +70,18 @@ class BadaBibFile:
         self.local_strings = {}                     # Strings defined in the .bib file
         self.writer = store.get_default_writer()    # bibtexparser writer
         self.items = []                             # list of bib items
+        self.sort_keys = SortKeyStore()             # Sort keys of all items
+        self.search_index = SearchIndex(self)       # Full text index of all items
+        self.type_counts = {}                       # {entry type: number of non-deleted items}
+        self.n_items = 0                            # Number of non-deleted items
         self.itemlist = None                        # itemlist showing entries of this file
         self.unsaved = False                        # File contains unsaved changes
         self.created = created                      # File was created by Bada Bib!
         self.backup_on_save = True                  # Backup file when saving
+        self.journal = None                         # Journal of unsaved changes
+        self.entry_parser = EntryParser(self)       # Parser for edited entries
+        self.pack_entries = get_pack_entries()      # Store entries as PackedEntry
+        self.lazy_index = lazy_index                # Index of entries not parsed yet
 
         # Read database to create items from entries
         self.read_database()
@@ -75,19 +92,138 @@ class BadaBibFile:
             item.unref()
         self.itemlist.unref()
         self.writer = None
+        if self.lazy_index:
+            self.lazy_index.close()
+            self.lazy_index = None
         self.database = None
         self.local_strings = None
+        self.search_index = None
         self.itemlist = None
 
+    def log_change(self, change):
+        """
+        Record a change that was just applied or reverted in the journal, if
+        this file is journaled.
+
+        Parameters
+        ----------
+        change: Change
+        """
+        if self.journal:
+            self.journal.log_change(change)
+
     def read_database(self):
         """
         Convert entries of a database to BadaBibItems. This function should only
         be called once on initialization
         """
         self.local_strings = self.database.strings
-        for idx in range(len(self.database.entries)):
+        entries = self.database.entries
+        if self.lazy_index:
+            # Entries are parsed when needed, see load_entry
+            entries[:] = [None] * len(self.lazy_index)
+            for idx in range(len(entries)):
+                self.items.append(BadaBibItem(self, idx))
+            return
+        for idx in range(len(entries)):
+            entries[idx] = self.pack_entry(entries[idx])
             self.items.append(BadaBibItem(self, idx))
 
+    def load_entry(self, idx):
+        """
+        Parse an entry of a lazily loaded file.
+
+        Parameters
+        ----------
+        idx: int
+            Index of the entry
+
+        Returns
+        -------
+        dict or PackedEntry
+            Parsed entry
+        """
+        entry = self.pack_entry(self.lazy_index.parse(idx, self.entry_parser))
+        self.database.entries[idx] = entry
+        self.items[idx].update_all_sort_values()
+        return entry
+
+    def load_all(self):
+        """Parse all entries of a lazily loaded file that were not parsed yet."""
+        if not self.lazy_index:
+            return
+        entries = self.database.entries
+        for idx in range(len(self.lazy_index)):
+            if entries[idx] is None:
+                self.load_entry(idx)
+
+    def load_steps(self):
+        """
+        Parse the entries of a lazily loaded file that were not parsed yet,
+        one entry per step of a scheduler job.
+
+        Yields
+        ------
+        None
+        """
+        entries = self.database.entries
+        for idx in range(len(entries)):
+            if entries[idx] is None:
+                self.load_entry(idx)
+                yield
+
+    def count_unloaded(self):
+        """Number of entries of a lazily loaded file that were not parsed yet."""
+        if not self.lazy_index:
+            return 0
+        return self.database.entries.count(None)
+
+    def load_sort_values(self, field):
+        """
+        Make sure that all sort keys of a field are known. Only the keys of
+        entries that were not parsed yet are known in lazily loaded files.
+
+        Parameters
+        ----------
+        field: str
+        """
+        if field != "ID":
+            self.load_all()
+
+    def has_sort_values(self, field):
+        """Check if all sort keys of a field are known, see load_sort_values."""
+        return field == "ID" or not self.count_unloaded()
+
+    def mark_modified(self, idx):
+        """
+        Declare the original source of an entry outdated, so that it is no
+        longer copied when saving a lazily loaded file.
+
+        Parameters
+        ----------
+        idx: int
+        """
+        if self.lazy_index:
+            self.lazy_index.modified.add(idx)
+
+    def pack_entry(self, entry):
+        """
+        Convert entry to the compact in-memory representation used by this
+        file. Field names and repeated values are interned, and entries are
+        packed if the pack-entries setting is active.
+
+        Parameters
+        ----------
+        entry: dict or PackedEntry
+
+        Returns
+        -------
+        dict or PackedEntry
+        """
+        if self.pack_entries:
+            return PackedEntry(entry)
+        return compact_entry(entry)
+
     def append_item(self, entry=None):
         """
         Convert bibtexparser entry to Bada Bib! item and append it to this file.
@@ -105,10 +241,9 @@ class BadaBibFile:
         """
         # Append entry to database
         idx = len(self.database.entries)
-        if entry:
-            self.database.entries.append(entry)
-        else:
-            self.database.entries.append({"ID": "", "ENTRYTYPE": DEFAULT_EDITOR})
+        if not entry:
+            entry = {"ID": "", "ENTRYTYPE": DEFAULT_EDITOR}
+        self.database.entries.append(self.pack_entry(entry))
         # Create item from entry and append to list
         item = BadaBibItem(self, idx)
         self.items.append(item)
@@ -128,7 +263,7 @@ class BadaBibFile:
         int
             Number of non-deleted items of given type
         """
-        return sum(item.entry["ENTRYTYPE"] == entrytype for item in self.items if not item.deleted)
+        return self.type_counts.get(entrytype, 0)
 
     def count_all(self):
         """
@@ -139,7 +274,37 @@ class BadaBibFile:
         int
             Number of non-deleted items
         """
-        return sum(not item.deleted for item in self.items)
+        return self.n_items
+
+    def count_deleted(self):
+        """
+        Count deleted items of this file
+
+        Returns
+        -------
+        int
+            Number of deleted items
+        """
+        return len(self.items) - self.n_items
+
+    def count_item(self, entrytype, delta):
+        """
+        Update counters when an item is added, deleted, undeleted, or changes
+        its entry type. Counters are kept up to date by BadaBibItem.
+
+        Parameters
+        ----------
+        entrytype: str
+            Entry type of the item
+        delta: int
+            1 if the item is counted, -1 if it no longer is
+        """
+        count = self.type_counts.get(entrytype, 0) + delta
+        if count:
+            self.type_counts[entrytype] = count
+        else:
+            self.type_counts.pop(entrytype, None)
+        self.n_items += delta
 
     def is_empty(self):
         """
@@ -187,7 +352,7 @@ class BadaBibFile:
 
     def has_empty_keys(self):
         """Check if file contains non-deleted entries without keys"""
-        return any(not item.entry["ID"] and not item.deleted for item in self.items)
+        return any(not item.key and not item.deleted for item in self.items)
 
     def get_duplicate_keys(self):
         """
@@ -198,7 +363,7 @@ class BadaBibFile:
         duplicates: list of str
             List of duplicate keys
         """
-        keys = [item.entry["ID"] for item in self.items if not item.deleted]
+        keys = [item.key for item in self.items if not item.deleted]
         duplicates = [key for key in set(keys) if keys.count(key) > 1]
         return duplicates
 
@@ -216,7 +381,7 @@ class BadaBibFile:
         bool
             True if key is unique
         """
-        keys = [item.entry["ID"] for item in self.items if not item.deleted]
+        keys = [item.key for item in self.items if not item.deleted]
         return keys.count(key) == 0
 
     def generate_key_for_item(self, item):
@@ -233,66 +398,28 @@ class BadaBibFile:
         key: str
             Unique entry key
         """
-        # Get last name of first author, covert to ascii, and capitalize.
-        # If the paper has exactly two authors, get both last names
-        last_names = item.last_name_list()
-        if "author" in item.entry and last_names:
-            utf_name = convert_to_unicode(last_names[0])
-            ascii_name = normalize("NFKD", utf_name).encode("ascii", "ignore").decode("utf-8")
-            key = ascii_name[:1].upper() + ascii_name[1:]
-            if len(last_names) == 2:
-                utf_name = convert_to_unicode(last_names[1])
-                ascii_name = normalize("NFKD", utf_name).encode("ascii", "ignore").decode("utf-8")
-                key += ascii_name[:1].upper() + ascii_name[1:]
-        else:
-            # use entrytpye as key otherwise
-            key = item.entry["ENTRYTYPE"]
-
-        # add year
-        if "year" in item.entry:
-            key += str(item.raw_field("year"))
+        # Last names of the first or both authors, or entry type, and year
+        key = base_key(item.last_name_list(), item.entry["ENTRYTYPE"], item.raw_field("year"))
 
         # if necessary, add suffix to avoid duplicates
-        if key and key != item.entry["ID"]:
-            if key[-1].islower():
-                suffix_code = UPPERCASE_A_ASCII
-            else:
-                suffix_code = LOWERCASE_A_ASCII
+        keys = {other.key for other in self.items if not other.deleted}
+        return unique_key(key, keys, item.entry["ID"])
 
-            has_suffix = False
-            while not self.key_is_unique(key):
-                if has_suffix:
-                    key = key[:-1]
-                else:
-                    has_suffix = True
-                key += chr(suffix_code)
-                suffix_code += 1
-
-        return key
-
-    @staticmethod
-    def get_sort_key_func(field):
+    def ordered_items(self):
         """
-        Wrap sort key of item in a function so that it can be passed to the
-        list.sort() method.
-
-        Parameters
-        ----------
-        fields: str
-            Field of interest
+        Get items in the current order of the itemlist.
 
         Returns
         -------
-        sort_key_func: function
-            sort key function
+        list of BadaBibItem
         """
-        def sort_key_func(item):
-            return item.sort_values[field]
-        return sort_key_func
+        self.load_sort_values(self.itemlist.sort_key)
+        order = self.sort_keys.order(self.itemlist.sort_key, self.itemlist.sort_reverse)
+        return [self.items[idx] for idx in order]
 
     def parse_entry(self, bibtex):
         """
-        Parse a single bibtex entry with default parser.
+        Parse a single bibtex entry with the parser of this file.
 
         Parameters
         ----------
@@ -304,20 +431,7 @@ class BadaBibFile:
         dict or None
             bibparser database entry or None, if bibtex parameter is invalid
         """
-        parser = self.store.get_default_parser()
-        writer = self.store.get_default_writer()
-
-        # add strings to bibtex entry and try to parse it
-        strings_and_bibtex = writer._strings_to_bibtex(self.database) + bibtex
-        try:
-            test_database = parser.parse(strings_and_bibtex)
-        except UnicodeDecodeError:
-            return None
-
-        # we expect a database with a single entry
-        if test_database and len(test_database.entries) == 1:
-            return test_database.entries.pop(-1)
-        return None
+        return self.entry_parser.parse(bibtex)
 
     def comments_to_text(self):
         """
@@ -365,12 +479,12 @@ class BadaBibFile:
         text = ""
 
         # Sort by order of itemlist
-        sort_key_func = self.get_sort_key_func(self.itemlist.sort_key)
-        self.items.sort(reverse=self.itemlist.sort_reverse, key=sort_key_func)
-
-        for item in self.items:
+        for item in self.ordered_items():
+            # Copy source of entries that were not modified in lazy files
+            if self.lazy_index and not item.deleted and self.lazy_index.is_unchanged(item.idx):
+                text += self.lazy_index.source(item.idx)
             # Only write non-deleted items
-            if not item.deleted:
+            elif not item.deleted:
                 # If setting is active, align along '=' sign
                 if self.writer.align_values:
                     self.writer._max_field_width = item.max_field_width
@@ -14,30 +14,29 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from bibtexparser.latexenc import latex_to_unicode
-
 from bibtexparser.bibdatabase import BibDatabase
 from bibtexparser.bibdatabase import BibDataString
 from bibtexparser.bibdatabase import BibDataStringExpression
 from bibtexparser.bibdatabase import UndefinedString
 
-from bibtexparser.customization import getnames
-from bibtexparser.customization import splitname
-from bibtexparser.customization import InvalidName
-
+from .customization import latex_to_unicode
 from .customization import prettify_unicode_field
 
+from .names import last_names
+from .names import parse_names
+
+from .compact import intern_value
+
 from .config_manager import month_dict
 from .config_manager import sort_fields
 
+from .sort_store import MAX_CHAR
+
 
 # bibtexparser database containing dict with month macros
 month_database = BibDatabase()
 month_database.strings = month_dict
 
-# maximum char to sort entries to the end of a list
-MAX_CHAR = chr(0x10FFFF)
-
 
 def expand_pretty(expression):
     """
@@ -189,11 +188,33 @@ def entries_equal(entry1, entry2):
     return True
 
 
+def pretty_sort_value(field, value):
+    """
+    Convert value to a sort key.
+
+    Parameters
+    ----------
+    field: str
+    value: str or BibDataStringExpression
+
+    Returns
+    -------
+    str
+        Lower case pretty value
+    """
+    value = expand_pretty(value)
+    value = latex_to_unicode(value)
+    return prettify_unicode_field(field, value).lower()
+
+
 class BadaBibItem:
     """
     Representation of a BibTeX entry. BadaBibItems wrap around a
     bibtexparser entry and are managed by a BadaBibFile.
     """
+    # Files can hold 100k+ items, so avoid a per-instance __dict__
+    __slots__ = ("bibfile", "idx", "row", "_bibtex", "_deleted", "version")
+
     def __init__(self, bibfile, idx):
         """
         Initilize BadaBibItem.
@@ -208,17 +229,61 @@ class BadaBibItem:
         self.bibfile = bibfile
         self.idx = idx
         self.row = None             # Row of itemlist containing this entry
-        self.sort_values = {}       # Sort keys of this entry
-        self.bibtex = None          # Raw BibTeX source
-        self.deleted = False        # True if entry was deleted
+        self._bibtex = None         # Raw BibTeX source, generated on demand
+        self._deleted = False       # True if entry was deleted
+        self.version = 0            # Incremented whenever the entry changes
 
-        self.update_bibtex()            # Generate source
-        self.update_all_sort_values()   # Generate sort keys
+        self.update_all_sort_values()   # Generate sort keys in sort key store
+        bibfile.count_item(self.entrytype, 1)
 
     @property
     def entry(self):
-        """Shortcut to entry in database"""
-        return self.bibfile.database.entries[self.idx]
+        """Shortcut to entry in database, parsed first if necessary"""
+        entry = self.bibfile.database.entries[self.idx]
+        if entry is None:
+            entry = self.bibfile.load_entry(self.idx)
+        return entry
+
+    @property
+    def deleted(self):
+        """True if entry was deleted"""
+        return self._deleted
+
+    @deleted.setter
+    def deleted(self, deleted):
+        if deleted != self._deleted:
+            self._deleted = deleted
+            self.bibfile.count_item(self.entrytype, -1 if deleted else 1)
+
+    @property
+    def loaded(self):
+        """False if the entry of a lazily loaded file was not parsed yet"""
+        return self.bibfile.database.entries[self.idx] is not None
+
+    @property
+    def key(self):
+        """BibTeX key, available without parsing the entry"""
+        if self.loaded:
+            return self.entry["ID"]
+        return self.bibfile.lazy_index.keys[self.idx]
+
+    @property
+    def entrytype(self):
+        """Entry type, available without parsing the entry"""
+        if self.loaded:
+            return self.entry["ENTRYTYPE"]
+        return self.bibfile.lazy_index.entrytypes[self.idx]
+
+    @property
+    def bibtex(self):
+        """Raw BibTeX source, generated when first needed"""
+        if self._bibtex is None and self.bibfile:
+            writer = self.bibfile.writer
+            # Align fields along '=' if setting is active
+            if writer.align_values:
+                writer._max_field_width = self.max_field_width
+            self._bibtex = writer._entry_to_bibtex(self.entry)
+        return self._bibtex
 
     @property
     def max_field_width(self):
@@ -229,8 +294,7 @@ class BadaBibItem:
         """Delete references to file and widgets to force-free memory"""
         self.bibfile = None
         self.row = None
-        self.sort_values = None
-        self.bibtex = None
+        self._bibtex = None
 
     def pretty_field(self, field):
         """
@@ -248,11 +312,44 @@ class BadaBibItem:
         if field not in self.entry:
             return None
 
-        value = expand_pretty(self.entry[field])        # Expand strings
-        value = latex_to_unicode(value)                 # Convert to unicode
+        value = self.plain_field(field)                 # Expand strings, convert to unicode
         value = prettify_unicode_field(field, value)    # Prettify
         return value
 
+    def plain_field(self, field):
+        """
+        Get plain unicode text in given field, with strings expanded and LaTeX
+        converted. Unlike pretty_field, the text is not marked up.
+
+        Parameters
+        ----------
+        field: str
+
+        Returns
+        -------
+        str
+        """
+        if field not in self.entry:
+            return None
+        return latex_to_unicode(expand_pretty(self.entry[field]))
+
+    def names(self, field):
+        """
+        Split names in given field, usually "author" or "editor".
+
+        Parameters
+        ----------
+        field: str
+
+        Returns
+        -------
+        tuple of Name
+            First, von, last and jr part of each name, see names.py
+        """
+        if field not in self.entry:
+            return ()
+        return parse_names(expand_pretty(self.entry[field]))
+
     def raw_field(self, field):
         """
         Get raw text in given field.
@@ -294,12 +391,13 @@ class BadaBibItem:
         # Check if field contains strings, and if the number of defined strings
         # equals the number of all strings
         n_strings_expr = get_n_strings_expr(self.entry[field])
+        if n_strings_expr == 0:
+            # Plain text, no need to split it
+            return None
         n_strings_text = get_n_strings_text(self.raw_field(field), self.bibfile.database.strings)
-        if n_strings_expr > 0:
-            if n_strings_expr == n_strings_text:
-                return "defined"
-            return "undefined"
-        return None
+        if n_strings_expr == n_strings_text:
+            return "defined"
+        return "undefined"
 
     def last_name_list(self):
         """
@@ -312,30 +410,7 @@ class BadaBibItem:
         # Check that author field exists
         if "author" not in self.entry:
             return []
-
-        # Expand and prittify author field
-        value = expand_pretty(self.entry["author"])
-        value = latex_to_unicode(value)
-        value = prettify_unicode_field("author", value)
-        if not value:
-            return []
-
-        # remove line breaks and split names along "and"
-        clean_value = value.replace("\n", " ").replace("\\", "")
-        name_list = [name.strip() for name in clean_value.split(" and ")]
-        names = getnames(name_list)
-
-        # Extract last names, ignore if no last name is defined
-        last_name_list = []
-        for name in names:
-            try:
-                name_parts = splitname(name)["last"]
-                name_str = " ".join(name_parts)
-                last_name_list.append(name_str)
-            except InvalidName:
-                pass
-
-        return last_name_list
+        return last_names(expand_pretty(self.entry["author"]))
 
     def lowercase_last_names(self):
         """
@@ -364,6 +439,9 @@ class BadaBibItem:
         update_bibtex: bool
             If True, regenerate the raw BibTeX source
         """
+        if field == "ENTRYTYPE":
+            old_entrytype = self.entrytype
+
         # Case: BibTeX key is changed
         if field == "ID":
             # BibTeX key field is not allowed to contain strings
@@ -381,7 +459,7 @@ class BadaBibItem:
             if isinstance(value, str) and get_n_strings_text(value, database.strings):
                 self.entry[field] = text_to_expression(value, database)
             else:
-                self.entry[field] = value
+                self.entry[field] = intern_value(field, value)
         # Case: Value is empty -> remove field from entry
         elif field in self.entry:
             self.entry.pop(field)
@@ -390,6 +468,13 @@ class BadaBibItem:
         if field in sort_fields:
             self.update_sort_value(field)
 
+        # Update entry type counters of file
+        if field == "ENTRYTYPE":
+            self.count_entrytype(old_entrytype)
+
+        self.version += 1
+        self.bibfile.mark_modified(self.idx)
+
         # Update BibTeX source
         if update_bibtex:
             self.update_bibtex()
@@ -413,22 +498,37 @@ class BadaBibItem:
             If True, update BibTeX source. This is typically not required since
             the user directly modified the source already.
         """
-        self.bibfile.database.entries[self.idx] = entry
+        old_entrytype = self.entrytype
+        self.bibfile.database.entries[self.idx] = self.bibfile.pack_entry(entry)
+        self.count_entrytype(old_entrytype)
+        self.version += 1
+        self.bibfile.mark_modified(self.idx)
         self.update_all_sort_values()
         if update_bibtex:
             self.update_bibtex()
 
+    def count_entrytype(self, old_entrytype):
+        """
+        Move this entry from the counter of its old entry type to the counter
+        of its current one.
+
+        Parameters
+        ----------
+        old_entrytype: str
+        """
+        entrytype = self.entrytype
+        if entrytype != old_entrytype and not self.deleted:
+            self.bibfile.count_item(old_entrytype, -1)
+            self.bibfile.count_item(entrytype, 1)
+
     def update_bibtex(self):
-        """Regenerate BibTeX source for entry."""
-        writer = self.bibfile.writer
-        # Align fields along '=' if setting is active
-        if writer.align_values:
-            writer._max_field_width = self.max_field_width
-        self.bibtex = writer._entry_to_bibtex(self.entry)
+        """Discard BibTeX source of entry, it is regenerated when next needed."""
+        self._bibtex = None
 
     def update_sort_value(self, field):
         """
-        Regenerate the sort key for a given field.
+        Regenerate the sort key for a given field and store it in the sort key
+        store of the file.
 
         Parameters
         ----------
@@ -437,10 +537,10 @@ class BadaBibItem:
         if field == "author":
             # Sort by lower case last names
             if "author" in self.entry:
-                self.sort_values["author"] = self.lowercase_last_names()
+                value = self.lowercase_last_names()
             else:
                 # Sort to end of list if auther is not defined
-                self.sort_values["author"] = MAX_CHAR
+                value = MAX_CHAR
         else:
             # If "journal" is not defiend, try "booktitle"
             if field == "journal" and "journal" not in self.entry:
@@ -453,19 +553,28 @@ class BadaBibItem:
 
             if _field_ in self.entry:
                 # If field exists, sort by lower case pretty value
-                value = expand_pretty(self.entry[_field_])
-                value = latex_to_unicode(value)
-                value = prettify_unicode_field(_field_, value).lower()
-                self.sort_values[field] = value
+                value = pretty_sort_value(_field_, self.entry[_field_])
             else:
                 # Sort to end of list otherwise
-                self.sort_values[field] = MAX_CHAR
+                value = MAX_CHAR
 
         # Catch existing but empty fields
-        if not self.sort_values[field]:
-            self.sort_values[field] = MAX_CHAR
+        if not value:
+            value = MAX_CHAR
+
+        self.bibfile.sort_keys.set(self.idx, field, value)
 
     def update_all_sort_values(self):
-        """Update sort key for all fields in itemlist sort menu."""
+        """
+        Update sort key for all fields in itemlist sort menu. Entries that were
+        not parsed yet are only sorted by key.
+        """
+        if not self.loaded:
+            sort_keys = self.bibfile.sort_keys
+            for field in sort_fields:
+                sort_keys.set(self.idx, field, MAX_CHAR)
+            sort_keys.set(self.idx, "ID", pretty_sort_value("ID", self.key) or MAX_CHAR)
+            return
+
         for field in sort_fields:
             self.update_sort_value(field)
@@ -16,13 +16,103 @@
 
 from time import time
 
+from sys import getsizeof
+
+from weakref import WeakSet
+
 from .config_manager import get_undo_delay
+from .config_manager import get_undo_memory
+from .config_manager import get_undo_steps
+
+from .instrumentation import register_stats
 
 
 # Changes that are of the same type and happen within a window of UNDO_DELAY
 # seconds are grouped into a single change
 UNDO_DELAY = get_undo_delay()
 
+# Budget of each change buffer. The oldest changes are discarded once the
+# number of changes or their estimated size in bytes exceeds the budget.
+# Zero means unlimited.
+UNDO_STEPS = get_undo_steps()
+UNDO_MEMORY = get_undo_memory() * 1024 * 1024
+
+# Rough size of a change object without its payload
+CHANGE_OVERHEAD = 200
+
+# All change buffers, used to report the size of the undo history
+change_buffers = WeakSet()
+
+
+def value_size(value):
+    """
+    Estimate memory occupied by a field value.
+
+    Parameters
+    ----------
+    value: str, BibDataStringExpression or None
+
+    Returns
+    -------
+    int
+        Size in bytes
+    """
+    if value is None:
+        return 0
+    # Expressions consist of strings and BibDataStrings
+    return getsizeof(value) + sum(getsizeof(part) for part in getattr(value, "expr", ()))
+
+
+def entry_diff(old_entry, new_entry):
+    """
+    Compute per-field difference between two entries.
+
+    Parameters
+    ----------
+    old_entry, new_entry: dict
+
+    Returns
+    -------
+    diff: dict
+        {field: (old_value, new_value)} for all fields that differ. Missing
+        fields are represented by None.
+    """
+    diff = {}
+    for field in old_entry.keys() | new_entry.keys():
+        old_value = old_entry.get(field)
+        new_value = new_entry.get(field)
+        if old_value != new_value:
+            diff[field] = (old_value, new_value)
+    return diff
+
+
+def patch_entry(entry, diff, reverse=False):
+    """
+    Apply per-field difference to an entry.
+
+    Parameters
+    ----------
+    entry: dict
+        Entry the difference is applied to. Not modified.
+    diff: dict
+        Difference as returned by entry_diff
+    reverse: bool, optional
+        If True, restore the old values. The default value is False.
+
+    Returns
+    -------
+    patched: dict
+        Copy of entry with difference applied
+    """
+    patched = entry.copy()
+    for field, (old_value, new_value) in diff.items():
+        value = old_value if reverse else new_value
+        if value is None:
+            patched.pop(field, None)
+        else:
+            patched[field] = value
+    return patched
+
 
 class Change:
     """
@@ -35,7 +125,7 @@ class Change:
         """
         Helper class that defines shortcuts to some useful objects. You do not
         want to instantiate this class, but one of its subclasses: Edit, Show,
-        Hide and Replace.
+        Hide, Replace and Bulk.
         """
         @property
         def main_widget(self):
@@ -75,6 +165,10 @@ class Change:
             self.old_value = old_value
             self.new_value = new_value
 
+        def estimate_size(self):
+            """Estimate memory occupied by this change in bytes."""
+            return CHANGE_OVERHEAD + value_size(self.old_value) + value_size(self.new_value)
+
         def apply(self, redo=False):
             """
             Apply change to entry.
@@ -132,7 +226,11 @@ class Change:
             self.type = "show"
             self.item = items[0]    # Item that is highlighted after undo action
             self.form = None
-            self.items = items
+            self.items = tuple(items)
+
+        def estimate_size(self):
+            """Estimate memory occupied by this change in bytes."""
+            return CHANGE_OVERHEAD + getsizeof(self.items)
 
         def apply(self, redo=False):
             """Apply change, see Edit class for details on redo parameter."""
@@ -145,8 +243,7 @@ class Change:
 
             # Select all new/undeleted items
             self.bibfile.itemlist.unselect_all()
-            for item in self.items:
-                self.bibfile.itemlist.select_row(item.row)
+            self.bibfile.itemlist.select_items(self.items)
             self.main_widget.focus_on_current_item()
 
         def revert(self):
@@ -182,7 +279,8 @@ class Change:
         """
         def __init__(self, item, old_entry, new_entry):
             """
-            Initialize Replace.
+            Initialize Replace. Only the fields that differ between the two
+            entries are stored.
 
             Parameters
             ----------
@@ -192,13 +290,36 @@ class Change:
             """
             self.type = "replace"
             self.item = item
-            self.old_entry = old_entry
-            self.new_entry = new_entry
+            self.diff = entry_diff(old_entry, new_entry)
             self.form = None
 
+        def estimate_size(self):
+            """Estimate memory occupied by this change in bytes."""
+            size = CHANGE_OVERHEAD + getsizeof(self.diff)
+            for old_value, new_value in self.diff.values():
+                size += value_size(old_value) + value_size(new_value)
+            return size
+
+        def merge(self, change):
+            """
+            Combine with a subsequent replace of the same item.
+
+            Parameters
+            ----------
+            change: Change.Replace
+            """
+            for field, (old_value, new_value) in change.diff.items():
+                if field in self.diff:
+                    old_value = self.diff[field][0]
+                if old_value == new_value:
+                    self.diff.pop(field, None)
+                else:
+                    self.diff[field] = (old_value, new_value)
+
         def apply(self, redo=False):
             """Apply change. See Edit class for details on redo parameter."""
-            self.item.update_entry(self.new_entry, True)    # Update entry
+            new_entry = patch_entry(self.item.entry, self.diff)
+            self.item.update_entry(new_entry, True)         # Update entry
             self.item.row.update()                          # Update itemlist row
             self.editor.show_item(self.item)                # Show new item in editor
             if redo:
@@ -212,7 +333,8 @@ class Change:
         def revert(self):
             """Restore the previous entry."""
             # Update entry, editor, source view, selection and focus
-            self.item.update_entry(self.old_entry, True)
+            old_entry = patch_entry(self.item.entry, self.diff, reverse=True)
+            self.item.update_entry(old_entry, True)
             self.item.row.update()
             self.editor.show_item(self.item)
             self.source_view.update(self.item)
@@ -220,15 +342,88 @@ class Change:
             self.bibfile.itemlist.select_row(self.item.row)
             self.main_widget.focus_on_current_item()
 
+    class Bulk(Generic):
+        """
+        Change fields of many items at once, for example, by a bulk
+        transformation. Applied and reverted in a single step.
+        """
+        def __init__(self, edits):
+            """
+            Initialize Bulk.
+
+            Parameters
+            ----------
+            edits: list of tuple
+                (item, field, old value, new value) for each changed field.
+                A value of None indicates a missing field.
+            """
+            self.type = "bulk"
+            self.item = edits[0][0]     # Item that is highlighted after undo action
+            self.form = None
+            self.edits = tuple(edits)
+
+        def estimate_size(self):
+            """Estimate memory occupied by this change in bytes."""
+            size = CHANGE_OVERHEAD + getsizeof(self.edits)
+            for edit in self.edits:
+                size += getsizeof(edit) + value_size(edit[2]) + value_size(edit[3])
+            return size
+
+        @property
+        def fields(self):
+            """Dict {item: set of changed fields}"""
+            fields = {}
+            for item, field, _old_value, _new_value in self.edits:
+                fields.setdefault(item, set()).add(field)
+            return fields
+
+        def set_values(self, new):
+            """
+            Set all fields to their new or old values and update display.
+
+            Parameters
+            ----------
+            new: bool
+                True to apply new values, False to restore old ones
+            """
+            for item, field, old_value, new_value in self.edits:
+                item.update_field(field, new_value if new else old_value, False)
+
+            fields = self.fields
+            for item in fields:
+                item.update_bibtex()
+
+            # Rows are updated in batches, editor and source view only once
+            self.bibfile.itemlist.update_rows(fields)
+            current_item = self.main_widget.get_current_item()
+            if current_item in fields:
+                entrytype = current_item.raw_field("ENTRYTYPE")
+                self.main_widget.get_editor(entrytype).show_item(current_item)
+                self.source_view.update(current_item)
+
+        def apply(self, redo=False):
+            """Apply change. See Edit class for details on redo parameter."""
+            self.set_values(True)
+
+        def revert(self):
+            """Restore old values."""
+            self.set_values(False)
+
 
 class ChangeBuffer:
-    """Store, apply and revert changes."""
+    """
+    Store, apply and revert changes. The oldest changes are discarded once the
+    buffer exceeds UNDO_STEPS changes or UNDO_MEMORY bytes.
+    """
     def __init__(self):
         """Initialize Buffer."""
         self.buffer = [None]        # Indicate bottom of stack by None
         self.index = 0              # Index of last change
         self.saved_index = 0        # Index of last saved change
         self.last_save = time()     # Time of last save
+        self.size = 0               # Estimated size of all changes in bytes
+
+        change_buffers.add(self)
 
     def update_saved_state(self):
         """Make current change the last saved one."""
@@ -248,7 +443,29 @@ class ChangeBuffer:
 
         # Discard all changes after the current one
         for _ in range(n):
-            self.buffer.pop()
+            self.size -= self.buffer.pop().estimate_size()
+
+    def is_over_budget(self):
+        """Check if buffer holds more changes or bytes than allowed."""
+        n_changes = len(self.buffer) - 1
+        return (
+            (UNDO_STEPS and n_changes > UNDO_STEPS)
+            or (UNDO_MEMORY and self.size > UNDO_MEMORY)
+        )
+
+    def evict(self):
+        """
+        Discard oldest changes until the buffer is within budget. The most
+        recent change is always kept.
+        """
+        while self.index > 1 and self.is_over_budget():
+            self.size -= self.buffer.pop(1).estimate_size()
+            self.index -= 1
+            # Saved state cannot be reached anymore if it was the oldest one
+            if self.saved_index > 0:
+                self.saved_index -= 1
+            else:
+                self.saved_index = -1
 
     def add_change(self, change):
         """
@@ -261,6 +478,8 @@ class ChangeBuffer:
         self.truncate()
         self.buffer.append(change)
         self.index += 1
+        self.size += change.estimate_size()
+        self.evict()
 
     def push_change(self, change):
         """
@@ -281,20 +500,26 @@ class ChangeBuffer:
             and previous_change.item == change.item
             and time() - self.last_save < UNDO_DELAY
         ):
+            self.size -= previous_change.estimate_size()
             previous_change.new_value = change.new_value
+            self.size += previous_change.estimate_size()
         # Combine replace with previous replace, if possible
         elif (
             previous_change
             and previous_change.type == change.type == "replace"
+            and previous_change.item == change.item
             and time() - self.last_save < UNDO_DELAY
         ):
-            previous_change.new_entry = change.new_entry
+            self.size -= previous_change.estimate_size()
+            previous_change.merge(change)
+            self.size += previous_change.estimate_size()
         # Otherwise, add new change to buffer
         else:
             self.add_change(change)
 
         # Apply change, log time and indicate that the file has been modified
         change.apply()
+        change.bibfile.log_change(change)
         self.last_save = time()
         change.bibfile.set_unsaved(True)
 
@@ -305,6 +530,7 @@ class ChangeBuffer:
             self.index += 1
             change = self.buffer[self.index]
             change.apply(redo=True)
+            change.bibfile.log_change(change)
             # Check if applying the change brings us to a saved state
             change.bibfile.set_unsaved(self.index != self.saved_index)
             # Highlight form and grab focus
@@ -319,9 +545,22 @@ class ChangeBuffer:
         if change:
             self.index -= 1
             change.revert()
+            change.bibfile.log_change(change)
             # Check if applying the change brings us to a saved state
             change.bibfile.set_unsaved(self.index != self.saved_index)
             # Highlight form and grab focus
             if change.form:
                 change.form.select()
                 change.form.grab_focus()
+
+
+def get_history_stats():
+    """Size of the undo history of all open files."""
+    return {
+        "buffers": len(change_buffers),
+        "changes": sum(len(buffer.buffer) - 1 for buffer in change_buffers),
+        "bytes": sum(buffer.size for buffer in change_buffers),
+    }
+
+
+register_stats("undo history", get_history_stats)
@@ -0,0 +1,159 @@
+# clipboard.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from gi.repository import Gdk, Gio, GLib
+
+from bibtexparser.bibdatabase import BibDatabase
+
+from .entry_parser import bind_strings
+
+
+# Number of entries converted between checks for cancellation
+CANCEL_INTERVAL = 1000
+
+
+def entries_to_bibtex(entries, writer, cancellable=None):
+    """
+    Convert entries to BibTeX. Safe to run in a thread, if the writer is not
+    used anywhere else.
+
+    Parameters
+    ----------
+    entries: list of dict
+        Entries as parsed by bibtexparser
+    writer: BibTexWriter
+    cancellable: Gio.Cancellable, optional
+        Stop early if cancelled. The default value is None.
+
+    Returns
+    -------
+    str or None
+        BibTeX source of all entries, None if cancelled
+    """
+    texts = []
+    for n, entry in enumerate(entries):
+        if cancellable and n % CANCEL_INTERVAL == 0 and cancellable.is_cancelled():
+            return None
+        # Align fields along '=' if setting is active
+        if writer.align_values:
+            writer._max_field_width = max([len(field) for field in entry if field != "ENTRYTYPE"], default=0)
+        texts.append(writer._entry_to_bibtex(entry))
+    return "\n".join(texts)
+
+
+def bibtex_to_entries(text, parser, database):
+    """
+    Parse entries from BibTeX. Safe to run in a thread, if the parser is not
+    used anywhere else.
+
+    Parameters
+    ----------
+    text: str
+        BibTeX source
+    parser: BibTexParser
+    database: BibDatabase
+        Database of the file the entries are added to, strings of the
+        entries resolve with it
+
+    Returns
+    -------
+    list of dict
+        Entries as parsed by bibtexparser, empty if text is not BibTeX
+    """
+    parser.bib_database = BibDatabase()
+    try:
+        entries = parser.parse(text).entries
+    except (UnicodeDecodeError, ValueError):
+        return []
+    for entry in entries:
+        bind_strings(entry, database)
+    return entries
+
+
+def copy_to_clipboard(clipboard, entries, writer, callback=None):
+    """
+    Put entries on the clipboard as BibTeX. The text is generated in a
+    thread, so that copying many entries does not block.
+
+    Parameters
+    ----------
+    clipboard: Gdk.Clipboard
+    entries: list of dict
+        Entries as parsed by bibtexparser, not changed afterwards
+    writer: BibTexWriter
+        Writer used by this copy only
+    callback: function(), optional
+        Called on the main loop when the text is on the clipboard, but not if
+        the copy was cancelled. The default value is None.
+
+    Returns
+    -------
+    Gio.Cancellable
+        Cancel to drop the copy, for example when entries are copied again
+    """
+    def copy_thread(task, _obj, _data, cancellable):
+        task.return_value(entries_to_bibtex(entries, writer, cancellable))
+
+    def on_converted(_obj, task):
+        if cancellable.is_cancelled():
+            return
+        success, text = task.propagate_value()
+        if success and text is not None:
+            clipboard.set_content(Gdk.ContentProvider.new_for_value(text))
+        if callback:
+            callback()
+
+    cancellable = Gio.Cancellable()
+    task = Gio.Task.new(None, cancellable, on_converted)
+    task.run_in_thread(copy_thread)
+    return cancellable
+
+
+def paste_from_clipboard(clipboard, parser, database, callback):
+    """
+    Read BibTeX entries from the clipboard. The text is parsed in a thread.
+
+    Parameters
+    ----------
+    clipboard: Gdk.Clipboard
+    parser: BibTexParser
+        Parser used by this paste only
+    database: BibDatabase
+        Database of the file the entries are added to
+    callback: function(list of dict)
+        Called on the main loop with the entries, empty if the clipboard
+        does not contain BibTeX
+    """
+    def on_parsed(_obj, task):
+        success, entries = task.propagate_value()
+        callback(entries if success else [])
+
+    def on_text_read(clipboard, result):
+        try:
+            text = clipboard.read_text_finish(result)
+        except GLib.Error:
+            text = None
+        if not text or "@" not in text:
+            callback([])
+            return
+
+        def parse_thread(task, _obj, _data, _cancellable):
+            task.return_value(bibtex_to_entries(text, parser, database))
+
+        task = Gio.Task.new(None, None, on_parsed)
+        task.run_in_thread(parse_thread)
+
+    clipboard.read_text_async(None, on_text_read)
@@ -0,0 +1,173 @@
+# compact.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections.abc import MutableMapping
+
+from sys import intern
+
+
+# Fields whose values tend to repeat across entries. Their values are interned,
+# so that each distinct value is stored only once.
+REPEATED_FIELDS = {
+    "ENTRYTYPE",
+    "address",
+    "booktitle",
+    "edition",
+    "howpublished",
+    "institution",
+    "journal",
+    "language",
+    "month",
+    "organization",
+    "publisher",
+    "school",
+    "series",
+    "type",
+    "volume",
+    "year",
+}
+
+# Longer values are unlikely to repeat and are never interned
+MAX_INTERNED_LENGTH = 256
+
+
+def intern_value(field, value):
+    """
+    Intern value if it is likely shared by many entries.
+
+    Parameters
+    ----------
+    field: str
+    value: str or BibDataStringExpression
+
+    Returns
+    -------
+    str or BibDataStringExpression
+    """
+    if type(value) is str and field in REPEATED_FIELDS and len(value) <= MAX_INTERNED_LENGTH:
+        return intern(value)
+    return value
+
+
+def compact_entry(entry):
+    """
+    Intern field names and repeated values of an entry.
+
+    Parameters
+    ----------
+    entry: dict
+        bibtexparser entry
+
+    Returns
+    -------
+    dict
+        Entry with the same content, sharing strings with other entries
+    """
+    return {intern(field): intern_value(field, value) for field, value in entry.items()}
+
+
+class Layout:
+    """
+    Ordered field names shared by all packed entries with the same fields.
+    Obtain instances via get_layout, never directly.
+    """
+    __slots__ = ("fields", "index")
+
+    def __init__(self, fields):
+        self.fields = fields                                        # tuple of str
+        self.index = {field: n for n, field in enumerate(fields)}   # {field: position}
+
+
+layouts = {}    # {tuple of field names: Layout}
+
+
+def get_layout(fields):
+    """
+    Get shared layout for a sequence of field names.
+
+    Parameters
+    ----------
+    fields: tuple of str
+
+    Returns
+    -------
+    Layout
+    """
+    layout = layouts.get(fields)
+    if layout is None:
+        layout = Layout(tuple(intern(field) for field in fields))
+        layouts[layout.fields] = layout
+    return layout
+
+
+class PackedEntry(MutableMapping):
+    """
+    Drop-in replacement for a bibtexparser entry dict that stores its values
+    in a tuple. Field names and their order are stored once per layout rather
+    than once per entry. Reading is as cheap as a dict lookup, changing the
+    set of fields re-packs the entry.
+    """
+    __slots__ = ("layout", "values")
+
+    def __init__(self, entry=None):
+        """
+        Initialize PackedEntry.
+
+        Parameters
+        ----------
+        entry: dict or PackedEntry, optional
+            Entry to pack. The default value is None, an empty entry.
+        """
+        if entry is None:
+            entry = {}
+        self.layout = get_layout(tuple(entry))
+        self.values = tuple(intern_value(field, entry[field]) for field in self.layout.fields)
+
+    def __getitem__(self, field):
+        return self.values[self.layout.index[field]]
+
+    def __setitem__(self, field, value):
+        value = intern_value(field, value)
+        n = self.layout.index.get(field)
+        if n is None:
+            self.layout = get_layout(self.layout.fields + (field,))
+            self.values = self.values + (value,)
+        else:
+            self.values = self.values[:n] + (value,) + self.values[n+1:]
+
+    def __delitem__(self, field):
+        n = self.layout.index[field]
+        self.layout = get_layout(self.layout.fields[:n] + self.layout.fields[n+1:])
+        self.values = self.values[:n] + self.values[n+1:]
+
+    def __contains__(self, field):
+        return field in self.layout.index
+
+    def __iter__(self):
+        return iter(self.layout.fields)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f"PackedEntry({dict(self)!r})"
+
+    def copy(self):
+        """Shallow copy, like dict.copy"""
+        copy = PackedEntry.__new__(PackedEntry)
+        copy.layout = self.layout
+        copy.values = self.values
+        return copy
@@ -155,6 +155,33 @@ def set_align_fields(state):
     setting.set_boolean("align-fields", state)
 
 
+def get_backup_age_limit():
+    return setting.get_int("backup-age-limit")
+
+
+def set_backup_age_limit(n):
+    """n: int, days"""
+    setting.set_int("backup-age-limit", n)
+
+
+def get_backup_generations():
+    return setting.get_int("backup-generations")
+
+
+def set_backup_generations(n):
+    """n: int"""
+    setting.set_int("backup-generations", n)
+
+
+def get_backup_size_limit():
+    return setting.get_int("backup-size-limit")
+
+
+def set_backup_size_limit(n):
+    """n: int, MiB"""
+    setting.set_int("backup-size-limit", n)
+
+
 def get_create_backup():
     return setting.get_boolean("create-backup")
 
@@ -265,6 +292,15 @@ def set_homogenize_latex(state):
     return setting.set_boolean("homogenize-latex-encoding", state)
 
 
+def get_lazy_loading_threshold():
+    return setting.get_int("lazy-loading-threshold")
+
+
+def set_lazy_loading_threshold(n):
+    """n: int, MiB"""
+    setting.set_int("lazy-loading-threshold", n)
+
+
 def get_new_file_name():
     return setting.get_string("new-file-name")
 
@@ -305,6 +341,15 @@ def set_open_tab(filename):
     setting.set_string("open-tab", filename)
 
 
+def get_pack_entries():
+    return setting.get_boolean("pack-entries")
+
+
+def set_pack_entries(state):
+    """state: bool"""
+    setting.set_boolean("pack-entries", state)
+
+
 def get_parse_on_fly():
     return setting.get_boolean("parse-on-fly")
 
@@ -377,6 +422,24 @@ def set_undo_delay(d):
     setting.set_double("undo-delay", d)
 
 
+def get_undo_memory():
+    return setting.get_int("undo-memory")
+
+
+def set_undo_memory(n):
+    """n: int, MiB"""
+    setting.set_int("undo-memory", n)
+
+
+def get_undo_steps():
+    return setting.get_int("undo-steps")
+
+
+def set_undo_steps(n):
+    """n: int"""
+    setting.set_int("undo-steps", n)
+
+
 def get_window_geom():
     return setting.get_value("window-geom")
 
@@ -14,14 +14,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from bibtexparser.latexenc import latex_to_unicode
-from bibtexparser.latexenc import string_to_latex
+from functools import lru_cache
 
-from bibtexparser.customization import getnames
-from bibtexparser.customization import InvalidName
+from bibtexparser.latexenc import string_to_latex
 
 from .config_manager import get_title_case_n
 
+from .instrumentation import register_stats
+
+from .latex import convert_latex
+
+from .names import format_names
+
+
+# Number of distinct strings whose unicode conversion is kept. Journals,
+# publishers and names repeat across entries, so most conversions are hits.
+LATEX_CACHE_SIZE = 65536
+
 
 # Dashes potentially used in page ranges
 DASHES = ["-",      # minus
@@ -38,6 +47,46 @@ DASHES = ["-",      # minus
 # https://github.com/sciunto-org/python-bibtexparser/blob/master/bibtexparser/customization.py
 
 
+@lru_cache(maxsize=LATEX_CACHE_SIZE)
+def cached_latex_to_unicode(string):
+    """Convert LaTeX to unicode, cached. Use latex_to_unicode instead."""
+    return convert_latex(string)
+
+
+def latex_to_unicode(string):
+    """
+    Convert LaTeX to unicode, like latex_to_unicode of bibtexparser. Strings
+    without LaTeX are returned right away, other strings are converted once
+    and then served from a cache. Safe to run in a thread.
+
+    Parameters
+    ----------
+    string: str
+
+    Returns
+    -------
+    str
+    """
+    if "\\" not in string and "{" not in string and "}" not in string and string.isascii():
+        return string
+    return cached_latex_to_unicode(string)
+
+
+def get_latex_stats():
+    """Hit rate of the LaTeX conversion cache."""
+    info = cached_latex_to_unicode.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit rate": f"{info.hits / lookups:.1%}" if lookups else "-",
+        "cached strings": info.currsize,
+    }
+
+
+register_stats("latex conversion", get_latex_stats)
+
+
 def prettify_unicode_string(value):
     """
     Manually convert some LaTeX symbols to unicode.
@@ -74,24 +123,7 @@ def prettify_unicode_names(value):
     -------
     str
     """
-    # Catch empty input string
-    if not value:
-        return ""
-
-    # Use bibtexparser to extract names from input string
-    name_list = [name.strip() for name in value.split(" and ")]
-    try:
-        names = getnames(name_list)
-
-    # Leave string unchanged if it cannot be processed
-    except InvalidName:
-        return value
-
-    # Remove trailing commas
-    if names:
-        pretty_names = [name.rstrip(" ,") for name in names]
-        return " and ".join(pretty_names)
-    return ""
+    return format_names(value)
 
 
 def prettify_unicode_field(field, value):
@@ -129,13 +161,16 @@ def convert_to_latex(string, bibstrings=None):
     return string_to_latex(pretty_string)
 
 
-def title_case_word(word, bibstrings):
+def title_case_word(word, bibstrings, n=None):
     """
     Capitalize word if it contains more than n characters. Do not capitalize LaTeX
     strings/macros.
     """
+    if n is None:
+        n = get_title_case_n()
+
     # Check if word is too short or a LaTeX macro
-    if word.lower() in bibstrings or len(word) < get_title_case_n():
+    if word.lower() in bibstrings or len(word) < n:
         return word
 
     # Capitalize all parts of hyphenated words
@@ -168,7 +203,8 @@ def title_case(value, bibstrings):
     if not value:
         return None
     words = value.split(" ")
-    return " ".join(title_case_word(word, bibstrings) for word in words)
+    n = get_title_case_n()
+    return " ".join(title_case_word(word, bibstrings, n) for word in words)
 
 
 def upper_case(value, bibstrings):
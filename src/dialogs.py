@@ -16,7 +16,10 @@
 
 from platform import python_version
 
-from gi.repository import Gtk
+from time import localtime
+from time import strftime
+
+from gi.repository import Gtk, GLib
 
 
 def add_filters(dialog):
@@ -38,6 +41,36 @@ def add_filters(dialog):
     dialog.add_filter(filter_all)
 
 
+def add_import_filters(dialog, importers):
+    """
+    Add categories of importable formats to file chooser dialog.
+
+    Parameters
+    ----------
+    dialog: Gtk.FileChooserDialog
+    importers: list of type
+        Importer classes, see importers.py
+    """
+    filter_supported = Gtk.FileFilter()
+    filter_supported.set_name("All supported files")
+    for importer in importers:
+        for extension in importer.extensions:
+            filter_supported.add_pattern("*" + extension)
+    dialog.add_filter(filter_supported)
+
+    for importer in importers:
+        filter_format = Gtk.FileFilter()
+        filter_format.set_name(f"{importer.name} files")
+        for extension in importer.extensions:
+            filter_format.add_pattern("*" + extension)
+        dialog.add_filter(filter_format)
+
+    filter_all = Gtk.FileFilter()
+    filter_all.set_name("All files")
+    filter_all.add_pattern("*")
+    dialog.add_filter(filter_all)
+
+
 class WarningDialog(Gtk.MessageDialog):
     """
     A dialog that displays a warning message. The user can only acknowledge
@@ -97,6 +130,299 @@ class SaveChangesDialog(Gtk.MessageDialog):
         self.set_modal(True)
 
 
+class RecoverChangesDialog(Gtk.MessageDialog):
+    """
+    Offer to recover unsaved changes of a session that did not end properly.
+    """
+    def __init__(self, window, filenames):
+        """
+        window: Gtk.Window
+            Parent window of the dialog
+        filenames: list of str
+            Names of files with unsaved changes
+        """
+        text = (
+            "Bada Bib! did not shut down properly. "
+            + "The following files contain unsaved changes:"
+            + "\n\n"
+            + "\n".join(filenames)
+            + "\n\n"
+            + "Recover changes?"
+        )
+
+        super().__init__(
+            transient_for=window,
+            message_type=Gtk.MessageType.QUESTION,
+            buttons=Gtk.ButtonsType.NONE,
+            text=text,
+            title="Bada Bib! - Recover Changes",
+        )
+        self.add_buttons(
+            "Discard", Gtk.ResponseType.NO,
+            "Recover", Gtk.ResponseType.YES,
+        )
+        self.set_default_response(Gtk.ResponseType.YES)
+        self.set_modal(True)
+
+
+class RestoreBackupDialog(Gtk.Dialog):
+    """
+    Let user pick a backup generation to restore.
+    """
+    def __init__(self, window, filename, generations):
+        """
+        window: Gtk.Window
+            Parent window of the dialog
+        filename: str
+            Name of file to be restored
+        generations: list of dict
+            Available backups, most recent first
+        """
+        super().__init__(
+            transient_for=window,
+            title="Bada Bib! - Restore Backup",
+        )
+        self.add_buttons(
+            "Cancel", Gtk.ResponseType.CANCEL,
+            "Restore", Gtk.ResponseType.OK,
+        )
+        self.set_default_response(Gtk.ResponseType.OK)
+        self.set_modal(True)
+        self.set_default_size(400, 350)
+
+        label = Gtk.Label()
+        label.set_markup(
+            f"Restore a backup of '{GLib.markup_escape_text(filename)}'."
+            + "\n"
+            + "Unsaved changes to this file will be lost."
+        )
+        label.set_margin_top(12)
+        label.set_margin_bottom(12)
+
+        self.listbox = Gtk.ListBox()
+        for generation in generations:
+            row = Gtk.ListBoxRow()
+            row.digest = generation["digest"]
+            date = strftime("%Y-%m-%d %H:%M", localtime(generation["time"]))
+            size = GLib.format_size(generation["size"])
+            row_label = Gtk.Label(label=f"{date}    {size}", xalign=0)
+            row_label.set_margin_start(12)
+            row_label.set_margin_top(6)
+            row_label.set_margin_bottom(6)
+            row.set_child(row_label)
+            self.listbox.append(row)
+        self.listbox.select_row(self.listbox.get_row_at_index(0))
+
+        scrolled_window = Gtk.ScrolledWindow()
+        scrolled_window.set_vexpand(True)
+        scrolled_window.set_child(self.listbox)
+
+        content_area = self.get_content_area()
+        content_area.append(label)
+        content_area.append(scrolled_window)
+
+    def get_selected_digest(self):
+        """Digest of the selected generation, None if nothing is selected."""
+        row = self.listbox.get_selected_row()
+        if row:
+            return row.digest
+        return None
+
+
+class BulkTransformDialog(Gtk.Dialog):
+    """
+    Let user choose a transformation, a field and the entries to transform.
+    """
+    def __init__(self, window, transforms, has_selection):
+        """
+        window: Gtk.Window
+            Parent window of the dialog
+        transforms: list of str
+            Names of available transformations
+        has_selection: bool
+            True if entries are selected, False otherwise
+        """
+        super().__init__(
+            transient_for=window,
+            title="Bada Bib! - Transform Entries",
+        )
+        self.add_buttons(
+            "Cancel", Gtk.ResponseType.CANCEL,
+            "Transform", Gtk.ResponseType.OK,
+        )
+        self.set_default_response(Gtk.ResponseType.OK)
+        self.set_modal(True)
+        self.transforms = transforms
+
+        self.transform_dropdown = Gtk.DropDown.new_from_strings(transforms)
+        self.field_entry = Gtk.Entry(text="title")
+        self.field_entry.set_activates_default(True)
+
+        self.selected_button = Gtk.CheckButton(label="Selected entries")
+        self.all_button = Gtk.CheckButton(label="All entries of this file")
+        self.all_button.set_group(self.selected_button)
+        self.selected_button.set_sensitive(has_selection)
+        if has_selection:
+            self.selected_button.set_active(True)
+        else:
+            self.all_button.set_active(True)
+
+        grid = Gtk.Grid()
+        grid.set_row_spacing(6)
+        grid.set_column_spacing(12)
+        grid.set_margin_top(12)
+        grid.set_margin_bottom(12)
+        grid.set_margin_start(12)
+        grid.set_margin_end(12)
+        grid.attach(Gtk.Label(label="Transformation", xalign=0), 0, 0, 1, 1)
+        grid.attach(self.transform_dropdown, 1, 0, 1, 1)
+        grid.attach(Gtk.Label(label="Field", xalign=0), 0, 1, 1, 1)
+        grid.attach(self.field_entry, 1, 1, 1, 1)
+        grid.attach(self.selected_button, 1, 2, 1, 1)
+        grid.attach(self.all_button, 1, 3, 1, 1)
+
+        self.get_content_area().append(grid)
+
+    def get_choice(self):
+        """
+        Returns
+        -------
+        transform: str
+            Name of chosen transformation
+        field: str
+            Field to transform
+        selected_only: bool
+            True to transform selected entries, False to transform all
+        """
+        transform = self.transforms[self.transform_dropdown.get_selected()]
+        field = self.field_entry.get_text().strip().lower()
+        return transform, field, self.selected_button.get_active()
+
+
+class GenerateKeysDialog(Gtk.Dialog):
+    """
+    Let user choose the entries to generate keys for.
+    """
+    def __init__(self, window, has_selection):
+        """
+        window: Gtk.Window
+            Parent window of the dialog
+        has_selection: bool
+            True if entries are selected, False otherwise
+        """
+        super().__init__(
+            transient_for=window,
+            title="Bada Bib! - Generate Keys",
+        )
+        self.add_buttons(
+            "Cancel", Gtk.ResponseType.CANCEL,
+            "Generate", Gtk.ResponseType.OK,
+        )
+        self.set_default_response(Gtk.ResponseType.OK)
+        self.set_modal(True)
+
+        label = Gtk.Label(xalign=0)
+        label.set_text("Existing keys are replaced, and cross-references\nare updated to the new keys.")
+
+        self.selected_button = Gtk.CheckButton(label="Selected entries")
+        self.all_button = Gtk.CheckButton(label="All entries of this file")
+        self.all_button.set_group(self.selected_button)
+        self.selected_button.set_sensitive(has_selection)
+        if has_selection:
+            self.selected_button.set_active(True)
+        else:
+            self.all_button.set_active(True)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        box.set_margin_top(12)
+        box.set_margin_bottom(12)
+        box.set_margin_start(12)
+        box.set_margin_end(12)
+        box.append(label)
+        box.append(self.selected_button)
+        box.append(self.all_button)
+
+        self.get_content_area().append(box)
+
+    def get_choice(self):
+        """
+        Returns
+        -------
+        selected_only: bool
+            True to generate keys of selected entries, False for all
+        """
+        return self.selected_button.get_active()
+
+
+class ExportDialog(Gtk.Dialog):
+    """
+    Let user choose an export format and the entries to export.
+    """
+    def __init__(self, window, formats, has_selection):
+        """
+        window: Gtk.Window
+            Parent window of the dialog
+        formats: list of str
+            Names of available export formats
+        has_selection: bool
+            True if entries are selected, False otherwise
+        """
+        super().__init__(
+            transient_for=window,
+            title="Bada Bib! - Export Entries",
+        )
+        self.add_buttons(
+            "Cancel", Gtk.ResponseType.CANCEL,
+            "Export", Gtk.ResponseType.OK,
+        )
+        self.set_default_response(Gtk.ResponseType.OK)
+        self.set_modal(True)
+        self.formats = formats
+
+        self.format_dropdown = Gtk.DropDown.new_from_strings(formats)
+
+        self.selected_button = Gtk.CheckButton(label="Selected entries")
+        self.shown_button = Gtk.CheckButton(label="Entries shown in the list")
+        self.all_button = Gtk.CheckButton(label="All entries of this file")
+        self.shown_button.set_group(self.selected_button)
+        self.all_button.set_group(self.selected_button)
+        self.selected_button.set_sensitive(has_selection)
+        self.all_button.set_active(True)
+
+        grid = Gtk.Grid()
+        grid.set_row_spacing(6)
+        grid.set_column_spacing(12)
+        grid.set_margin_top(12)
+        grid.set_margin_bottom(12)
+        grid.set_margin_start(12)
+        grid.set_margin_end(12)
+        grid.attach(Gtk.Label(label="Format", xalign=0), 0, 0, 1, 1)
+        grid.attach(self.format_dropdown, 1, 0, 1, 1)
+        grid.attach(self.selected_button, 1, 1, 1, 1)
+        grid.attach(self.shown_button, 1, 2, 1, 1)
+        grid.attach(self.all_button, 1, 3, 1, 1)
+
+        self.get_content_area().append(grid)
+
+    def get_choice(self):
+        """
+        Returns
+        -------
+        export_format: str
+            Name of chosen format
+        scope: str
+            "selected", "shown" or "all"
+        """
+        export_format = self.formats[self.format_dropdown.get_selected()]
+        if self.selected_button.get_active():
+            scope = "selected"
+        elif self.shown_button.get_active():
+            scope = "shown"
+        else:
+            scope = "all"
+        return export_format, scope
+
+
 class ConfirmSaveDialog(Gtk.MessageDialog):
     """
     Confirm that user wants to save file, although it contains empty and/or
@@ -152,10 +478,13 @@ class FileChooser(Gtk.FileChooserDialog):
     """
     Customized file chooser.
     """
-    def __init__(self, window):
+    def __init__(self, window, importers=None):
         """
         window: Gtk.Window
             Parent window of the dialog
+        importers: list of type, optional
+            Offer the formats of these importers instead of BibTeX. The
+            default value is None.
         """
         super().__init__(
             title="Bada Bib! - Please choose a file",
@@ -167,19 +496,24 @@ class FileChooser(Gtk.FileChooserDialog):
         accept_button.get_style_context().add_class("suggested-action")
 
         self.set_select_multiple(True)  # Allow selecting multiple files
-        add_filters(self)
+        if importers:
+            add_import_filters(self, importers)
+        else:
+            add_filters(self)
 
 
 class SaveDialog(Gtk.FileChooserDialog):
     """
     Customized save dialog.
     """
-    def __init__(self, window, filename):
+    def __init__(self, window, filename, bibtex=True):
         """
         window: Gtk.Window
             Parent window of the dialog
         filename: str
             File to be saved
+        bibtex: bool, optional
+            Offer ".bib" and "all files" filters. The default value is True.
         """
         super().__init__(
             title="Bada Bib! - Please choose a file name",
@@ -191,7 +525,8 @@ class SaveDialog(Gtk.FileChooserDialog):
         accept_button.get_style_context().add_class("suggested-action")
 
         self.set_current_name(filename)  # Suggest name
-        add_filters(self)
+        if bibtex:
+            add_filters(self)
 
 
 class AboutDialog(Gtk.AboutDialog):
@@ -0,0 +1,101 @@
+# entry_parser.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from bibtexparser.bibdatabase import BibDatabase
+from bibtexparser.bibdatabase import BibDataString
+from bibtexparser.bibdatabase import BibDataStringExpression
+
+from .config_manager import get_homogenize_latex
+from .config_manager import get_homogenize_fields
+
+
+def bind_strings(entry, database):
+    """
+    Make all strings referenced in an entry resolve with the given database.
+
+    Parameters
+    ----------
+    entry: dict
+        bibtexparser entry, modified in place
+    database: BibDatabase
+        Database with string definitions
+    """
+    for value in entry.values():
+        if isinstance(value, BibDataStringExpression):
+            for part in value.expr:
+                if isinstance(part, BibDataString):
+                    part._bibdatabase = database
+
+
+class EntryParser:
+    """
+    Parse single BibTeX entries of a file, for example, while the user edits
+    the source of an entry. The parser is built once and reused. Strings are
+    not looked up while parsing, so the cost of parsing an entry does not
+    depend on the number of strings defined in the file or imported.
+    """
+    def __init__(self, bibfile):
+        """
+        Initialize EntryParser.
+
+        Parameters
+        ----------
+        bibfile: BadaBibFile
+            File whose strings are referenced by parsed entries
+        """
+        self.bibfile = bibfile
+        self.parser = None          # Reused bibtexparser parser
+        self.settings = None        # Parser settings the parser was built with
+
+    def get_parser(self):
+        """Get parser, rebuild it if the parser settings changed."""
+        settings = (get_homogenize_latex(), get_homogenize_fields())
+        if self.parser is None or settings != self.settings:
+            self.parser = self.bibfile.store.get_default_parser()
+            self.parser.expect_multiple_parse = True
+            self.settings = settings
+        return self.parser
+
+    def parse(self, bibtex):
+        """
+        Parse a single BibTeX entry.
+
+        Parameters
+        ----------
+        bibtex: str
+            Raw BibTeX entry
+
+        Returns
+        -------
+        dict or None
+            bibtexparser entry or None, if bibtex parameter is invalid
+        """
+        parser = self.get_parser()
+
+        # Parse into an empty database, so that entries do not accumulate
+        parser.bib_database = BibDatabase()
+        try:
+            database = parser.parse(bibtex)
+        except UnicodeDecodeError:
+            return None
+
+        # we expect a database with a single entry
+        if len(database.entries) != 1:
+            return None
+
+        entry = database.entries[0]
+        bind_strings(entry, self.bibfile.database)
+        return entry
@@ -0,0 +1,511 @@
+# exporters.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import csv
+import io
+import json
+import os
+import re
+
+from .config_manager import month_dict
+
+
+# Suffix of the temporary file an export is written to
+EXPORT_SUFFIX = ".exporting"
+
+# First number in a field
+NUMBER_PATTERN = re.compile(r"\d+")
+
+# Start and end of a page range
+PAGES_PATTERN = re.compile(r"\s*([^-–—\s]+)\s*(?:[-–—]+\s*([^-–—\s]+))?")
+
+# Registered exporters, {name: Exporter subclass}
+EXPORTERS = {}
+
+
+def register_exporter(cls):
+    """
+    Make an exporter available. Use as class decorator.
+
+    Parameters
+    ----------
+    cls: type
+        Subclass of Exporter
+
+    Returns
+    -------
+    type
+        The class, unchanged
+    """
+    EXPORTERS[cls.name] = cls
+    return cls
+
+
+def clean(value):
+    """Collapse white space of a plain field value."""
+    return " ".join(value.split())
+
+
+def month_number(value):
+    """
+    Convert month to its number.
+
+    Parameters
+    ----------
+    value: str
+        Number, month macro or month name
+
+    Returns
+    -------
+    int or None
+    """
+    value = value.strip().lower()
+    if value.isdigit() and 1 <= int(value) <= 12:
+        return int(value)
+    for n, (macro, name) in enumerate(month_dict.items(), 1):
+        if value in (macro, name.lower()):
+            return n
+    return None
+
+
+def split_pages(value):
+    """
+    Split page range.
+
+    Parameters
+    ----------
+    value: str
+
+    Returns
+    -------
+    tuple
+        (first page, last page), last page is None for single pages
+    """
+    match = PAGES_PATTERN.match(value)
+    if not match:
+        return value, None
+    return match.group(1), match.group(2)
+
+
+class Exporter:
+    """
+    Base class of exporters. An exporter converts one item at a time, so that
+    large files are written incrementally. Subclasses set 'name' and
+    'extension' and implement 'entry', and register with register_exporter.
+    """
+    name = ""
+    extension = ""
+    suffix = ""     # Added to the file name, so that the export is not saved over its source
+
+    def default_name(self, base_name):
+        """
+        Suggest a name for the exported file.
+
+        Parameters
+        ----------
+        base_name: str
+            File name of the exported file, without directory
+
+        Returns
+        -------
+        str
+        """
+        return os.path.splitext(base_name)[0] + self.suffix + self.extension
+
+    def __init__(self, bibfile):
+        """
+        Initialize Exporter.
+
+        Parameters
+        ----------
+        bibfile: BadaBibFile
+            File the exported items belong to
+        """
+        self.bibfile = bibfile
+
+    def header(self):
+        """Text before the first entry"""
+        return ""
+
+    def entry(self, item, n):
+        """
+        Convert an item.
+
+        Parameters
+        ----------
+        item: BadaBibItem
+        n: int
+            Number of items exported before this one
+
+        Returns
+        -------
+        str
+        """
+        raise NotImplementedError
+
+    def footer(self, n):
+        """Text after the last of n entries"""
+        return ""
+
+    def field(self, item, field):
+        """Plain text of a field, None if missing or empty"""
+        value = item.plain_field(field)
+        if value:
+            return clean(value)
+        return None
+
+    def year_month(self, item):
+        """Year and month as numbers, None if missing"""
+        year = self.field(item, "year") or self.field(item, "date") or ""
+        match = NUMBER_PATTERN.search(year)
+        year = int(match.group()) if match else None
+        month = self.field(item, "month")
+        return year, month_number(month) if month else None
+
+
+@register_exporter
+class CslJsonExporter(Exporter):
+    """CSL-JSON, as read by Pandoc and citeproc"""
+    name = "CSL-JSON"
+    extension = ".json"
+
+    # BibTeX entry types and their CSL types, "document" otherwise
+    TYPES = {
+        "article": "article-journal",
+        "book": "book",
+        "booklet": "pamphlet",
+        "conference": "paper-conference",
+        "inbook": "chapter",
+        "incollection": "chapter",
+        "inproceedings": "paper-conference",
+        "manual": "report",
+        "masterthesis": "thesis",
+        "mastersthesis": "thesis",
+        "misc": "document",
+        "online": "webpage",
+        "phdthesis": "thesis",
+        "proceedings": "book",
+        "techreport": "report",
+        "unpublished": "manuscript",
+    }
+
+    # BibTeX fields and their CSL variables
+    VARIABLES = {
+        "title": "title",
+        "journal": "container-title",
+        "booktitle": "container-title",
+        "series": "collection-title",
+        "volume": "volume",
+        "number": "issue",
+        "edition": "edition",
+        "chapter": "chapter-number",
+        "publisher": "publisher",
+        "organization": "publisher",
+        "institution": "publisher",
+        "school": "publisher",
+        "address": "publisher-place",
+        "doi": "DOI",
+        "url": "URL",
+        "note": "note",
+        "abstract": "abstract",
+        "keywords": "keyword",
+        "type": "genre",
+        "howpublished": "medium",
+    }
+
+    def header(self):
+        return "[\n"
+
+    def entry(self, item, n):
+        csl = {
+            "id": item.key,
+            "type": self.TYPES.get(item.entrytype.lower(), "document"),
+        }
+        for field in ("author", "editor"):
+            names = [self.csl_name(name) for name in item.names(field)]
+            if names:
+                csl[field] = names
+        for field, variable in self.VARIABLES.items():
+            value = self.field(item, field)
+            if value and variable not in csl:
+                csl[variable] = value
+        pages = self.field(item, "pages")
+        if pages:
+            csl["page"] = "-".join(page for page in split_pages(pages) if page)
+        year, month = self.year_month(item)
+        if year:
+            csl["issued"] = {"date-parts": [[year, month] if month else [year]]}
+
+        # One entry per line
+        text = "  " + json.dumps(csl, ensure_ascii=False)
+        if n:
+            return ",\n" + text
+        return text
+
+    def footer(self, n):
+        if n:
+            return "\n]\n"
+        return "]\n"
+
+    @staticmethod
+    def csl_name(name):
+        # Names without first name, such as organizations, are literal
+        if not name.first and not name.von:
+            return {"literal": name.last}
+        csl_name = {"family": name.last, "given": name.first}
+        if name.von:
+            csl_name["non-dropping-particle"] = name.von
+        if name.jr:
+            csl_name["suffix"] = name.jr
+        return csl_name
+
+
+@register_exporter
+class RisExporter(Exporter):
+    """RIS, as read by most reference managers"""
+    name = "RIS"
+    extension = ".ris"
+
+    # BibTeX entry types and their RIS types, "GEN" otherwise
+    TYPES = {
+        "article": "JOUR",
+        "book": "BOOK",
+        "booklet": "PAMP",
+        "conference": "CPAPER",
+        "inbook": "CHAP",
+        "incollection": "CHAP",
+        "inproceedings": "CPAPER",
+        "manual": "STAND",
+        "masterthesis": "THES",
+        "mastersthesis": "THES",
+        "misc": "GEN",
+        "online": "ELEC",
+        "phdthesis": "THES",
+        "proceedings": "CONF",
+        "techreport": "RPRT",
+        "unpublished": "UNPB",
+    }
+
+    # BibTeX fields and their RIS tags
+    TAGS = {
+        "title": "TI",
+        "journal": "JO",
+        "booktitle": "T2",
+        "series": "T3",
+        "volume": "VL",
+        "number": "IS",
+        "edition": "ET",
+        "publisher": "PB",
+        "school": "PB",
+        "institution": "PB",
+        "address": "CY",
+        "doi": "DO",
+        "url": "UR",
+        "note": "N1",
+        "abstract": "AB",
+    }
+
+    def entry(self, item, n):
+        lines = [
+            ("TY", self.TYPES.get(item.entrytype.lower(), "GEN")),
+            ("ID", item.key),
+        ]
+        for field, tag in (("author", "AU"), ("editor", "ED")):
+            for name in item.names(field):
+                lines.append((tag, self.ris_name(name)))
+        for field, tag in self.TAGS.items():
+            value = self.field(item, field)
+            if value:
+                lines.append((tag, value))
+        pages = self.field(item, "pages")
+        if pages:
+            first, last = split_pages(pages)
+            lines.append(("SP", first))
+            if last:
+                lines.append(("EP", last))
+        year, month = self.year_month(item)
+        if year:
+            lines.append(("PY", str(year)))
+            if month:
+                lines.append(("DA", f"{year}/{month:02d}"))
+        keywords = self.field(item, "keywords")
+        if keywords:
+            lines.extend(("KW", keyword.strip()) for keyword in keywords.split(",") if keyword.strip())
+        lines.append(("ER", ""))
+        return "".join(f"{tag}  - {value}\n" for tag, value in lines) + "\n"
+
+    @staticmethod
+    def ris_name(name):
+        last = " ".join(part for part in (name.von, name.last) if part)
+        return ", ".join(part for part in (last, name.first, name.jr) if part)
+
+
+@register_exporter
+class BibLatexExporter(Exporter):
+    """BibLaTeX, with fields and entry types renamed to their BibLaTeX names"""
+    name = "BibLaTeX"
+    extension = ".bib"
+    suffix = "-biblatex"
+
+    # BibTeX entry types and their BibLaTeX entry type and type field
+    TYPES = {
+        "conference": ("inproceedings", None),
+        "masterthesis": ("thesis", "mathesis"),
+        "mastersthesis": ("thesis", "mathesis"),
+        "phdthesis": ("thesis", "phdthesis"),
+        "techreport": ("report", "techreport"),
+    }
+
+    # BibTeX fields and their BibLaTeX names
+    FIELDS = {
+        "journal": "journaltitle",
+        "address": "location",
+        "school": "institution",
+        "annote": "annotation",
+    }
+
+    def __init__(self, bibfile):
+        super().__init__(bibfile)
+        # The writer of the file is shared with saving, use one of our own
+        self.writer = bibfile.store.get_default_writer()
+
+    def header(self):
+        # Values may refer to strings and preambles, write them first
+        preambles = self.writer._preambles_to_bibtex(self.bibfile.database).replace("\n\n", "\n")
+        strings = self.bibfile.strings_to_text()
+        return "".join(text + "\n\n" for text in (preambles.strip(), strings.strip()) if text)
+
+    def entry(self, item, n):
+        entry = {self.FIELDS.get(field, field): value for field, value in item.entry.items()}
+        entrytype, thesis_type = self.TYPES.get(item.entrytype.lower(), (item.entrytype, None))
+        entry["ENTRYTYPE"] = entrytype
+        if thesis_type and "type" not in entry:
+            entry["type"] = thesis_type
+
+        # Year and month are combined to an ISO date
+        year, month = self.year_month(item)
+        if year and "date" not in entry:
+            entry["date"] = f"{year:04d}-{month:02d}" if month else f"{year:04d}"
+            entry.pop("year", None)
+            if month:
+                entry.pop("month", None)
+
+        writer = self.writer
+        if writer.align_values:
+            writer._max_field_width = max(len(field) for field in entry)
+        text = writer._entry_to_bibtex(entry)
+        if n:
+            return "\n" + text
+        return text
+
+
+@register_exporter
+class CsvExporter(Exporter):
+    """Comma separated values, one row per entry"""
+    name = "CSV"
+    extension = ".csv"
+
+    # Columns, the key and entry type come first
+    COLUMNS = [
+        "author",
+        "editor",
+        "title",
+        "journal",
+        "booktitle",
+        "year",
+        "month",
+        "volume",
+        "number",
+        "pages",
+        "publisher",
+        "address",
+        "doi",
+        "url",
+        "note",
+    ]
+
+    def header(self):
+        return self.row(["key", "type"] + self.COLUMNS)
+
+    def entry(self, item, n):
+        values = [item.key, item.entrytype]
+        for field in self.COLUMNS:
+            values.append(self.field(item, field) or "")
+        return self.row(values)
+
+    @staticmethod
+    def row(values):
+        stream = io.StringIO()
+        csv.writer(stream).writerow(values)
+        return stream.getvalue()
+
+
+def export_items(exporter, items, stream):
+    """
+    Write items to a stream, one at a time.
+
+    Parameters
+    ----------
+    exporter: Exporter
+    items: iterable of BadaBibItem
+    stream: file object
+        Text stream opened for writing
+
+    Yields
+    ------
+    None
+        After each item, so that exports can run in time slices
+    """
+    stream.write(exporter.header())
+    n = 0
+    for item in items:
+        stream.write(exporter.entry(item, n))
+        n += 1
+        yield
+    stream.write(exporter.footer(n))
+
+
+def write_export(exporter, items, name):
+    """
+    Export items to a file. The export is written to a temporary file first,
+    which replaces the file only if the export completes. Closing the
+    generator early removes the temporary file.
+
+    Parameters
+    ----------
+    exporter: Exporter
+    items: iterable of BadaBibItem
+    name: str
+        Full path of the file
+
+    Yields
+    ------
+    None
+        After each item
+
+    Raises
+    ------
+    OSError
+        If the file cannot be written
+    """
+    temp_name = name + EXPORT_SUFFIX
+    try:
+        with open(temp_name, "w", encoding="utf-8", newline="") as stream:
+            yield from export_items(exporter, items, stream)
+        os.replace(temp_name, name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
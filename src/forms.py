@@ -165,6 +165,7 @@ class SingleLine(Gtk.Entry):
         self.field = field
         self.editor = editor
         self.change_case_counter = 0
+        self.icon_value = None      # (value, item version) the string icon was computed for
         self.set_icon(False)
         self.set_hexpand(True)
         self.set_enable_undo(False)
@@ -221,6 +222,13 @@ class SingleLine(Gtk.Entry):
         self.editor.track_changes = True
 
     def update_icon(self, item):
+        # The string status only changes with the value, or when strings are
+        # defined or deleted, which refreshes all items and bumps their version
+        value = item.entry.get(self.field)
+        if self.icon_value and value is self.icon_value[0] and item.version == self.icon_value[1]:
+            return
+        self.icon_value = (value, item.version)
+
         pos = Gtk.EntryIconPosition.SECONDARY
         string_status = item.bibstring_status(self.field)
         if string_status:
@@ -247,6 +255,7 @@ class SingleLine(Gtk.Entry):
     def clear(self):
         self.set_text("")
         self.set_icon(None)
+        self.icon_value = None
 
 
 class Box(Gtk.ComboBoxText):
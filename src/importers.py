@@ -0,0 +1,759 @@
+# importers.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import re
+
+from collections import deque
+from os.path import splitext
+from xml.etree.ElementTree import iterparse
+from xml.etree.ElementTree import ParseError
+
+from .exporters import month_number
+
+from .keys import base_key
+from .keys import unique_key
+
+from .names import last_names
+
+
+# Number of records read between checks for cancellation
+CANCEL_INTERVAL = 1000
+
+# Size of the chunks JSON is decoded from
+CHUNK_SIZE = 1 << 16
+
+# Characters that must be escaped in BibTeX values, and their escaped form
+SPECIAL_CHARACTERS = {
+    "\\": "\\textbackslash{}",
+    "&": "\\&",
+    "%": "\\%",
+    "#": "\\#",
+    "$": "\\$",
+    "_": "\\_",
+    "^": "\\^{}",
+    "~": "\\~{}",
+}
+SPECIAL_PATTERN = re.compile(r"[\\&%#$_^~]")
+
+# Characters that are not allowed in keys
+KEY_PATTERN = re.compile(r"[\s,{}()=#%\"'\\~]")
+
+# Year and the rest of a date
+DATE_PATTERN = re.compile(r"(\d{4})(?:[\s/.-]+([^\W_]+))?")
+
+# Fields whose values are copied verbatim
+VERBATIM_FIELDS = {"doi", "url"}
+
+# Extensions used by many formats, files with them are recognized by content only
+GENERIC_EXTENSIONS = {".txt"}
+
+# Registered importers, {name: Importer subclass}
+IMPORTERS = {}
+
+
+def register_importer(cls):
+    """
+    Make an importer available. Use as class decorator.
+
+    Parameters
+    ----------
+    cls: type
+        Subclass of Importer
+
+    Returns
+    -------
+    type
+        The class, unchanged
+    """
+    IMPORTERS[cls.name] = cls
+    return cls
+
+
+def escape(value):
+    """
+    Convert plain text to a BibTeX value. White space is collapsed, LaTeX
+    special characters are escaped, and unbalanced braces are removed.
+
+    Parameters
+    ----------
+    value: str
+
+    Returns
+    -------
+    str
+    """
+    value = " ".join(value.split())
+    if value.count("{") != value.count("}"):
+        value = value.replace("{", "").replace("}", "")
+    return SPECIAL_PATTERN.sub(lambda match: SPECIAL_CHARACTERS[match.group()], value)
+
+
+def clean_key(value):
+    """Remove characters from a key that BibTeX does not allow"""
+    return KEY_PATTERN.sub("", value)
+
+
+def make_keys_unique(entries, keys):
+    """
+    Generate keys for imported entries whose key is missing, a plain record
+    number or taken. Safe to run in a thread.
+
+    Parameters
+    ----------
+    entries: list of dict
+        Imported entries, keys are changed in place
+    keys: set of str
+        Keys of the file the entries are added to, not changed
+    """
+    taken = set(keys)
+    for entry in entries:
+        key = entry["ID"]
+        if not key or key.isdigit() or key in taken:
+            names = last_names(entry.get("author") or entry.get("editor") or "")
+            key = unique_key(base_key(names, entry["ENTRYTYPE"], entry.get("year")), taken)
+            entry["ID"] = key
+        taken.add(key)
+
+
+class Importer:
+    """
+    Base class of importers. An importer reads one record at a time and
+    converts it to an entry as parsed by bibtexparser, so that large files are
+    read incrementally. Subclasses set 'name' and 'extensions' and implement
+    'records', and register with register_importer.
+    """
+    name = ""
+    extensions = ()
+    binary = False      # Read stream as bytes instead of text
+
+    def records(self, stream):
+        """
+        Read entries from a stream.
+
+        Parameters
+        ----------
+        stream: file object
+
+        Yields
+        ------
+        dict
+            Entry with 'ENTRYTYPE', 'ID' and plain string fields
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def sniff(head):
+        """
+        Check if the beginning of a file is in this format.
+
+        Parameters
+        ----------
+        head: str
+            Beginning of the file, without leading white space
+
+        Returns
+        -------
+        bool
+        """
+        return False
+
+    @staticmethod
+    def new_entry(entrytype, key):
+        return {"ENTRYTYPE": entrytype, "ID": clean_key(key or "")}
+
+    @staticmethod
+    def set_field(entry, field, value):
+        """Set a field unless it is set already or the value is empty"""
+        if not value or field in entry:
+            return
+        value = value.strip() if field in VERBATIM_FIELDS else escape(value)
+        if value:
+            entry[field] = value
+
+    @staticmethod
+    def set_names(entry, field, names):
+        """Join names in 'last, first' order to a BibTeX name list"""
+        names = [" ".join(name.split()) for name in names]
+        names = [name if "," in name else "{" + name + "}" for name in names if name]
+        if names and field not in entry:
+            entry[field] = escape(" and ".join(names))
+
+    @staticmethod
+    def set_date(entry, date):
+        """Set year and month from a date such as '2020/03/15' or '2020 Mar'"""
+        match = DATE_PATTERN.search(date or "")
+        if not match:
+            return
+        entry.setdefault("year", match.group(1))
+        month = month_number(match.group(2)[:3]) if match.group(2) else None
+        if month:
+            entry.setdefault("month", str(month))
+
+    @staticmethod
+    def set_pages(entry, first, last):
+        """Set page range, abbreviated ranges such as '100-9' are expanded"""
+        first = (first or "").strip()
+        last = (last or "").strip()
+        if first.isdigit() and last.isdigit() and len(last) < len(first):
+            last = first[:len(first) - len(last)] + last
+        if first and last and last != first:
+            entry.setdefault("pages", f"{first}--{last}")
+        elif first:
+            entry.setdefault("pages", first)
+
+
+class TaggedImporter(Importer):
+    """
+    Base class of line based formats, in which each line starts with a tag
+    and continuation lines are indented.
+    """
+    # Tag and value of a line
+    LINE_PATTERN = None
+
+    # Blank lines separate records
+    blank_ends_record = False
+
+    def records(self, stream):
+        record = []
+        for line in stream:
+            line = line.rstrip("\r\n")
+            match = self.LINE_PATTERN.match(line)
+            if match:
+                tag, value = match.groups()
+                if self.is_end(tag):
+                    if record:
+                        yield self.convert(record)
+                    record = []
+                else:
+                    record.append([tag, value or ""])
+            elif not line.strip():
+                if record and self.blank_ends_record:
+                    yield self.convert(record)
+                    record = []
+            elif record:
+                # Continuation of the previous value
+                record[-1][1] += " " + line.strip()
+        if record:
+            yield self.convert(record)
+
+    def is_end(self, tag):
+        return False
+
+    def convert(self, record):
+        """
+        Convert record to entry.
+
+        Parameters
+        ----------
+        record: list of list
+            [tag, value] of each line, in file order
+
+        Returns
+        -------
+        dict
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def collect(record):
+        """Values of a record by tag, {tag: list of str}"""
+        values = {}
+        for tag, value in record:
+            values.setdefault(tag, []).append(value.strip())
+        return values
+
+    @staticmethod
+    def first(values, *tags):
+        """First non-empty value of the first tag found, None if missing"""
+        for tag in tags:
+            for value in values.get(tag, []):
+                if value:
+                    return value
+        return None
+
+
+@register_importer
+class RisImporter(TaggedImporter):
+    """RIS, as written by most reference managers"""
+    name = "RIS"
+    extensions = (".ris",)
+
+    LINE_PATTERN = re.compile(r"([A-Z][A-Z0-9])  -(?: (.*))?$")
+
+    # RIS types and their BibTeX entry types, "misc" otherwise
+    TYPES = {
+        "ABST": "article",
+        "BOOK": "book",
+        "CHAP": "incollection",
+        "CONF": "proceedings",
+        "CPAPER": "inproceedings",
+        "EBOOK": "book",
+        "ECHAP": "incollection",
+        "EDBOOK": "book",
+        "EJOUR": "article",
+        "ELEC": "online",
+        "INPR": "article",
+        "JFULL": "article",
+        "JOUR": "article",
+        "MGZN": "article",
+        "NEWS": "article",
+        "PAMP": "booklet",
+        "RPRT": "techreport",
+        "STAND": "manual",
+        "THES": "phdthesis",
+        "UNPB": "unpublished",
+    }
+
+    # RIS tags and their BibTeX fields, the first tag found wins
+    TAGS = {
+        "TI": "title",
+        "T1": "title",
+        "CT": "title",
+        "T3": "series",
+        "VL": "volume",
+        "IS": "number",
+        "ET": "edition",
+        "PB": "publisher",
+        "CY": "address",
+        "DO": "doi",
+        "UR": "url",
+        "N1": "note",
+        "AB": "abstract",
+        "N2": "abstract",
+    }
+
+    # Tags of the journal or book a work appeared in
+    CONTAINER_TAGS = ("T2", "JO", "JF", "JA", "J2", "BT")
+
+    def is_end(self, tag):
+        return tag == "ER"
+
+    @staticmethod
+    def sniff(head):
+        return head.startswith("TY  -")
+
+    def convert(self, record):
+        values = self.collect(record)
+
+        entrytype = self.TYPES.get((self.first(values, "TY") or "").upper(), "misc")
+        entry = self.new_entry(entrytype, self.first(values, "ID"))
+        self.set_names(entry, "author", values.get("AU", []) + values.get("A1", []))
+        self.set_names(entry, "editor", values.get("ED", []) + values.get("A2", []))
+        for tag, field in self.TAGS.items():
+            self.set_field(entry, field, self.first(values, tag))
+        container = self.first(values, *self.CONTAINER_TAGS)
+        if entrytype == "article":
+            self.set_field(entry, "journal", container)
+        elif entrytype in ("book", "booklet", "proceedings"):
+            self.set_field(entry, "series", container)
+        else:
+            self.set_field(entry, "booktitle", container)
+        if entrytype == "phdthesis":
+            self.set_field(entry, "school", entry.pop("publisher", None))
+        elif entrytype == "techreport":
+            self.set_field(entry, "institution", entry.pop("publisher", None))
+        self.set_pages(entry, self.first(values, "SP"), self.first(values, "EP"))
+        self.set_date(entry, self.first(values, "PY", "Y1", "DA"))
+        self.set_date(entry, self.first(values, "DA"))
+        self.set_field(entry, "issn" if entrytype == "article" else "isbn", self.first(values, "SN"))
+        keywords = [value for value in values.get("KW", []) if value]
+        self.set_field(entry, "keywords", ", ".join(keywords))
+        return entry
+
+
+@register_importer
+class CslJsonImporter(Importer):
+    """CSL-JSON, as written by Zotero, Pandoc and citeproc"""
+    name = "CSL-JSON"
+    extensions = (".json",)
+
+    # CSL types and their BibTeX entry types, "misc" otherwise
+    TYPES = {
+        "article": "article",
+        "article-journal": "article",
+        "article-magazine": "article",
+        "article-newspaper": "article",
+        "book": "book",
+        "chapter": "incollection",
+        "manuscript": "unpublished",
+        "pamphlet": "booklet",
+        "paper-conference": "inproceedings",
+        "report": "techreport",
+        "thesis": "phdthesis",
+        "webpage": "online",
+    }
+
+    # CSL variables and their BibTeX fields
+    VARIABLES = {
+        "title": "title",
+        "collection-title": "series",
+        "volume": "volume",
+        "issue": "number",
+        "edition": "edition",
+        "chapter-number": "chapter",
+        "publisher": "publisher",
+        "publisher-place": "address",
+        "DOI": "doi",
+        "URL": "url",
+        "note": "note",
+        "abstract": "abstract",
+        "keyword": "keywords",
+        "genre": "type",
+        "ISSN": "issn",
+        "ISBN": "isbn",
+    }
+
+    def records(self, stream):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        position = 0
+        started = False
+        done = False
+        while not done:
+            chunk = stream.read(CHUNK_SIZE)
+            buffer = buffer[position:] + chunk
+            position = 0
+            while True:
+                # Skip white space and separators between records
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position == len(buffer):
+                    break
+                if not started:
+                    started = True
+                    if buffer[position] == "[":
+                        position += 1
+                        continue
+                if buffer[position] == "]":
+                    done = True
+                    break
+                try:
+                    value, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Record continues in the next chunk
+                    if not chunk:
+                        raise
+                    break
+                if not isinstance(value, dict):
+                    raise ValueError("CSL-JSON records must be objects")
+                yield self.convert(value)
+            if not chunk:
+                break
+
+    @staticmethod
+    def sniff(head):
+        return head.startswith("[") or head.startswith("{")
+
+    def convert(self, csl):
+        entrytype = self.TYPES.get(csl.get("type"), "misc")
+        entry = self.new_entry(entrytype, str(csl.get("id", "")))
+        for field in ("author", "editor"):
+            names = csl.get(field)
+            if isinstance(names, list):
+                self.set_names(entry, field, [self.bibtex_name(name) for name in names if isinstance(name, dict)])
+        container = self.text(csl.get("container-title"))
+        if entrytype == "article":
+            self.set_field(entry, "journal", container)
+        else:
+            self.set_field(entry, "booktitle", container)
+        for variable, field in self.VARIABLES.items():
+            self.set_field(entry, field, self.text(csl.get(variable)))
+        if entrytype == "phdthesis":
+            self.set_field(entry, "school", entry.pop("publisher", None))
+        elif entrytype == "techreport":
+            self.set_field(entry, "institution", entry.pop("publisher", None))
+        page = self.text(csl.get("page"))
+        if page:
+            first, _, last = page.partition("-")
+            self.set_pages(entry, first, last)
+        self.set_issued(entry, csl.get("issued"))
+        return entry
+
+    @staticmethod
+    def text(value):
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is None:
+            return None
+        return str(value)
+
+    @staticmethod
+    def bibtex_name(name):
+        if "literal" in name:
+            return str(name["literal"])
+        last = " ".join(str(name[part]) for part in ("non-dropping-particle", "family") if name.get(part))
+        first = " ".join(str(name[part]) for part in ("given", "dropping-particle") if name.get(part))
+        suffix = str(name.get("suffix") or "")
+        if not last:
+            return first
+        return ", ".join(part for part in (last, suffix, first) if part)
+
+    def set_issued(self, entry, issued):
+        if not isinstance(issued, dict):
+            return
+        parts = issued.get("date-parts")
+        if parts and isinstance(parts[0], list) and parts[0]:
+            parts = parts[0]
+            entry.setdefault("year", str(parts[0]))
+            if len(parts) > 1 and month_number(str(parts[1])):
+                entry.setdefault("month", str(month_number(str(parts[1]))))
+        elif issued.get("raw") or issued.get("literal"):
+            self.set_date(entry, str(issued.get("raw") or issued.get("literal")))
+
+
+@register_importer
+class EndNoteXmlImporter(Importer):
+    """EndNote XML, as exported by EndNote"""
+    name = "EndNote XML"
+    extensions = (".xml",)
+    binary = True
+
+    # EndNote reference types and their BibTeX entry types, "misc" otherwise
+    TYPES = {
+        "book": "book",
+        "book section": "incollection",
+        "conference paper": "inproceedings",
+        "conference proceedings": "inproceedings",
+        "edited book": "book",
+        "electronic article": "article",
+        "electronic book": "book",
+        "journal article": "article",
+        "magazine article": "article",
+        "manuscript": "unpublished",
+        "newspaper article": "article",
+        "pamphlet": "booklet",
+        "report": "techreport",
+        "standard": "manual",
+        "thesis": "phdthesis",
+        "unpublished work": "unpublished",
+        "web page": "online",
+    }
+
+    # Paths of EndNote elements and their BibTeX fields
+    PATHS = {
+        "titles/title": "title",
+        "titles/tertiary-title": "series",
+        "volume": "volume",
+        "number": "number",
+        "edition": "edition",
+        "publisher": "publisher",
+        "pub-location": "address",
+        "electronic-resource-num": "doi",
+        "urls/related-urls/url": "url",
+        "notes": "note",
+        "abstract": "abstract",
+        "isbn": "isbn",
+        "pages": "pages",
+    }
+
+    def records(self, stream):
+        for _event, element in iterparse(stream):
+            if element.tag == "record":
+                yield self.convert(element)
+                # Free the record, the file is read incrementally
+                element.clear()
+
+    @staticmethod
+    def sniff(head):
+        return head.startswith("<?xml") or head.startswith("<xml")
+
+    def convert(self, record):
+        elements = self.collect(record)
+        ref_type = record.find("ref-type")
+        name = ref_type.get("name", "") if ref_type is not None else ""
+        entrytype = self.TYPES.get(name.lower(), "misc")
+        entry = self.new_entry(entrytype, self.text(elements, "label") or self.text(elements, "rec-number"))
+        self.set_names(entry, "author", self.texts(elements, "contributors/authors/author"))
+        self.set_names(entry, "editor", self.texts(elements, "contributors/secondary-authors/author"))
+        container = self.text(elements, "titles/secondary-title") or self.text(elements, "periodical/full-title")
+        if entrytype == "article":
+            self.set_field(entry, "journal", container)
+        else:
+            self.set_field(entry, "booktitle", container)
+        for path, field in self.PATHS.items():
+            self.set_field(entry, field, self.text(elements, path))
+        if "pages" in entry:
+            first, _, last = entry.pop("pages").partition("-")
+            self.set_pages(entry, first, last)
+        if entrytype == "phdthesis":
+            self.set_field(entry, "school", entry.pop("publisher", None))
+        elif entrytype == "techreport":
+            self.set_field(entry, "institution", entry.pop("publisher", None))
+        self.set_date(entry, self.text(elements, "dates/year"))
+        self.set_date(entry, self.text(elements, "dates/pub-dates/date"))
+        self.set_field(entry, "keywords", ", ".join(self.texts(elements, "keywords/keyword")))
+        return entry
+
+    @staticmethod
+    def collect(record):
+        """Elements of a record by path, {path: list of Element} in file order"""
+        elements = {}
+        queue = deque([(record, "")])
+        while queue:
+            parent, prefix = queue.popleft()
+            for element in parent:
+                path = prefix + element.tag
+                elements.setdefault(path, []).append(element)
+                queue.append((element, path + "/"))
+        return elements
+
+    @staticmethod
+    def texts(elements, path):
+        """Text of all elements at path, including styled text"""
+        return ["".join(element.itertext()).strip() for element in elements.get(path, [])]
+
+    @classmethod
+    def text(cls, elements, path):
+        """Text of the first element at path, None if missing"""
+        for text in cls.texts(elements, path):
+            if text:
+                return text
+        return None
+
+
+@register_importer
+class MedlineImporter(TaggedImporter):
+    """PubMed MEDLINE, as exported by PubMed and read by most reference managers"""
+    name = "PubMed MEDLINE"
+    extensions = (".nbib", ".medline", ".txt")
+
+    LINE_PATTERN = re.compile(r"([A-Z][A-Z0-9]{0,3}) *- (.*)$")
+    blank_ends_record = True
+
+    # Identifier of a DOI in 'LID' and 'AID' lines
+    DOI_SUFFIX = " [doi]"
+
+    @staticmethod
+    def sniff(head):
+        return head.startswith("PMID-")
+
+    def convert(self, record):
+        values = self.collect(record)
+
+        pmid = self.first(values, "PMID")
+        is_book = "BTI" in values and "JT" not in values
+        entry = self.new_entry("book" if is_book else "article", "pmid" + pmid if pmid else "")
+        self.set_names(entry, "author", values.get("FAU") or [self.full_name(name) for name in values.get("AU", [])])
+        self.set_names(entry, "editor", values.get("FED") or [self.full_name(name) for name in values.get("ED", [])])
+        self.set_field(entry, "title", self.first(values, "TI", "BTI"))
+        self.set_field(entry, "journal", self.first(values, "JT", "TA"))
+        self.set_field(entry, "volume", self.first(values, "VI"))
+        self.set_field(entry, "number", self.first(values, "IP"))
+        self.set_field(entry, "publisher", self.first(values, "PB"))
+        self.set_field(entry, "address", self.first(values, "PL"))
+        self.set_field(entry, "abstract", self.first(values, "AB"))
+        self.set_field(entry, "issn", self.first(values, "IS"))
+        for value in values.get("LID", []) + values.get("AID", []):
+            if value.endswith(self.DOI_SUFFIX):
+                self.set_field(entry, "doi", value[:-len(self.DOI_SUFFIX)])
+        pages = self.first(values, "PG")
+        if pages:
+            start, _, end = pages.partition("-")
+            self.set_pages(entry, start, end)
+        self.set_date(entry, self.first(values, "DP"))
+        self.set_field(entry, "keywords", ", ".join(values.get("OT", [])))
+        if pmid:
+            self.set_field(entry, "pmid", pmid)
+        return entry
+
+    @staticmethod
+    def full_name(name):
+        # Short names are 'last initials', such as 'Smith JA'
+        last, _, initials = name.rpartition(" ")
+        if not last:
+            return initials
+        return f"{last}, {initials}"
+
+
+def importer_for(name, head):
+    """
+    Find importer of a file by content, trying formats with its extension
+    first, and by extension otherwise. Files with a generic extension such as
+    '.txt' are only recognized by content.
+
+    Parameters
+    ----------
+    name: str
+        File name
+    head: str
+        Beginning of the file
+
+    Returns
+    -------
+    Importer or None
+    """
+    head = head.lstrip("﻿ \t\r\n")
+    extension = splitext(name)[1].lower()
+    candidates = [cls for cls in IMPORTERS.values() if extension in cls.extensions]
+    candidates += [cls for cls in IMPORTERS.values() if cls not in candidates]
+    for cls in candidates:
+        if cls.sniff(head):
+            return cls()
+    if extension in GENERIC_EXTENSIONS:
+        return None
+    for cls in candidates:
+        if extension in cls.extensions:
+            return cls()
+    return None
+
+
+def read_entries(name, cancellable=None):
+    """
+    Read all entries of a file in one of the registered formats. Safe to run
+    in a thread, as it does not touch files or items of the application.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the file
+    cancellable: Gio.Cancellable, optional
+        Stop early if cancelled. The default value is None.
+
+    Returns
+    -------
+    list of dict
+        Entries as parsed by bibtexparser, incomplete if cancelled
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read
+    ValueError
+        If the file is not in one of the formats or cannot be parsed
+    """
+    with open(name, encoding="utf-8-sig", errors="replace") as stream:
+        head = stream.read(1024)
+    importer = importer_for(name, head)
+    if importer is None:
+        raise ValueError(f"Unknown format of '{name}'")
+
+    entries = []
+    if importer.binary:
+        stream = open(name, "rb")
+    else:
+        stream = open(name, encoding="utf-8-sig", errors="replace")
+    with stream:
+        try:
+            for entry in importer.records(stream):
+                entries.append(entry)
+                if cancellable and len(entries) % CANCEL_INTERVAL == 0 and cancellable.is_cancelled():
+                    break
+        except ParseError as error:
+            raise ValueError(str(error)) from error
+    if not entries and not (cancellable and cancellable.is_cancelled()):
+        raise ValueError(f"No entries found in '{name}'")
+    return entries
@@ -0,0 +1,124 @@
+# instrumentation.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from contextlib import contextmanager
+
+from os import environ
+
+from time import perf_counter
+
+
+# Print statistics when the application shuts down
+STATS_ENABLED = "BADABIB_STATS" in environ
+
+# Print timings of imports and widget construction once the first frame is drawn
+PROFILE_STARTUP = "BADABIB_PROFILE_STARTUP" in environ
+
+# Startup timings are measured from the first import of this module
+startup_time = perf_counter()
+
+# List of (label, seconds) of profiled startup steps
+startup_steps = []
+
+# Dict {name: function}. Each function returns a dict of statistics.
+providers = {}
+
+
+def register_stats(name, provider):
+    """
+    Register a source of statistics.
+
+    Parameters
+    ----------
+    name: str
+        Name of the statistics group, for example, "undo history"
+    provider: function
+        Function without arguments that returns a dict {label: value}
+    """
+    providers[name] = provider
+
+
+def get_stats():
+    """
+    Collect statistics of all registered providers.
+
+    Returns
+    -------
+    dict
+        {name: {label: value}}
+    """
+    return {name: provider() for name, provider in providers.items()}
+
+
+def format_stats():
+    """
+    Format statistics of all registered providers.
+
+    Returns
+    -------
+    text: str
+    """
+    text = ""
+    for name, stats in get_stats().items():
+        text += f"{name}\n"
+        for label, value in stats.items():
+            text += f"    {label}: {value}\n"
+    return text
+
+
+def print_stats():
+    """Print statistics of all registered providers."""
+    print(format_stats(), end="")
+
+
+@contextmanager
+def profile_step(label):
+    """
+    Measure duration of a startup step, if the startup profile is enabled.
+
+    Parameters
+    ----------
+    label: str
+        Name of the step, for example, "import main widget"
+    """
+    if not PROFILE_STARTUP:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        startup_steps.append((label, perf_counter() - start))
+
+
+def format_startup_profile():
+    """
+    Format durations of all profiled startup steps.
+
+    Returns
+    -------
+    text: str
+    """
+    text = "startup\n"
+    for label, seconds in startup_steps:
+        text += f"    {label}: {seconds * 1000:.1f} ms\n"
+    text += f"    first frame: {(perf_counter() - startup_time) * 1000:.1f} ms\n"
+    return text
+
+
+def print_startup_profile():
+    """Print startup profile, see profile_step."""
+    print(format_startup_profile(), end="")
@@ -14,12 +14,20 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from gi.repository import Gtk, Gdk, Gio, Adw
+from gi.repository import Gtk, Gdk, Gio, GLib, Adw
+
+from array import array
 
 from os.path import split
 
 from .change import ChangeBuffer
 
+from .position_index import PositionIndex
+from .scheduler import scheduler
+
+from .query import Query
+from .query import TypeClause
+
 from .config_manager import entrytype_dict
 from .config_manager import link_fields
 from .config_manager import get_row_indent
@@ -29,9 +37,23 @@ row_indent = get_row_indent() * " "
 
 entrytypes = list(entrytype_dict.keys()) + ["other"]
 
-MIN_MAX_CHAR = ('', chr(0x10FFFF))
 ROW_HEIGHT = 95
 
+# Number of rows updated per main loop iteration when many items change
+ROW_UPDATE_BATCH = 250
+
+# Changed rows are re-sorted one by one if they are less than 1/16 of all rows
+REINSERT_RATIO = 16
+
+# Fields shown in each label of a row
+LABEL_SOURCES = {
+    "id": ("ID", "ENTRYTYPE"),
+    "author": ("author", "editor"),
+    "title": ("title",),
+    "journal": ("journal", "booktitle"),
+    "publisher": ("publisher", "year"),
+}
+
 
 class ItemlistTabView(Gtk.Box):
     def __init__(self):
@@ -73,16 +95,31 @@ class ItemlistPage(Gtk.Box):
         self.scrolled_window = None
         self.tabview_page = None
         self.number = -1
+        self.deferred = None    # (file name, state) of file not opened yet
 
         self.center_box = Gtk.CenterBox(orientation=Gtk.Orientation.VERTICAL)
         self.center_box.set_vexpand(True)
 
         self.deleted_bar = ItemlistInfoBar("File was deleted, renamed or moved.\nYou are now editing an unsaved copy.")
         self.empty_bar = ItemlistInfoBar("File does not contain any BibTeX entries.")
-        self.backup_bar = ItemlistInfoBar("<b>Bada Bib! was unable to create a backup file!</b>\nTry deleting or renaming any .bak-files that were not created by Bada Bib!")
+        self.backup_bar = ItemlistInfoBar("<b>Bada Bib! was unable to create a backup!</b>\nYou might be running out of disk space.")
         self.save_bar = ItemlistInfoBar("<b>File could not be saved!</b>\nYou might not have write permissions for this file or folder.")
         self.changed_bar = ItemlistChangedBar()
+        self.recovered_bar = ItemlistInfoBar("Unsaved changes from a previous session were recovered.")
+        self.recovery_failed_bar = ItemlistInfoBar("<b>Unsaved changes from a previous session could not be recovered!</b>\nThe file was modified since the changes were made.")
         self.searchbar = ItemlistSearchBar()
+        self.progress_bar = Gtk.ProgressBar()
+        self.progress_bar.set_hexpand(True)
+        self.progress_bar.set_valign(Gtk.Align.CENTER)
+        self.cancel_button = Gtk.Button.new_from_icon_name("process-stop-symbolic")
+        self.cancel_button.set_tooltip_text("Cancel")
+        self.cancel_button.get_style_context().add_class("flat")
+        self.cancel_button.connect("clicked", self.on_cancel_clicked)
+        self.on_cancel = None   # Called when the cancel button is clicked
+        self.progress_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.progress_box.append(self.progress_bar)
+        self.progress_box.append(self.cancel_button)
+        self.progress_box.set_visible(False)
 
         self.set_vexpand(True)
         self.set_hexpand(True)
@@ -99,11 +136,18 @@ class ItemlistPage(Gtk.Box):
         self.scrolled_window.set_vexpand(True)
         self.scrolled_window.set_child(itemlist)
 
+        vadjustment = self.scrolled_window.get_vadjustment()
+        vadjustment.connect("value-changed", self.itemlist.load_visible_rows)
+        vadjustment.connect("changed", self.itemlist.load_visible_rows)
+
         self.append(self.deleted_bar)
         self.append(self.empty_bar)
         self.append(self.backup_bar)
         self.append(self.save_bar)
         self.append(self.changed_bar)
+        self.append(self.recovered_bar)
+        self.append(self.recovery_failed_bar)
+        self.append(self.progress_box)
         self.append(self.scrolled_window)
         self.append(self.searchbar)
 
@@ -115,10 +159,32 @@ class ItemlistPage(Gtk.Box):
         self.remove(self.backup_bar)
         self.remove(self.save_bar)
         self.remove(self.changed_bar)
+        self.remove(self.recovered_bar)
+        self.remove(self.recovery_failed_bar)
+        self.remove(self.progress_box)
         self.remove(self.scrolled_window)
         self.remove(self.searchbar)
         self.itemlist = None
 
+    def show_progress(self, fraction):
+        self.progress_bar.set_fraction(fraction)
+        self.cancel_button.set_visible(self.on_cancel is not None)
+        self.progress_box.set_visible(True)
+
+    def hide_progress(self):
+        self.progress_box.set_visible(False)
+
+    def set_cancel(self, on_cancel):
+        # Offer to cancel the running operation, None to stop offering it
+        self.on_cancel = on_cancel
+        self.cancel_button.set_visible(on_cancel is not None)
+
+    def on_cancel_clicked(self, _button):
+        on_cancel = self.on_cancel
+        self.set_cancel(None)
+        if on_cancel:
+            on_cancel()
+
     def show_loading_screen(self):
         loading_image = Gtk.Image.new_from_icon_name("preferences-system-time-symbolic")
         loading_image.set_pixel_size(100)
@@ -221,9 +287,19 @@ class ItemlistSearchBar(Gtk.SearchBar):
     def __init__(self):
         super().__init__()
         self.search_entry = Gtk.SearchEntry()
-        self.set_child(self.search_entry)
+        self.count_label = Gtk.Label()
+        self.count_label.set_margin_start(10)
+        self.count_label.get_style_context().add_class("dim-label")
+
+        box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        box.append(self.search_entry)
+        box.append(self.count_label)
+        self.set_child(box)
         self.connect_entry(self.search_entry)
 
+    def show_count(self, n_visible, n_items):
+        self.count_label.set_text(f"Showing {n_visible} of {n_items}")
+
 
 class ItemlistToolbar(Gtk.CenterBox):
     def __init__(self):
@@ -273,6 +349,10 @@ class Row(Gtk.ListBoxRow):
         super().__init__()
         self.set_activatable(False)
         self.item = item
+        self.lazy = False
+        self.visible = True     # Result of the last filter evaluation
+        self.version = None     # Item version the labels were last updated for
+        self.sources = {}       # {label: field values the label was rendered from}
 
         self.id_label = Gtk.Label(xalign=0)
         self.author_label = Gtk.Label(xalign=0)
@@ -284,7 +364,7 @@ class Row(Gtk.ListBoxRow):
         self.link_image.set_margin_start(10)
 
         self.assemble()
-        self.update()
+        self.update(notify=False)
 
     def assemble(self):
         self.idbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
@@ -309,12 +389,43 @@ class Row(Gtk.ListBoxRow):
         self.vbox.remove(self.publisher_label)
         self.item = None
 
-    def update(self):
-        for field in ["ID", "author", "title", "journal", "publisher"]:
-            self.update_field(field)
-        self.update_link()
-
-    def update_field(self, field):
+    def update(self, notify=True, force=False):
+        # Rows of lazily loaded files only show the key until they are loaded
+        self.lazy = not self.item.loaded
+        if self.lazy:
+            self.update_id()
+        # Labels are only rebuilt if the item changed since the last update
+        elif force or self.version != self.item.version:
+            if force:
+                self.sources.clear()
+            self.version = self.item.version
+            for field in ["ID", "author", "title", "journal", "publisher"]:
+                self.update_field(field, notify=False)
+            self.update_link()
+        if notify:
+            self.changed()
+
+    def changed(self):
+        # Rows that move invalidate the position index of the itemlist, rows
+        # that are filtered change its count of visible rows
+        itemlist = self.get_parent()
+        index = self.get_index()
+        super().changed()
+        if itemlist:
+            if self.get_index() != index:
+                itemlist.positions.stale = True
+            itemlist.update_count()
+
+    def load(self, notify=True):
+        if self.lazy:
+            if not self.item.loaded:
+                self.item.bibfile.load_entry(self.item.idx)
+            self.update(notify)
+
+    def update_field(self, field, notify=True):
+        if self.lazy:
+            self.load(notify)
+            return
         if field in ["ID", "ENTRYTYPE"]:
             self.update_id()
         elif field in ["author", "editor"]:
@@ -327,16 +438,36 @@ class Row(Gtk.ListBoxRow):
             self.update_publisher()
         elif field in link_fields:
             self.update_link()
+            return
+        if notify:
+            self.changed()
+
+    def is_current(self, label):
+        # check if label was rendered from the current field values
+        entry = self.item.entry
+        values = tuple(entry.get(field) for field in LABEL_SOURCES[label])
+        cached = self.sources.get(label)
+        if cached and all(value is cached_value for value, cached_value in zip(values, cached)):
+            return True
+        self.sources[label] = values
+        return False
 
     def update_id(self):
         label = row_indent
+        if self.lazy:
+            label = f"""<b>{label + self.item.key}</b> ({self.item.entrytype})"""
+            self.id_label.set_markup(label)
+            return
+        if self.is_current("id"):
+            return
         if "ID" in self.item.entry:
             label += self.item.entry["ID"]
         label = f"""<b>{label}</b> ({self.item.pretty_field("ENTRYTYPE")})"""
         self.id_label.set_markup(label)
-        self.changed()
 
     def update_author(self):
+        if self.is_current("author"):
+            return
         label = row_indent
         if "author" in self.item.entry:
             label += self.item.pretty_field("author")
@@ -345,16 +476,18 @@ class Row(Gtk.ListBoxRow):
                 label += ", "
             label += f"""Ed: {self.item.pretty_field("editor")}"""
         self.author_label.set_markup(label)
-        self.changed()
 
     def update_title(self):
+        if self.is_current("title"):
+            return
         label = row_indent
         if "title" in self.item.entry:
             label += self.item.pretty_field("title")
         self.title_label.set_markup(label)
-        self.changed()
 
     def update_journal(self):
+        if self.is_current("journal"):
+            return
         label = row_indent
         if "journal" in self.item.entry:
             label += f"""<i>{self.item.pretty_field("journal")}</i>"""
@@ -363,9 +496,10 @@ class Row(Gtk.ListBoxRow):
                 label += ", "
             label += f"""<i>{self.item.pretty_field("booktitle")}</i>"""
         self.journal_label.set_markup(label)
-        self.changed()
 
     def update_publisher(self):
+        if self.is_current("publisher"):
+            return
         label = row_indent
         if "publisher" in self.item.entry:
             label += self.item.pretty_field("publisher")
@@ -374,7 +508,6 @@ class Row(Gtk.ListBoxRow):
                 label += ", "
             label += self.item.pretty_field("year")
         self.publisher_label.set_markup(label)
-        self.changed()
 
     def update_link(self):
         if set(link_fields) & set(self.item.entry.keys()):
@@ -395,6 +528,7 @@ class Itemlist(Gtk.ListBox):
 
         self.sort_key = "ID"
         self.sort_reverse = False
+        self.sort_relevance = False     # Sort by relevance while searching
         self.search_string = ""
         self.fltr = {entrytype: True for entrytype in entrytypes}
 
@@ -419,9 +553,30 @@ class Itemlist(Gtk.ListBox):
         else:
             self.change_buffer = ChangeBuffer()
 
-        self.add_rows(bibfile.items)
+        self.positions = PositionIndex()    # Visible position of rows
+        self.n_visible = 0                  # Number of rows shown
+        self.search_query = Query(self.search_string, self.type_filter())
+        self.filter_generation = 0          # Bumped when search or entry type filter change
+        self.filter_cache = bytearray()     # Visibility of each item, by item index
+        self.filter_stamps = array("q")     # Filter generation of cached visibility
+        self.filter_versions = array("q")   # Item version of cached visibility
+        self.filter_job = None              # Job computing visibility
+        self.build_job = None               # Job creating rows
+        self.refresh_job = None             # Job refreshing items and rows
+        self.sort_job = None                # Job parsing entries to sort lazily loaded files
+        self.selecting = False              # Rows are being selected by select_items
+        self.pending_row_updates = {}   # {item: fields} of rows to be updated
+        self.row_update_id = None       # Idle source updating rows
+
+        self.build_rows()
+        if not self.bibfile.has_sort_values(self.sort_key):
+            self.resort()
 
     def unref(self):
+        if self.row_update_id:
+            GLib.source_remove(self.row_update_id)
+            self.row_update_id = None
+        scheduler.cancel_jobs(self)
         while True:
             row = self.get_row_at_index(0)
             if not row:
@@ -452,23 +607,140 @@ class Itemlist(Gtk.ListBox):
             self.page.deleted_bar.set_revealed(False)
             self.change_buffer.update_saved_state()
 
+    def update_rows(self, fields):
+        """
+        Update rows of many items in batches while the main loop is idle.
+
+        Parameters
+        ----------
+        fields: dict
+            {item: iterable of changed fields}
+        """
+        for item, item_fields in fields.items():
+            self.pending_row_updates.setdefault(item, set()).update(item_fields)
+        if not self.row_update_id:
+            self.row_update_id = GLib.idle_add(self.on_update_rows_idle)
+
+    def on_update_rows_idle(self):
+        rows = []
+        for _ in range(ROW_UPDATE_BATCH):
+            if not self.pending_row_updates:
+                break
+            item, fields = self.pending_row_updates.popitem()
+            if item.row:
+                for field in fields:
+                    item.row.update_field(field, notify=False)
+                rows.append(item.row)
+        self.rows_changed(rows)
+
+        if self.pending_row_updates:
+            return GLib.SOURCE_CONTINUE
+        self.row_update_id = None
+        return GLib.SOURCE_REMOVE
+
+    def rows_changed(self, rows):
+        # Re-sorting and re-filtering a single row is cheaper than invalidating
+        # the whole list, unless a large part of the list changed
+        if len(rows) * REINSERT_RATIO < len(self.bibfile.items):
+            for row in rows:
+                row.changed()
+        elif rows:
+            self.invalidate_sort()
+            self.invalidate_filter()
+
     def add_row(self, item):
         row = Row(item)
+        self.positions.stale = True
+        # New rows are visible until filtered on insertion
+        self.n_visible += 1
         self.append(row)
         item.row = row
         return row
 
-    def add_rows(self, items):
+    def add_rows(self, items, on_done=None):
+        # With on_done, rows are created in time slices and on_done is called
+        # once all of them exist
+        if on_done is None:
+            for item in items:
+                self.add_row(item)
+            return None
+        return self.run_job(self.add_rows_steps(items), len(items), on_done)
+
+    def build_rows(self):
+        # Rows of a new itemlist are created in time slices, items added in
+        # the meantime get their rows right away
+        items = list(self.bibfile.items)
+        self.build_job = self.run_job(self.add_rows_steps(items), len(items), self.on_rows_built)
+
+    def add_rows_steps(self, items):
         for item in items:
-            self.add_row(item)
+            if item.row is None:
+                self.add_row(item)
+            yield
+
+    def on_rows_built(self):
+        self.build_job = None
+        self.update_count()
+
+    def update_count(self):
+        if self.page:
+            self.page.searchbar.show_count(self.n_visible, self.bibfile.count_all())
+
+    def run_job(self, steps, total, on_done):
+        def on_job_done():
+            on_done()
+            self.hide_progress()
+        return scheduler.add(self, steps, total, self.show_progress, on_job_done)
+
+    def cancel_job(self, job):
+        scheduler.cancel(job)
+        self.hide_progress()
+
+    def hide_progress(self):
+        # Progress stays visible while other jobs of this itemlist run
+        if self.page and not any(job.owner is self for job in scheduler.jobs):
+            self.page.hide_progress()
+
+    def show_progress(self, fraction):
+        if self.page:
+            self.page.show_progress(fraction)
+
+    def load_visible_rows(self, adjustment):
+        if self.bibfile is None or not self.bibfile.lazy_index:
+            return
+        top = adjustment.get_value()
+        bottom = top + adjustment.get_page_size()
+        y = top
+        while y <= bottom:
+            row = self.get_row_at_y(int(y))
+            if not row:
+                break
+            row.load()
+            y = max(y + 1, row.get_allocation().y + row.get_height())
+
+    def get_positions(self):
+        # rebuild position index from the visibility of all rows, if necessary
+        if self.positions.stale:
+            bits = bytearray()
+            index = 0
+            while row := self.get_row_at_index(index):
+                bits.append(row.visible)
+                index += 1
+            self.positions.rebuild(bits)
+        return self.positions
+
+    def get_visible_position(self, row):
+        return self.get_positions().count_before(row.get_index())
 
     def get_next_row(self, row, increment):
-        while row:
-            index = row.get_index()
-            row = self.get_row_at_index(index + increment)
-            if row and self.filter(row):
-                return row
-        return None
+        positions = self.get_positions()
+        index = row.get_index()
+        # rank of the neighbour among visible rows
+        rank = positions.count_before(index) + (positions.bits[index] if increment > 0 else -1)
+        position = positions.find(rank)
+        if position is None:
+            return None
+        return self.get_row_at_index(position)
 
     def select_next_row(self, row):
         # get next row...
@@ -494,10 +766,7 @@ class Itemlist(Gtk.ListBox):
             if idx is None:
                 self.focus_idx = (self.focus_idx + 1) % len(items)
                 idx = self.focus_idx
-            row = items[idx].row
-            preceeding_rows = 0
-            while row := self.get_next_row(row, -1):
-                preceeding_rows += 1
+            preceeding_rows = self.get_visible_position(items[idx].row)
             self.get_adjustment().set_value(preceeding_rows * ROW_HEIGHT)
 
     def reselect_rows(self, rows=None, adj=None):
@@ -513,92 +782,168 @@ class Itemlist(Gtk.ListBox):
         if adj is not None:
             self.get_adjustment().set_value(adj)
 
+    def select_items(self, items):
+        # Listeners are notified once instead of once per row
+        self.selecting = True
+        try:
+            for item in items:
+                self.select_row(item.row)
+        finally:
+            self.selecting = False
+        self.emit("selected-rows-changed")
+
     def get_selected_items(self):
         return [row.item for row in self.get_selected_rows()]
 
-    def refresh(self):
+    def get_shown_items(self):
+        # items of visible rows, in list order
+        items = []
         index = 0
-        while True:
-            row = self.get_row_at_index(index)
-            if not row:
-                break
-            row.item.refresh()
-            row.update()
+        while row := self.get_row_at_index(index):
+            if row.visible:
+                items.append(row.item)
             index += 1
+        return items
+
+    def refresh(self):
+        # Refresh all items in time slices, then sort and filter once
+        scheduler.cancel(self.refresh_job)
+        items = list(self.bibfile.items)
+        self.refresh_job = self.run_job(self.refresh_steps(items), len(items), self.on_refreshed)
+
+    def refresh_steps(self, items):
+        for item in items:
+            item.refresh()
+            if item.row:
+                item.row.update(notify=False, force=True)
+            yield
+
+    def on_refreshed(self):
+        self.refresh_job = None
+        self.invalidate_sort()
+        self.invalidate_filter()
         self.reselect_rows()
 
     def set_search_string(self, search_entry):
         self.search_string = search_entry.get_text()
-        self.invalidate_filter()
+        self.update_filter()
 
     def sort_by_field(self, row1, row2):
-        items = (row1.item, row2.item)
-        values = [0, 0]
-
-        for n, item in enumerate(items):
-            # sort entries without ID to the top, irrespective of sort order
-            if item.entry["ID"]:
-                values[n] = item.sort_values[self.sort_key]
-            else:
-                values[n] = MIN_MAX_CHAR[self.sort_reverse]
-
-        # fall back to ID if ordering is ambigious
-        if values[0] == values[1] and values[0] not in MIN_MAX_CHAR:
-            values = [items[0].sort_values["ID"], items[1].sort_values["ID"]]
-
-        comp = 1 if values[0] >= values[1] else -1
-
-        if self.sort_reverse:
-            return -comp
-
-        return comp
+        if self.sort_relevance and self.search_query.words:
+            score1 = self.relevance(row1.item)
+            score2 = self.relevance(row2.item)
+            if score1 != score2:
+                return 1 if score1 < score2 else -1
+        return self.bibfile.sort_keys.compare(row1.item.idx, row2.item.idx, self.sort_key, self.sort_reverse)
+
+    def relevance(self, item):
+        return self.bibfile.search_index.score(item, self.search_query) or 0.0
+
+    def resort(self):
+        if self.sort_job:
+            self.cancel_job(self.sort_job)
+            self.sort_job = None
+        if not self.bibfile.has_sort_values(self.sort_key):
+            # entries not parsed yet sort last, parse them in time slices
+            # and sort again once all sort keys are known
+            self.sort_job = self.run_job(self.bibfile.load_steps(), self.bibfile.count_unloaded(), self.resort)
+            return
+        self.bibfile.sort_keys.order(self.sort_key, self.sort_reverse)
+        self.invalidate_sort()
 
     def filter_and_unselect(self, row):
         visible = self.filter(row)
         if row.is_selected() and not visible:
             self.unselect_row(row)
+        if visible != row.visible:
+            row.visible = visible
+            self.n_visible += 1 if visible else -1
+            if not self.positions.stale:
+                self.positions.set(row.get_index(), visible)
         return visible
 
+    def invalidate_sort(self):
+        self.positions.stale = True
+        super().invalidate_sort()
+
+    def invalidate_filter(self):
+        self.positions.stale = True
+        super().invalidate_filter()
+        self.update_count()
+
     def filter(self, row):
-        search = self.search_string.lower()
-        item = row.item
+        return self.is_visible(row.item)
+
+    def update_filter(self):
+        # Search string or entry type filter changed: start a new generation,
+        # compute visibility of all items in time slices, then filter rows once
+        self.filter_generation += 1
+        self.search_query = Query(self.search_string, self.type_filter())
+        scheduler.cancel(self.filter_job)
+        items = list(self.bibfile.items)
+        total = 2 * len(items) if self.search_query.needs_text_index() else len(items)
+        self.filter_job = self.run_job(self.filter_steps(items), total, self.on_filtered)
+
+    def type_filter(self):
+        # Entry type filter of the filter popover as a query clause
+        if all(self.fltr.values()):
+            return None
+        types = {entrytype for entrytype, active in self.fltr.items() if active}
+        return TypeClause(types, known=frozenset(entrytype_dict), other=self.fltr["other"])
+
+    def filter_steps(self, items):
+        # Index changed items, then evaluate the query for all of them at once
+        search_index = self.bibfile.search_index
+        if self.search_query.needs_text_index():
+            for item in items:
+                search_index.update(item)
+                yield
+        if self.search_query:
+            search_index.search(self.search_query)
+        for item in items:
+            self.is_visible(item)
+            yield
 
+    def on_filtered(self):
+        self.filter_job = None
+        if self.sort_relevance and self.search_query.words:
+            self.invalidate_sort()
+        self.invalidate_filter()
+        self.reselect_rows()
+
+    def is_visible(self, item):
         if item.deleted:
             return False
-        if item.entry["ENTRYTYPE"] not in self.fltr:
-            return self.fltr["other"]
-        if not self.fltr[item.entry["ENTRYTYPE"]]:
-            return False
-        if not item.entry["ID"]:
-            return True
 
-        # poor man's fuzzy search
-        phrases = search.split('"')
-        quoted = [False]
-        for phrase in phrases[1:]:
-            quoted.append(not quoted[-1])
-        if len(phrases) % 2 == 0:
-            quoted[-1] = False
-
-        for phrase, protected in filter(None, zip(phrases, quoted)):
-            if protected:
-                words = [phrase]
-            else:
-                words = phrase.split()
-            for word in words:
-                for field in item.entry:
-                    if word in item.raw_field(field).lower():
-                        break
-                    if word in item.pretty_field(field).lower():
-                        break
-                else:
-                    return False
-        return True
+        # Use cached visibility if filter and item did not change since
+        idx = item.idx
+        if idx >= len(self.filter_cache):
+            missing = idx + 1 - len(self.filter_cache)
+            self.filter_cache.extend(bytes(missing))
+            self.filter_stamps.extend([-1] * missing)
+            self.filter_versions.extend([-1] * missing)
+        if self.filter_stamps[idx] == self.filter_generation and self.filter_versions[idx] == item.version:
+            return bool(self.filter_cache[idx])
+
+        visible = self.match(item)
+        self.filter_cache[idx] = visible
+        self.filter_stamps[idx] = self.filter_generation
+        self.filter_versions[idx] = item.version
+        return visible
+
+    def match(self, item):
+        if not self.search_query:
+            return True
+        # Entries without key are only subject to the entry type filter
+        if not item.key:
+            return self.search_query.allows_type(item.entrytype)
+        return self.bibfile.search_index.score(item, self.search_query) is not None
 
     def state_to_string(self):
         string = f"{self.sort_key}|{self.sort_reverse}"
         for value in self.fltr.values():
             string += f"|{value}"
+        string += f"|{self.sort_relevance}"
         return string
 
     def string_to_state(self, text):
@@ -614,3 +959,5 @@ class Itemlist(Gtk.ListBox):
             else:
                 value = "True"
             self.fltr[entrytype] = value == "True"
+        if values:
+            self.sort_relevance = values.pop(0) == "True"
@@ -0,0 +1,365 @@
+# journal.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+
+from os import fsync
+from os import listdir
+from os import makedirs
+from os import remove
+from os import rename
+from os.path import join
+
+from hashlib import sha1
+
+from queue import Queue
+from queue import Empty
+
+from threading import Thread
+
+from time import monotonic
+
+from gi.repository import GLib
+
+from .watcher import get_signature
+
+
+# Journals of open files live here. Each journal is a JSON-lines file. The
+# first line identifies the file and its state on disk, all other lines are
+# records of applied changes.
+JOURNAL_DIR = join(GLib.get_user_data_dir(), "badabib", "journals")
+JOURNAL_SUFFIX = ".journal"
+RECOVERY_SUFFIX = ".recover"
+
+# Records arriving within this window (in seconds) share one fsync
+BATCH_WINDOW = 0.5
+
+# Record types
+HEADER = "f"    # ["f", file name, mtime, size]
+NEW = "n"       # ["n", position, {field: raw value}]
+FIELDS = "e"    # ["e", position, {field: raw value or None}]
+SHOW = "s"      # ["s", [positions]]
+HIDE = "h"      # ["h", [positions]]
+
+
+def get_journal_path(name):
+    """
+    Get path of the journal of a file.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+
+    Returns
+    -------
+    str
+    """
+    digest = sha1(name.encode("utf-8", "surrogateescape")).hexdigest()
+    return join(JOURNAL_DIR, digest + JOURNAL_SUFFIX)
+
+
+def read_journal(path):
+    """
+    Read journal.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    header: list or None
+        Header record, None if the journal cannot be read
+    records: list of list
+        All records following the header. A trailing, partially written
+        record is ignored.
+    """
+    header = None
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if header is None:
+                    header = record
+                else:
+                    records.append(record)
+    except OSError:
+        return None, []
+    if not header or header[0] != HEADER:
+        return None, []
+    return header, records
+
+
+def collect_journals():
+    """
+    Find journals left behind by a session that did not end properly and move
+    them aside, so that they are not overwritten by journals of this session.
+
+    Returns
+    -------
+    journals: dict
+        {file name: path of moved journal}
+    """
+    journals = {}
+    try:
+        filenames = listdir(JOURNAL_DIR)
+    except OSError:
+        return journals
+
+    for filename in filenames:
+        path = join(JOURNAL_DIR, filename)
+        if filename.endswith(JOURNAL_SUFFIX):
+            recovery_path = path[:-len(JOURNAL_SUFFIX)] + RECOVERY_SUFFIX
+            try:
+                rename(path, recovery_path)
+            except OSError:
+                continue
+            path = recovery_path
+        elif not filename.endswith(RECOVERY_SUFFIX):
+            continue
+
+        header, records = read_journal(path)
+        if header and records:
+            journals[header[1]] = path
+        else:
+            discard_journal(path)
+
+    return journals
+
+
+def discard_journal(path):
+    """Delete journal, ignore errors."""
+    try:
+        remove(path)
+    except OSError:
+        pass
+
+
+def replay_journal(bibfile, path):
+    """
+    Replay journal of a crashed session onto a freshly opened file.
+
+    Parameters
+    ----------
+    bibfile: BadaBibFile
+        File as read from disk
+    path: str
+        Path of the journal
+
+    Returns
+    -------
+    records: list of list
+        Replayed records. Empty if the journal does not match the file on
+        disk and cannot be replayed.
+    """
+    header, records = read_journal(path)
+    if not header or header[1] != bibfile.name:
+        return []
+    if get_signature(bibfile.name) != (header[2], header[3]):
+        return []
+
+    items = list(bibfile.items)     # Items by position
+    try:
+        for record in records:
+            if record[0] == NEW:
+                item = bibfile.append_item()
+                items.append(item)
+                fields = record[2]
+            elif record[0] == FIELDS:
+                item = items[record[1]]
+                fields = record[2]
+            else:
+                deleted = record[0] == HIDE
+                for position in record[1]:
+                    items[position].deleted = deleted
+                continue
+            for field, value in fields.items():
+                item.update_field(field, value or "", False)
+            item.update_bibtex()
+    except (IndexError, KeyError, TypeError):
+        return []
+
+    return records
+
+
+class Journal:
+    """
+    Append-only journal of the changes applied to a BadaBibFile since it was
+    last saved. Records are written by a thread, so logging a change costs
+    little more than putting a record in a queue. The journal file only
+    exists while the file contains unsaved changes.
+    """
+    def __init__(self, name, items, records=None):
+        """
+        Initialize Journal.
+
+        Parameters
+        ----------
+        name: str
+            Full path of the .bib file
+        items: list of BadaBibItem
+            Items in the order they appear in the file on disk
+        records: list of list, optional
+            Records to write right away, for example, records replayed from
+            a crashed session. The default value is None.
+        """
+        self.name = name
+        self.positions = {}         # {item index: position in file on disk}
+        self.n_positions = 0        # Number of known positions
+        self.queue = Queue()        # Commands for the writer thread
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        self.reset(name, items)
+        for record in records or []:
+            self.queue.put(("record", record))
+
+    def reset(self, name, items):
+        """
+        Start over, for example, after the file was saved.
+
+        Parameters
+        ----------
+        name: str
+            Full path of the .bib file
+        items: list of BadaBibItem
+            Items in the order they appear in the file on disk
+        """
+        self.name = name
+        self.positions = {item.idx: n for n, item in enumerate(items)}
+        self.n_positions = len(items)
+        signature = get_signature(name) or (0, 0)
+        header = [HEADER, name, *signature]
+        self.queue.put(("reset", (get_journal_path(name), header)))
+
+    def close(self):
+        """Stop writer thread and delete journal."""
+        self.queue.put(("close", None))
+        self.thread.join()
+
+    def position(self, item):
+        """
+        Get position of item, record item as new if it has none yet.
+
+        Parameters
+        ----------
+        item: BadaBibItem
+
+        Returns
+        -------
+        int
+        """
+        if item.idx not in self.positions:
+            self.positions[item.idx] = self.n_positions
+            entry = {field: item.raw_field(field) for field in item.entry}
+            self.queue.put(("record", [NEW, self.n_positions, entry]))
+            self.n_positions += 1
+        return self.positions[item.idx]
+
+    def log_fields(self, item, fields):
+        """
+        Record current values of some fields of an item.
+
+        Parameters
+        ----------
+        item: BadaBibItem
+        fields: iterable of str
+        """
+        position = self.position(item)
+        values = {field: item.raw_field(field) for field in fields}
+        self.queue.put(("record", [FIELDS, position, values]))
+
+    def log_visibility(self, items):
+        """
+        Record whether items are deleted or not.
+
+        Parameters
+        ----------
+        items: list of BadaBibItem
+        """
+        shown = [self.position(item) for item in items if not item.deleted]
+        hidden = [self.position(item) for item in items if item.deleted]
+        if shown:
+            self.queue.put(("record", [SHOW, shown]))
+        if hidden:
+            self.queue.put(("record", [HIDE, hidden]))
+
+    def log_change(self, change):
+        """
+        Record the effect of a change that was just applied or reverted.
+
+        Parameters
+        ----------
+        change: Change
+        """
+        if change.type == "edit":
+            self.log_fields(change.item, [change.form.field])
+        elif change.type == "replace":
+            self.log_fields(change.item, change.diff)
+        elif change.type == "show":
+            self.log_visibility(change.items)
+        elif change.type == "bulk":
+            for item, fields in change.fields.items():
+                self.log_fields(item, fields)
+
+    def run(self):
+        """Writer thread. Writes records in batches, one fsync per batch."""
+        path = None
+        header = None
+        file = None
+        closed = False
+
+        while not closed:
+            # Wait for a command, then collect all commands of the batch window
+            commands = [self.queue.get()]
+            deadline = monotonic() + BATCH_WINDOW
+            while commands[-1][0] != "close":
+                try:
+                    commands.append(self.queue.get(timeout=max(0, deadline - monotonic())))
+                except Empty:
+                    break
+
+            try:
+                for command, payload in commands:
+                    if command == "record":
+                        # Create journal file lazily with first record
+                        if file is None:
+                            makedirs(JOURNAL_DIR, exist_ok=True)
+                            file = open(path, "w", encoding="utf-8")
+                            file.write(json.dumps(header) + "\n")
+                        file.write(json.dumps(payload, separators=(",", ":")) + "\n")
+                    elif command in ("reset", "close"):
+                        if file is not None:
+                            file.close()
+                            file = None
+                        if path is not None:
+                            discard_journal(path)
+                        if command == "reset":
+                            path, header = payload
+                        else:
+                            closed = True
+                if file is not None:
+                    file.flush()
+                    fsync(file.fileno())
+            except OSError:
+                # Journaling is best effort, never interfere with editing
+                file = None
@@ -0,0 +1,274 @@
+# keys.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from gi.repository import Gio
+
+from itertools import count
+from itertools import product
+from string import ascii_lowercase
+from string import ascii_uppercase
+from unicodedata import normalize
+
+from .bibitem import expand_pretty
+
+from .customization import convert_to_unicode
+
+from .names import last_names
+
+
+# Number of keys computed between checks for cancellation
+CANCEL_INTERVAL = 1000
+
+
+def ascii_name(name):
+    """Convert name to capitalized ASCII"""
+    utf_name = convert_to_unicode(name)
+    ascii_name = normalize("NFKD", utf_name).encode("ascii", "ignore").decode("utf-8")
+    # Names such as '{World Health Organization}' are kept whole
+    ascii_name = "".join(ascii_name.split())
+    return ascii_name[:1].upper() + ascii_name[1:]
+
+
+def base_key(names, entrytype, year):
+    """
+    Key of an entry before suffixes are added to make it unique: last name of
+    the first author, or of both authors if there are exactly two, or the
+    entry type if there are no authors, followed by the year.
+
+    Parameters
+    ----------
+    names: list of str
+        Last names of the authors
+    entrytype: str
+    year: str or None
+
+    Returns
+    -------
+    str
+    """
+    if names:
+        key = ascii_name(names[0])
+        if len(names) == 2:
+            key += ascii_name(names[1])
+    else:
+        key = entrytype
+    if year:
+        key += str(year)
+    return key
+
+
+def suffixed_keys(key):
+    """
+    Generate key with suffixes a, b, ..., z, aa, ab, ... The suffixes are
+    upper case if the key ends with a lower case letter.
+
+    Parameters
+    ----------
+    key: str
+
+    Yields
+    ------
+    str
+    """
+    letters = ascii_uppercase if key[-1:].islower() else ascii_lowercase
+    for length in count(1):
+        for suffix in product(letters, repeat=length):
+            yield key + "".join(suffix)
+
+
+def has_suffix(key, base):
+    """Check if key is base followed by a suffix of suffixed_keys"""
+    if not key.startswith(base) or len(key) == len(base):
+        return False
+    suffix = key[len(base):]
+    if base[-1:].islower():
+        return suffix.isascii() and suffix.isalpha() and suffix.isupper()
+    return suffix.isascii() and suffix.isalpha() and suffix.islower()
+
+
+def unique_key(key, keys, current_key=None):
+    """
+    Add suffix to a key if it is taken.
+
+    Parameters
+    ----------
+    key: str
+    keys: set of str
+        Keys taken by other entries
+    current_key: str, optional
+        Current key of the entry, kept as it is if it equals key. The
+        default value is None.
+
+    Returns
+    -------
+    str
+    """
+    if not key or key == current_key or key not in keys:
+        return key
+    for candidate in suffixed_keys(key):
+        if candidate not in keys:
+            return candidate
+
+
+def assign_keys(bases, current_keys, keys):
+    """
+    Make keys of many entries unique in one pass. Entries are ordered by base
+    key, and entries whose current key already fits their base key come
+    first and keep it. The result only depends on the arguments.
+
+    Parameters
+    ----------
+    bases: list of str
+        Base key of each entry
+    current_keys: list of str
+        Current key of each entry
+    keys: set of str
+        Keys taken by entries that keep their keys, not changed
+
+    Returns
+    -------
+    list of str
+        New key of each entry
+    """
+    def rank(n):
+        base, current_key = bases[n], current_keys[n]
+        if current_key == base:
+            return (base, 0, "", n)
+        if has_suffix(current_key, base):
+            return (base, 1, current_key, n)
+        return (base, 2, "", n)
+
+    taken = set(keys)
+    candidates = {}     # {base key: suffixed keys not tried yet}
+    new_keys = [None] * len(bases)
+    for n in sorted(range(len(bases)), key=rank):
+        base, current_key = bases[n], current_keys[n]
+        if (current_key == base or has_suffix(current_key, base)) and current_key not in taken:
+            key = current_key
+        elif base not in taken:
+            key = base
+        else:
+            suffixed = candidates.setdefault(base, suffixed_keys(base))
+            key = next(candidate for candidate in suffixed if candidate not in taken)
+        taken.add(key)
+        new_keys[n] = key
+    return new_keys
+
+
+def compute_keys(authors, entrytypes, years, current_keys, keys, cancellable=None):
+    """
+    Generate unique keys for many entries. Safe to run in a thread, as it
+    does not touch items or widgets.
+
+    Parameters
+    ----------
+    authors: list of str or None
+        Expanded author field of each entry, None if missing
+    entrytypes: list of str
+    years: list of str or None
+    current_keys: list of str
+    keys: set of str
+        Keys taken by entries that keep their keys
+    cancellable: Gio.Cancellable, optional
+        Stop early if cancelled. The default value is None.
+
+    Returns
+    -------
+    list of str or None
+        New key of each entry, None if cancelled
+    """
+    bases = []
+    for n, author in enumerate(authors):
+        if cancellable and n % CANCEL_INTERVAL == 0 and cancellable.is_cancelled():
+            return None
+        bases.append(base_key(last_names(author) if author else [], entrytypes[n], years[n]))
+    return assign_keys(bases, current_keys, keys)
+
+
+def generate_keys(items, callback):
+    """
+    Generate unique keys for many items in a thread. Cross-references to
+    renamed keys are updated as well.
+
+    Parameters
+    ----------
+    items: list of BadaBibItem
+        Items of one file
+    callback: function(list of tuple)
+        Called on the main loop with the edits (item, field, old value, new
+        value) of all changed keys and cross-references. Empty if nothing
+        changed or the generation was cancelled.
+
+    Returns
+    -------
+    Gio.Cancellable
+    """
+    # Collect values on the main loop, items must not be touched by the thread
+    bibfile = items[0].bibfile
+    authors = [expand_pretty(item.entry["author"]) if "author" in item.entry else None for item in items]
+    entrytypes = [item.entry["ENTRYTYPE"] for item in items]
+    years = [item.raw_field("year") for item in items]
+    current_keys = [item.key for item in items]
+    versions = [item.version for item in items]
+    renamed = set(items)
+    keys = frozenset(item.key for item in bibfile.items if not item.deleted and item not in renamed)
+
+    def keys_thread(task, _obj, _data, cancellable):
+        task.return_value(compute_keys(authors, entrytypes, years, current_keys, keys, cancellable))
+
+    def on_keys_computed(_obj, task):
+        success, new_keys = task.propagate_value()
+        if not success or new_keys is None or cancellable.is_cancelled() or not bibfile.itemlist:
+            callback([])
+            return
+
+        # Skip items that were closed or edited in the meantime, they keep
+        # their keys
+        renamed = [n for n, item in enumerate(items)
+                   if item.bibfile and item.version == versions[n] and new_keys[n] != current_keys[n]]
+        renamed_items = {items[n] for n in renamed}
+
+        # Keys may have changed while the thread ran, so check new keys
+        # against the keys the file has now
+        taken = {item.key for item in bibfile.items if not item.deleted and item not in renamed_items}
+        edits = []
+        for n in renamed:
+            key = new_keys[n]
+            if key in taken:
+                base = base_key(last_names(authors[n]) if authors[n] else [], entrytypes[n], years[n])
+                key = unique_key(base, taken)
+            taken.add(key)
+            if key != current_keys[n]:
+                edits.append((items[n], "ID", current_keys[n], key))
+
+        # Old keys that belonged to a single entry now refer to its new key
+        old_keys = [item.key for item in bibfile.items if not item.deleted]
+        counts = {}
+        for key in old_keys:
+            counts[key] = counts.get(key, 0) + 1
+        renames = {old_key: new_key for _item, _field, old_key, new_key in edits if counts.get(old_key) == 1}
+        if renames:
+            for item in bibfile.items:
+                if not item.deleted and "crossref" in item.entry:
+                    crossref = item.raw_field("crossref")
+                    if crossref in renames:
+                        edits.append((item, "crossref", crossref, renames[crossref]))
+        callback(edits)
+
+    cancellable = Gio.Cancellable()
+    task = Gio.Task.new(None, cancellable, on_keys_computed)
+    task.run_in_thread(keys_thread)
+    return cancellable
@@ -0,0 +1,113 @@
+# latex.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from itertools import chain
+from re import escape
+from re import finditer
+from unicodedata import combining
+from unicodedata import normalize
+
+from bibtexparser.latexenc import unicode_to_crappy_latex1
+from bibtexparser.latexenc import unicode_to_crappy_latex2
+from bibtexparser.latexenc import unicode_to_latex
+
+
+def prepare_replacements(replacements):
+    """
+    Convert bibtexparser's table of (unicode, latex) pairs to a list of
+    (latex, unicode, is combining) triples, in the same order. Pairs with
+    more than one character, such as '\\;', are malformed and left out,
+    bibtexparser raises a TypeError on them.
+    """
+    return [(latex.rstrip(), unicod, bool(combining(unicod)))
+            for unicod, latex in replacements if len(unicod) == 1]
+
+
+# Replacements applied to strings with backslashes or braces
+REPLACEMENTS = prepare_replacements(chain(unicode_to_crappy_latex1, unicode_to_latex))
+
+# Replacements without backslash, with their position in REPLACEMENTS. None of
+# them produces a backslash, so they are the only ones that can still apply
+# once a string has no backslash left.
+PLAIN_REPLACEMENTS = [(n,) + replacement for n, replacement in enumerate(REPLACEMENTS)
+                      if "\\" not in replacement[0]]
+
+# Replacements applied to what is left after braces are removed
+CRAPPY_REPLACEMENTS = prepare_replacements(unicode_to_crappy_latex2)
+
+
+def replace_latex(string, latex, unicod, is_combining):
+    """Replace one LaTeX command, as bibtexparser does."""
+    if not is_combining:
+        return string.replace(latex, unicod)
+    # Combining accents go after the following character, or are dropped at
+    # the end of the string
+    for match in finditer(escape(latex), string):
+        i, j = match.span()
+        if j < len(string):
+            string = "".join([string[:i], string[j], unicod, string[(j + 1):]])
+        else:
+            string = string[:i]
+    return string
+
+
+def replace_all_latex(string):
+    """Apply REPLACEMENTS in order, skipping the ones that cannot match."""
+    start = 0
+    if "\\" in string:
+        for n, (latex, unicod, is_combining) in enumerate(REPLACEMENTS):
+            if latex in string:
+                string = replace_latex(string, latex, unicod, is_combining)
+                if "\\" not in string:
+                    start = n + 1
+                    break
+        else:
+            return string
+    for n, latex, unicod, is_combining in PLAIN_REPLACEMENTS:
+        if n >= start and latex in string:
+            string = replace_latex(string, latex, unicod, is_combining)
+    return string
+
+
+def convert_latex(string):
+    """
+    Convert LaTeX to unicode. Gives the same results as latex_to_unicode of
+    bibtexparser, but returns strings without LaTeX right away and only
+    tries the replacements that can still match. Safe to run in a thread.
+
+    Parameters
+    ----------
+    string: str
+
+    Returns
+    -------
+    str
+        NFC normalized unicode string without braces
+    """
+    # Fast path: nothing to replace, only normalize
+    if "\\" not in string and "{" not in string and "}" not in string:
+        if string.isascii():
+            return string
+        return normalize("NFC", string)
+
+    if "{" in string or "\\" in string:
+        string = replace_all_latex(string)
+    string = string.replace("{", "").replace("}", "")
+    if "\\" in string:
+        for latex, unicod, is_combining in CRAPPY_REPLACEMENTS:
+            if latex in string:
+                string = replace_latex(string, latex, unicod, is_combining)
+    return normalize("NFC", string)
@@ -23,9 +23,8 @@ from .config_manager import get_default_entrytype
 from .config_manager import set_editor_layout
 from .config_manager import get_editor_layout
 
-from .dialogs import WarningDialog
-
 from .editor import Editor
+from .editor import string_to_layout
 
 
 HELP_TEXT = """
@@ -48,61 +47,6 @@ journal volume year
 """
 
 
-def string_to_layout(string, window):
-    layout = []
-    unknown = []
-    message = ""
-    title = "Invalid Layout"
-
-    lines = string.split("\n")
-    if len(lines) > 3 * len(field_dict):
-        message += "String contains too many lines."
-        WarningDialog(message, window, title)
-        return []
-
-    for line in lines:
-        fields = []
-        words = line.split()
-        for word in words:
-            word = word.strip()
-            if word:
-                if word[0] == "#":
-                    break
-                if word[0] == "-":
-                    fields.append("separator")
-                    break
-                if word in field_dict:
-                    fields.append(word)
-                else:
-                    unknown.append(word)
-        if fields:
-            layout.append(fields)
-
-    if not layout:
-        WarningDialog("Empty layout, please add fields.", window, title)
-        return []
-
-    if unknown:
-        message += "Unknown fields: " + ", ".join(unknown)
-
-    duplicated = []
-    all_fields = [field for row in layout for field in row if field != "separator"]
-    for field in set(all_fields):
-        if all_fields.count(field) > 1:
-            duplicated.append(field)
-
-    if duplicated:
-        if message:
-            message += "\n\n"
-        message += "Duplicated fields: " + ", ".join(duplicated)
-
-    if message:
-        WarningDialog(message, window, title)
-        return []
-
-    return layout
-
-
 class TopToolbar(Gtk.CenterBox):
     def __init__(self):
         super().__init__(orientation=Gtk.Orientation.HORIZONTAL)
@@ -0,0 +1,206 @@
+# lazy.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import mmap
+import re
+
+from array import array
+
+from os.path import getsize
+
+from sys import intern
+
+from .config_manager import get_lazy_loading_threshold
+
+
+# Start of a BibTeX block, '@type{key,' or '@type(key,', at the beginning of a
+# line. An '@' within a line, for example in an email address, never starts a
+# block, and neither does one within a field value, see LazyIndex.scan.
+BLOCK_PATTERN = re.compile(rb"^[ \t]*@[ \t]*([A-Za-z][\w-]*)[ \t]*[{(][ \t\r\n]*([^,\s{}()]*)", re.MULTILINE)
+
+# Blocks that are not entries. They are parsed when the file is opened.
+HEADER_TYPES = {"comment", "preamble", "string"}
+
+
+def use_lazy_loading(name):
+    """
+    Check if a file is large enough to be loaded lazily.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the .bib file
+
+    Returns
+    -------
+    bool
+    """
+    threshold = get_lazy_loading_threshold()
+    return threshold > 0 and getsize(name) > threshold * 1024 * 1024
+
+
+class LazyIndex:
+    """
+    Offset index of the entries of a memory-mapped .bib file. Entry types and
+    keys are read when the file is indexed, entries are parsed on demand.
+    Entries that were not modified are written by copying their source.
+    """
+    def __init__(self, name):
+        """
+        Map file into memory and index its blocks.
+
+        Parameters
+        ----------
+        name: str
+            Full path of the .bib file
+
+        Raises
+        ------
+        OSError
+            If the file cannot be read
+        ValueError
+            If the blocks cannot be told apart, see scan
+        """
+        self.file = open(name, "rb")
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.file.close()
+            raise OSError(f"Cannot map {name}")
+
+        self.starts = array("q")    # Start offset of each entry
+        self.ends = array("q")      # End offset of each entry
+        self.entrytypes = []        # Lower case entry type of each entry
+        self.keys = []              # BibTeX key of each entry
+        self.header_spans = []      # (start, end) of strings, comments and preambles
+        self.modified = set()       # Indices of entries whose source is outdated
+
+        try:
+            self.scan()
+        except ValueError:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self.starts)
+
+    def scan(self):
+        """
+        Find all blocks in a single pass. Each block extends to the start of
+        the next one, so text between entries is kept with the preceding entry.
+        A line starting with '@' only starts a block if the braces of the
+        previous block are balanced. Otherwise it belongs to a field value of
+        the previous block, for example, to an abstract.
+
+        Raises
+        ------
+        ValueError
+            If braces are not balanced, so that entries cannot be told apart
+            without parsing the whole file
+        UnicodeDecodeError
+            If a block is not valid UTF-8. The file is then parsed as a whole,
+            which reports the error.
+        """
+        previous = None
+        depth = 0           # Brace depth of the previous block up to position
+        position = 0
+        for match in BLOCK_PATTERN.finditer(self.buffer):
+            start = match.start()
+            if previous:
+                text = self.buffer[position:start].decode("utf-8")
+                depth += text.count("{") - text.count("}")
+                position = start
+                if depth > 0:
+                    continue
+                if depth < 0:
+                    raise ValueError(f"Unbalanced braces before offset {start}")
+                self.add_block(*previous, start)
+            blocktype = match.group(1).decode("ascii").lower()
+            previous = (blocktype, match.group(2), start)
+            position = start
+        if previous:
+            text = self.buffer[position:].decode("utf-8")
+            depth += text.count("{") - text.count("}")
+            if depth != 0:
+                raise ValueError("Unbalanced braces at end of file")
+            self.add_block(*previous, len(self.buffer))
+
+    def add_block(self, blocktype, key, start, end):
+        if blocktype in HEADER_TYPES:
+            self.header_spans.append((start, end))
+            return
+        self.starts.append(start)
+        self.ends.append(end)
+        self.entrytypes.append(intern(blocktype))
+        self.keys.append(key.decode("utf-8"))
+
+    def header_text(self):
+        """
+        Get source of all strings, comments and preambles.
+
+        Returns
+        -------
+        str
+        """
+        return "\n".join(self.buffer[start:end].decode("utf-8") for start, end in self.header_spans)
+
+    def source(self, idx):
+        """
+        Get original source of an entry. Blocks were checked to be valid
+        UTF-8 when the file was indexed.
+
+        Parameters
+        ----------
+        idx: int
+            Entry index
+
+        Returns
+        -------
+        str
+        """
+        return self.buffer[self.starts[idx]:self.ends[idx]].decode("utf-8").rstrip() + "\n"
+
+    def is_unchanged(self, idx):
+        """Check if the original source of an entry can be written as is."""
+        return idx < len(self.starts) and idx not in self.modified
+
+    def parse(self, idx, entry_parser):
+        """
+        Parse an entry.
+
+        Parameters
+        ----------
+        idx: int
+            Entry index
+        entry_parser: EntryParser
+            Parser of the file
+
+        Returns
+        -------
+        dict
+            bibtexparser entry. If the source cannot be parsed, an entry with
+            type and key only. Its source is still written on saving, as long
+            as the entry is not modified.
+        """
+        entry = entry_parser.parse(self.source(idx))
+        if entry is None:
+            entry = {"ENTRYTYPE": self.entrytypes[idx], "ID": self.keys[idx]}
+        return entry
+
+    def close(self):
+        """Unmap file."""
+        self.buffer.close()
+        self.file.close()
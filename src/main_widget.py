@@ -14,9 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from gi.repository import Gtk, Gdk, GLib, Gio
-
-from time import sleep
+from gi.repository import Gtk, Gdk, Gio, GLib
 
 from os.path import split
 
@@ -25,8 +23,7 @@ from .config_manager import remove_from_recent
 from .config_manager import get_editor_layout
 from .config_manager import get_parse_on_fly
 from .config_manager import get_default_entrytype
-
-from .layout_manager import string_to_layout
+from .config_manager import entrytype_dict
 
 from .bibitem import entries_equal
 
@@ -35,8 +32,27 @@ from .forms import SourceView
 from .change import Change
 
 from .editor import Editor
+from .editor import string_to_layout
+
+from .watcher import WatcherService
+
+from .transform import TRANSFORMS
+from .transform import transform_items
+
+from .keys import generate_keys
+
+from .exporters import EXPORTERS
+from .exporters import write_export
+
+from .importers import IMPORTERS
+from .importers import make_keys_unique
+from .importers import read_entries
 
-from .watcher import Watcher
+from .clipboard import copy_to_clipboard
+from .clipboard import paste_from_clipboard
+
+from .backup import list_backups
+from .backup import restore_backup
 
 from .itemlist import Itemlist
 from .itemlist import ItemlistPage
@@ -46,13 +62,27 @@ from .itemlist import ItemlistToolbar
 from .menus import FilterPopover
 from .menus import SortPopover
 
+from .dialogs import FileChooser
 from .dialogs import SaveChangesDialog
 from .dialogs import SaveDialog
 from .dialogs import ConfirmSaveDialog
+from .dialogs import RestoreBackupDialog
+from .dialogs import BulkTransformDialog
+from .dialogs import GenerateKeysDialog
+from .dialogs import ExportDialog
+from .dialogs import WarningDialog
+
+from .instrumentation import profile_step
 
 
 DEFAULT_EDITOR = get_default_entrytype()
 
+# Delay (in milliseconds) between the last edit in the source view and parsing
+PARSE_DELAY = 250
+
+# Number of new entries above which items are added in time slices
+SLICED_ITEMS = 100
+
 
 class MainWidget(Gtk.Paned):
     def __init__(self, store):
@@ -60,13 +90,23 @@ class MainWidget(Gtk.Paned):
 
         self.store = store
         self.editors = {}
-        self.watchers = {}
+        self.watchers = WatcherService(self)
         self.copy_paste_buffer = None
-
-        self.assemble_left_pane()
-        self.assemble_right_pane()
-
-        self.add_editor(DEFAULT_EDITOR)
+        self.copy_cancellable = None    # Cancellable of copy to clipboard in progress
+        self.transform_cancellables = {}    # {bibfile: cancellable of bulk transform in progress}
+        self.pending_parse = None   # (timeout id, item) of pending source view parse
+        self.deferred_idle_id = None    # Idle source opening the next deferred page
+
+        with profile_step("build itemlist pane"):
+            self.assemble_left_pane()
+        with profile_step("build source view"):
+            self.assemble_right_pane()
+
+        # Editors of other entry types are built while idle, so that selecting
+        # an entry does not have to wait for its editor
+        with profile_step("build default editor"):
+            self.add_editor(DEFAULT_EDITOR)
+        GLib.idle_add(self.on_prebuild_editor_idle, iter(entrytype_dict), priority=GLib.PRIORITY_LOW)
         self.outer_stack.set_visible_child_name("editor")
 
     def assemble_left_pane(self):
@@ -136,6 +176,14 @@ class MainWidget(Gtk.Paned):
         self.editors[entrytype] = editor
         return editor
 
+    def on_prebuild_editor_idle(self, entrytypes):
+        # build one editor per main loop iteration
+        for entrytype in entrytypes:
+            if entrytype not in self.editors:
+                self.add_editor(entrytype)
+                return GLib.SOURCE_CONTINUE
+        return GLib.SOURCE_REMOVE
+
     def update_editor(self, entrytype):
         if entrytype in self.editors:
             editor = self.editors.pop(entrytype)
@@ -219,11 +267,76 @@ class MainWidget(Gtk.Paned):
             entries = [None]
 
         if itemlist:
+            if len(entries) > SLICED_ITEMS:
+                self.add_items_in_slices(itemlist, entries)
+                return
             items = [itemlist.bibfile.append_item(entry) for entry in entries]
             itemlist.add_rows(items)
             change = Change.Show(items)
             itemlist.change_buffer.push_change(change)
 
+    def add_items_in_slices(self, itemlist, entries):
+        bibfile = itemlist.bibfile
+        page = itemlist.page
+        jobs = []
+        items = []
+
+        def on_cancel():
+            for job in jobs:
+                itemlist.cancel_job(job)
+
+        def append_steps():
+            # New items stay hidden until all of them were added, so that
+            # cancelling leaves the file as if the change had been undone
+            for entry in entries:
+                item = bibfile.append_item(entry)
+                item.deleted = True
+                items.append(item)
+                yield
+
+        def on_appended():
+            jobs.append(itemlist.add_rows(items, on_rows_added))
+
+        def on_rows_added():
+            page.set_cancel(None)
+            itemlist.change_buffer.push_change(Change.Show(items))
+
+        # append items and build their rows in time slices, then show and
+        # select them as a single change
+        page.set_cancel(on_cancel)
+        jobs.append(itemlist.run_job(append_steps(), len(entries), on_appended))
+
+    def copy_items(self, items):
+        self.copy_paste_buffer = [item.entry.copy() for item in items]
+
+        def on_copied():
+            self.copy_cancellable = None
+
+        # other applications get the entries as BibTeX, generated in thread
+        if self.copy_cancellable:
+            self.copy_cancellable.cancel()
+        writer = self.store.get_default_writer()
+        self.copy_cancellable = copy_to_clipboard(self.get_clipboard(), self.copy_paste_buffer, writer, on_copied)
+
+    def paste_items(self):
+        itemlist = self.get_current_itemlist()
+        if not itemlist:
+            return
+
+        # Entries copied in this application are pasted without parsing,
+        # unless another application put text on the clipboard since
+        clipboard = self.get_clipboard()
+        if self.copy_paste_buffer and (clipboard.is_local() or self.copy_cancellable):
+            self.add_items(entries=[entry.copy() for entry in self.copy_paste_buffer])
+            return
+
+        def on_pasted(entries):
+            if entries and itemlist is self.get_current_itemlist():
+                self.add_items(entries=entries)
+
+        parser = self.store.get_default_parser()
+        paste_from_clipboard(clipboard, parser, itemlist.bibfile.database, on_pasted)
+
     def delete_items(self, items):
         itemlist = self.get_current_itemlist()
         if itemlist and items:
@@ -240,10 +353,14 @@ class MainWidget(Gtk.Paned):
             itemlist.focus_on_selected_items()
 
     def on_selected_rows_changed(self, itemlist):
+        if itemlist.selecting:
+            return
+        self.flush_pending_parse()
         # work around listbox scrolling horizontally on row changes
         itemlist.get_parent().get_parent().get_hadjustment().set_value(0)
         item = self.get_current_item(itemlist)
         if item and item.bibfile:
+            item.row.load()
             entrytype = item.entry["ENTRYTYPE"]
             self.show_editor(entrytype).show_item(item)
             self.source_view.set_status("valid")
@@ -265,6 +382,178 @@ class MainWidget(Gtk.Paned):
             change = Change.Edit(item, form, old_key, new_key)
             item.bibfile.itemlist.change_buffer.push_change(change)
 
+    def generate_keys(self):
+        itemlist = self.get_current_itemlist()
+        if not itemlist:
+            return
+        has_selection = bool(self.get_selected_items(itemlist))
+        dialog = GenerateKeysDialog(self.get_root(), has_selection)
+        dialog.connect("response", self.on_generate_keys_response, itemlist)
+        dialog.show()
+
+    def on_generate_keys_response(self, dialog, response, itemlist):
+        selected_only = dialog.get_choice()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not itemlist.bibfile:
+            return
+
+        bibfile = itemlist.bibfile
+        if selected_only:
+            items = self.get_selected_items(itemlist)
+        else:
+            items = [item for item in bibfile.items if not item.deleted]
+        if not items:
+            return
+
+        def on_generated(edits):
+            if bibfile.itemlist:
+                bibfile.itemlist.page.tabview_page.set_loading(False)
+                if edits:
+                    change = Change.Bulk(edits)
+                    bibfile.itemlist.change_buffer.push_change(change)
+
+        # compute keys in thread, apply them as a single change
+        itemlist.page.tabview_page.set_loading(True)
+        generate_keys(items, on_generated)
+
+    def bulk_transform(self):
+        itemlist = self.get_current_itemlist()
+        if not itemlist:
+            return
+        has_selection = bool(self.get_selected_items(itemlist))
+        dialog = BulkTransformDialog(self.get_root(), list(TRANSFORMS), has_selection)
+        dialog.connect("response", self.on_bulk_transform_response, itemlist)
+        dialog.show()
+
+    def on_bulk_transform_response(self, dialog, response, itemlist):
+        transform, field, selected_only = dialog.get_choice()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not field or not itemlist.bibfile:
+            return
+
+        bibfile = itemlist.bibfile
+        if selected_only:
+            items = self.get_selected_items(itemlist)
+        else:
+            items = [item for item in bibfile.items if not item.deleted]
+
+        def on_transformed(edits):
+            if self.transform_cancellables.get(bibfile) is cancellable:
+                del self.transform_cancellables[bibfile]
+            if bibfile.itemlist:
+                bibfile.itemlist.page.tabview_page.set_loading(False)
+                if edits:
+                    change = Change.Bulk(edits)
+                    bibfile.itemlist.change_buffer.push_change(change)
+
+        # compute new values in thread, apply them as a single change
+        itemlist.page.tabview_page.set_loading(True)
+        cancellable = transform_items(items, field, TRANSFORMS[transform], bibfile.database.strings, on_transformed)
+        self.transform_cancellables[bibfile] = cancellable
+
+    def export_entries(self):
+        itemlist = self.get_current_itemlist()
+        if not itemlist:
+            return
+        has_selection = bool(self.get_selected_items(itemlist))
+        dialog = ExportDialog(self.get_root(), list(EXPORTERS), has_selection)
+        dialog.connect("response", self.on_export_response, itemlist)
+        dialog.show()
+
+    def on_export_response(self, dialog, response, itemlist):
+        export_format, scope = dialog.get_choice()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not itemlist.bibfile:
+            return
+
+        bibfile = itemlist.bibfile
+        if scope == "selected":
+            rows = sorted(itemlist.get_selected_rows(), key=Gtk.ListBoxRow.get_index)
+            items = [row.item for row in rows]
+        elif scope == "shown":
+            items = itemlist.get_shown_items()
+        else:
+            items = [item for item in bibfile.ordered_items() if not item.deleted]
+
+        exporter = EXPORTERS[export_format](bibfile)
+        name = exporter.default_name(bibfile.base_name)
+        dialog = SaveDialog(self.get_root(), name, bibtex=False)
+        dialog.connect("response", self.on_export_file_chosen, itemlist, exporter, items)
+        dialog.show()
+
+    def on_export_file_chosen(self, dialog, response, itemlist, exporter, items):
+        name = dialog.get_file().get_path() if response == Gtk.ResponseType.ACCEPT else None
+        dialog.destroy()
+        if not name or not itemlist.bibfile:
+            return
+        if name in self.store.bibfiles:
+            WarningDialog(f"Entries cannot be exported to '{name}', the file is open.", window=self.get_root())
+            return
+
+        def export_steps():
+            try:
+                yield from write_export(exporter, items, name)
+            except OSError:
+                WarningDialog(f"Entries could not be exported to '{name}'.", window=self.get_root())
+
+        # write file in time slices, entries are converted one by one
+        itemlist.run_job(export_steps(), len(items), lambda: None)
+
+    def import_entries(self):
+        itemlist = self.get_current_itemlist()
+        if not itemlist:
+            return
+        dialog = FileChooser(self.get_root(), list(IMPORTERS.values()))
+        dialog.connect("response", self.on_import_files_chosen, itemlist)
+        dialog.show()
+
+    def on_import_files_chosen(self, dialog, response, itemlist):
+        names = []
+        if response == Gtk.ResponseType.ACCEPT:
+            names = [gfile.get_path() for gfile in dialog.get_files()]
+        dialog.destroy()
+        if not names or not itemlist.bibfile:
+            return
+
+        page = itemlist.page
+        cancellable = Gio.Cancellable()
+        keys = frozenset(item.key for item in itemlist.bibfile.items if not item.deleted)
+
+        def on_cancel():
+            cancellable.cancel()
+            itemlist.hide_progress()
+
+        def import_thread(task, _obj, _data, task_cancellable):
+            entries = []
+            failed = []
+            for name in names:
+                try:
+                    entries.extend(read_entries(name, task_cancellable))
+                except (OSError, ValueError):
+                    failed.append(name)
+            make_keys_unique(entries, keys)
+            task.return_value((entries, failed))
+
+        def on_imported(_obj, task):
+            if cancellable.is_cancelled() or not itemlist.bibfile:
+                return
+            success, result = task.propagate_value()
+            entries, failed = result if success else ([], names)
+            if failed:
+                files = ", ".join(f"'{split(name)[1]}'" for name in failed)
+                WarningDialog(f"Entries could not be imported from {files}.", window=self.get_root())
+            if entries:
+                self.add_items_in_slices(itemlist, entries)
+            else:
+                page.set_cancel(None)
+                itemlist.hide_progress()
+
+        # read files in thread, then add all entries as a single change
+        page.set_cancel(on_cancel)
+        itemlist.show_progress(0.0)
+        task = Gio.Task.new(None, cancellable, on_imported)
+        task.run_in_thread(import_thread)
+
     # TabView
 
     def on_tab_closed(self, tabview, tabview_page, _data=None):
@@ -285,12 +574,16 @@ class MainWidget(Gtk.Paned):
         if tabview_page is None:
             self.new_file()
         else:
-            itemlist = tabview_page.get_child().itemlist
+            page = tabview_page.get_child()
+            itemlist = page.itemlist
             # Page cotains itemlist
             if itemlist:
                 self.on_selected_rows_changed(itemlist)
             # Page is empty
             else:
+                # Open file of deferred page when it is first shown
+                if page.deferred:
+                    self.load_page(page)
                 self.source_view.set_status("empty", True)
                 editor = self.get_current_editor()
                 if editor:
@@ -299,15 +592,36 @@ class MainWidget(Gtk.Paned):
     # Source view
 
     def on_source_view_modified(self, _buffer):
+        self.source_view.set_status("modified")
         if get_parse_on_fly():
-            self.update_bibtex()
-        else:
-            self.source_view.set_status("modified")
-
-    def update_bibtex(self, _button=None):
-        bibtex = self.source_view.form.get_text()
-        if bibtex:
+            # Parse once typing pauses, remember item in case selection changes
+            if self.pending_parse:
+                GLib.source_remove(self.pending_parse[0])
+            timeout_id = GLib.timeout_add(PARSE_DELAY, self.on_parse_delay_elapsed)
+            self.pending_parse = (timeout_id, self.get_current_item())
+
+    def on_parse_delay_elapsed(self):
+        _timeout_id, item = self.pending_parse
+        self.pending_parse = None
+        self.update_bibtex(item=item)
+        return GLib.SOURCE_REMOVE
+
+    def flush_pending_parse(self):
+        """Parse pending edits of the source view right away."""
+        if self.pending_parse:
+            timeout_id, item = self.pending_parse
+            GLib.source_remove(timeout_id)
+            self.pending_parse = None
+            self.update_bibtex(item=item)
+
+    def update_bibtex(self, _button=None, item=None):
+        if item is None:
+            if self.pending_parse:
+                GLib.source_remove(self.pending_parse[0])
+                self.pending_parse = None
             item = self.get_current_item()
+        bibtex = self.source_view.form.get_text()
+        if bibtex and item and item.bibfile:
             new_entry = item.bibfile.parse_entry(bibtex)
             old_entry = item.entry
             if new_entry:
@@ -321,13 +635,10 @@ class MainWidget(Gtk.Paned):
     # File watcher
 
     def add_watcher(self, filename):
-        sleep(0.1)  # give file time to settle
-        self.watchers[filename] = Watcher(self, filename)
+        self.watchers.add(filename)
 
     def remove_watcher(self, filename):
-        if filename in self.watchers:
-            watcher = self.watchers.pop(filename)
-            watcher.monitor.cancel()
+        self.watchers.remove(filename)
 
     # File
 
@@ -344,7 +655,7 @@ class MainWidget(Gtk.Paned):
 
         self.tabbox.tabview.set_selected_page(page.tabview_page)
 
-    def open_files(self, names, states=None, positions=None, open_tab=None):
+    def open_files(self, names, states=None, positions=None, open_tab=None, defer=False):
         if not isinstance(names, list):
             names = [names]
 
@@ -358,30 +669,46 @@ class MainWidget(Gtk.Paned):
         elif not isinstance(positions, list):
             positions = [positions]
 
-        if open_tab is None:
+        # show the first file if the tab to show is not among them
+        if open_tab not in names:
             open_tab = names[0]
 
         empty_tabview_page = self.tabbox.contains_empty_file()
 
         for name, state, position in zip(names, states, positions):
-            page = self.open_file(name, state, position)
+            # Only the file shown right away is opened, if requested
+            page = self.open_file(name, state, position, defer and name != open_tab)
             if name == open_tab:
                 self.tabbox.tabview.set_selected_page(page.tabview_page)
 
         if empty_tabview_page is not None:
             self.tabbox.tabview.close_page(empty_tabview_page)
 
-    def open_file(self, name, state=None, position=None):
-        # add page to TabView
+        if defer:
+            self.load_deferred_pages()
+
+    def open_file(self, name, state=None, position=None, defer=False):
+        # add page to TabView, adding may show and open it right away
         page = ItemlistPage()
+        page.deferred = (name, state)
         if position is None:
             page.tabview_page = self.tabbox.tabview.append(page)
         else:
             page.tabview_page = self.tabbox.tabview.insert(page, position)
-        page.tabview_page.set_loading(True)
         page.tabview_page.set_title(split(name)[1])
         page.tabview_page.set_tooltip(name)
 
+        # deferred pages are opened when first shown, or when idle
+        if not defer and page.deferred:
+            self.load_page(page)
+
+        return page
+
+    def load_page(self, page, on_loaded=None):
+        name, state = page.deferred
+        page.deferred = None
+        page.tabview_page.set_loading(True)
+
         def parse_file(task, _obj, _data, _cancellable):
             status = self.store.add_file(name)
             task.return_value(status)
@@ -403,15 +730,37 @@ class MainWidget(Gtk.Paned):
                 bibfile = self.store.bibfiles[name]
                 itemlist = self.new_itemlist(bibfile, state)
                 page.add_itemlist(itemlist)
-                GLib.idle_add(self.add_watcher, name)
+                self.add_watcher(name)
                 if "empty" in status:
                     page.empty_bar.reveal()
+                if "recovered" in status:
+                    # Recovered changes are not on disk, so no state is saved
+                    itemlist.change_buffer.saved_index = -1
+                    itemlist.update_filename(unsaved=True)
+                    page.recovered_bar.reveal()
+                elif "recovery_failed" in status:
+                    page.recovery_failed_bar.reveal()
+
+            if on_loaded:
+                on_loaded()
 
         # open file in thread
         task = Gio.Task.new(None, None, on_file_parsed)
         task.run_in_thread(parse_file)
 
-        return page
+    def load_deferred_pages(self):
+        # open deferred pages one by one while idle, in a single chain
+        if self.deferred_idle_id is None:
+            self.deferred_idle_id = GLib.idle_add(self.load_next_deferred_page, priority=GLib.PRIORITY_LOW)
+
+    def load_next_deferred_page(self):
+        self.deferred_idle_id = None
+        for tabview_page in self.tabbox.tabview.get_pages():
+            page = tabview_page.get_child()
+            if page.deferred:
+                self.load_page(page, self.load_deferred_pages)
+                break
+        return GLib.SOURCE_REMOVE
 
     def reload_file(self, bibfile):
         name = bibfile.name
@@ -422,12 +771,49 @@ class MainWidget(Gtk.Paned):
         self.close_files(bibfile, force=True)
         self.open_files(name, state, position, name)
 
+    def restore_backup(self):
+        itemlist = self.get_current_itemlist()
+        if not itemlist or itemlist.bibfile.created:
+            return
+
+        bibfile = itemlist.bibfile
+        generations = list_backups(bibfile.name)
+        if not generations:
+            WarningDialog(f"There are no backups of file '{bibfile.base_name}'.", window=self.get_root())
+            return
+
+        dialog = RestoreBackupDialog(self.get_root(), bibfile.base_name, generations)
+        dialog.connect("response", self.on_restore_backup_response, bibfile.name)
+        dialog.show()
+
+    def on_restore_backup_response(self, dialog, response, name):
+        digest = dialog.get_selected_digest()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or digest is None:
+            return
+
+        def restore_thread(task, _obj, _data, _cancellable):
+            task.return_value(restore_backup(name, digest))
+
+        def on_restored(_obj, task):
+            success, restored = task.propagate_value()
+            if not (success and restored):
+                WarningDialog(f"Restoring backup of file '{name}' failed.", window=self.get_root())
+            elif name in self.store.bibfiles:
+                self.reload_file(self.store.bibfiles[name])
+
+        # decompress backup in thread
+        task = Gio.Task.new(None, None, on_restored)
+        task.run_in_thread(restore_thread)
+
     def declare_file_created(self, name):
         self.store.bibfiles[name].created = True
         self.store.bibfiles[name].set_unsaved(True)
-        self.watchers.pop(name)
 
     def close_files(self, bibfiles, force=False, close_app=False):
+        # edits still waiting in the source view must not be lost
+        self.flush_pending_parse()
+
         # make sure 'bibfiles' is a list
         if not isinstance(bibfiles, list):
             bibfiles = [bibfiles]
@@ -483,6 +869,9 @@ class MainWidget(Gtk.Paned):
             self.tabbox.tabview.close_page(page.tabview_page)
 
             # Clean up
+            cancellable = self.transform_cancellables.pop(bibfile, None)
+            if cancellable:
+                cancellable.cancel()
             self.remove_watcher(bibfile.name)
             self.store.remove_file(bibfile.name)
 
@@ -490,6 +879,7 @@ class MainWidget(Gtk.Paned):
             self.get_root().destroy()
 
     def save_file(self, bibfile=None, close_data=None):
+        self.flush_pending_parse()
         if bibfile is None:
             itemlist = self.get_current_itemlist()
             if itemlist:
@@ -513,6 +903,7 @@ class MainWidget(Gtk.Paned):
         self.save_file(bibfiles[n], close_data)
 
     def save_file_as(self, bibfile=None, new_name=None, close_data=None):
+        self.flush_pending_parse()
         if bibfile is None:
             itemlist = self.get_current_itemlist()
             if itemlist:
@@ -568,10 +959,20 @@ class MainWidget(Gtk.Paned):
             self.remove_watcher(bibfile.name)
             self.store.rename_file(bibfile.name, new_name)
 
-        self.remove_watcher(bibfile.name)
-        errors = self.store.save_file(new_name)
+        # write the file once the backup is done, the backup runs in thread
+        bibfile.itemlist.page.tabview_page.set_loading(True)
+        self.store.backup_before_save(new_name, lambda backup: self.on_backed_up(bibfile, new_name, close_data, backup))
+        return None
+
+    def on_backed_up(self, bibfile, new_name, close_data, backup):
+        # the file may have been closed or renamed in the meantime
+        if self.store.bibfiles.get(new_name) is not bibfile:
+            return None
+        bibfile.itemlist.page.tabview_page.set_loading(False)
+        errors = self.store.save_file(new_name, backup)
 
         if "save" in errors:
+            self.remove_watcher(new_name)
             bibfile.created = True
             bibfile.set_unsaved(True)
             bibfile.itemlist.page.save_bar.reveal()
@@ -580,7 +981,8 @@ class MainWidget(Gtk.Paned):
         if "backup" in errors:
             bibfile.itemlist.page.backup_bar.reveal()
 
-        GLib.idle_add(self.add_watcher, new_name)
+        # Remember the saved state, so that our own write is not reported
+        self.add_watcher(new_name)
         bibfile.created = False
         bibfile.set_unsaved(False)
 
@@ -101,10 +101,22 @@ class MainMenu(Gtk.PopoverMenu):
         preferences = create_menu_item("Preferences", "show_prefs")
         shortcuts = create_menu_item("Keyboard Shortcuts", "show_shortcuts")
         save_all = create_menu_item("Save All", "save_all")
+        restore_backup = create_menu_item("Restore Backup", "restore_backup")
+        bulk_transform = create_menu_item("Transform Entries", "bulk_transform")
+        generate_keys = create_menu_item("Generate Keys", "generate_keys")
+        import_entries = create_menu_item("Import Entries", "import")
+        export = create_menu_item("Export Entries", "export")
         about = create_menu_item("About Bada Bib!", "show_about")
 
         save_section = Gio.Menu()
         save_section.append_item(save_all)
+        save_section.append_item(restore_backup)
+        save_section.append_item(import_entries)
+        save_section.append_item(export)
+
+        entries_section = Gio.Menu()
+        entries_section.append_item(bulk_transform)
+        entries_section.append_item(generate_keys)
 
         settings_section = Gio.Menu()
         settings_section.append_item(manage_strings)
@@ -119,6 +131,7 @@ class MainMenu(Gtk.PopoverMenu):
 
         menu = Gio.Menu()
         menu.append_section(None, save_section)
+        menu.append_section(None, entries_section)
         menu.append_section(None, settings_section)
         menu.append_section(None, preferences_section)
         menu.append_section(None, about_section)
@@ -180,6 +193,7 @@ class FilterPopover(Gtk.Popover):
 
             switch_grid.attach(label, 0, n, 1, 1)
             switch_grid.attach(switch, 1, n, 1, 1)
+            n += 1
 
         # All switch
         if all_count > 0:
@@ -193,6 +207,12 @@ class FilterPopover(Gtk.Popover):
 
             switch_grid.attach(label, 0, 0, 1, 1)
             switch_grid.attach(switch, 1, 0, 1, 1)
+
+            # Number of entries passing filter and search
+            label = Gtk.Label(label=f"Showing {self.itemlist.n_visible} of {all_count}")
+            label.get_style_context().add_class("dim-label")
+            label.set_margin_top(5)
+            switch_grid.attach(label, 0, n, 2, 1)
         else:
             label = Gtk.Label(label="Empty File")
             label.set_sensitive(False)
@@ -214,8 +234,7 @@ class FilterPopover(Gtk.Popover):
                     self.switches[-1].set_state(True)
                 self.track_changes = True
 
-            self.itemlist.invalidate_filter()
-            self.itemlist.reselect_rows()
+            self.itemlist.update_filter()
 
 
 class SortPopover(Gtk.Popover):
@@ -256,6 +275,14 @@ class SortPopover(Gtk.Popover):
             reverse_buttons[value] = radio_button
             vbox.append(radio_button)
 
+        vbox.append(Gtk.Separator())
+
+        relevance_button = Gtk.CheckButton.new_with_label("Relevance First")
+        relevance_button.set_tooltip_text("Show best matches first while searching")
+        relevance_button.set_active(self.itemlist.sort_relevance)
+        relevance_button.connect("toggled", self.on_relevance_clicked)
+        vbox.append(relevance_button)
+
         sort_key_buttons[self.itemlist.sort_key].set_active(True)
         reverse_buttons[self.itemlist.sort_reverse].set_active(True)
 
@@ -265,10 +292,14 @@ class SortPopover(Gtk.Popover):
         is_active = radio_button.get_active()
         if is_active and field != self.itemlist.sort_key:
             self.itemlist.sort_key = field
-            self.itemlist.invalidate_sort()
+            self.itemlist.resort()
 
     def on_order_clicked(self, radio_button, reverse):
         is_active = radio_button.get_active()
         if is_active and self.itemlist.sort_reverse != reverse:
             self.itemlist.sort_reverse = reverse
-            self.itemlist.invalidate_sort()
+            self.itemlist.resort()
+
+    def on_relevance_clicked(self, check_button):
+        self.itemlist.sort_relevance = check_button.get_active()
+        self.itemlist.resort()
@@ -0,0 +1,188 @@
+# names.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import re
+
+from collections import namedtuple
+from functools import lru_cache
+
+from bibtexparser.customization import splitname
+from bibtexparser.customization import InvalidName
+
+from .instrumentation import register_stats
+
+from .latex import convert_latex
+
+
+# Number of distinct name lists whose parsed names are kept. Libraries repeat
+# the same authors in many entries, so a small cache serves most lookups.
+CACHE_SIZE = 16384
+
+# Parts of a name, converted to unicode. Missing parts are empty strings.
+# Names that cannot be split are not valid and kept whole as last name.
+NAME_PARTS = ["first", "von", "last", "jr"]
+Name = namedtuple("Name", NAME_PARTS + ["valid"], defaults=[True])
+
+# Braces and separators of a name list
+SEPARATOR_PATTERN = re.compile(r"[{}]| and ")
+
+
+def normalize_names(value):
+    """Collapse white space, so that equal name lists share a cache entry"""
+    return " ".join(value.split())
+
+
+def split_names(value):
+    """
+    Split a normalized name list along 'and', except within braces, as in
+    '{Barnes and Noble}'.
+
+    Parameters
+    ----------
+    value: str
+
+    Returns
+    -------
+    list of str
+    """
+    if "{" not in value:
+        return value.split(" and ")
+    names = []
+    depth = 0
+    start = 0
+    for match in SEPARATOR_PATTERN.finditer(value):
+        separator = match.group()
+        if separator == "{":
+            depth += 1
+        elif separator == "}":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            names.append(value[start:match.start()])
+            start = match.end()
+    names.append(value[start:])
+    return names
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_normalized_names(value):
+    """
+    Split a normalized name list, see parse_names. Results are cached, use
+    parse_names instead.
+    """
+    names = []
+    # Split before converting LaTeX, braces protect names from splitting
+    for name in split_names(value):
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            parts = splitname(name)
+        except InvalidName:
+            names.append(Name("", "", convert_latex(name), "", False))
+            continue
+        names.append(Name(*(
+            convert_latex(" ".join(parts.get(part, [])))
+            for part in NAME_PARTS
+        )))
+    return tuple(names)
+
+
+def parse_names(value):
+    """
+    Split a name list, such as an author field, into names. This is the
+    shared name parser of sort keys, itemlist rows, key generation and
+    exporters. Results are cached by name list. Safe to run in a thread.
+
+    Parameters
+    ----------
+    value: str
+        Name list with strings expanded, names separated by 'and'
+
+    Returns
+    -------
+    tuple of Name
+        Names that cannot be split are returned as last name only, and are
+        not valid.
+    """
+    if not value:
+        return ()
+    return parse_normalized_names(normalize_names(value))
+
+
+def last_names(value):
+    """
+    Get last names of a name list, for example, for key generation.
+
+    Parameters
+    ----------
+    value: str
+        Name list with strings expanded
+
+    Returns
+    -------
+    list of str
+        Last names. Names that cannot be split, names without last name and
+        'others' are left out.
+    """
+    return [name.last for name in parse_names(value) if name.valid and name.last and name.last != "others"]
+
+
+def format_name(name):
+    """
+    Format a name as 'von Last, Jr, First'.
+
+    Parameters
+    ----------
+    name: Name
+
+    Returns
+    -------
+    str
+    """
+    last = " ".join(part for part in (name.von, name.last) if part)
+    return ", ".join(part for part in (last, name.jr, name.first) if part)
+
+
+def format_names(value):
+    """
+    Reformat and standardize a name list, for example, to show it in the
+    itemlist.
+
+    Parameters
+    ----------
+    value: str
+
+    Returns
+    -------
+    str
+        Names in 'von Last, Jr, First' form, separated by 'and'
+    """
+    return " and ".join(format_name(name) for name in parse_names(value))
+
+
+def get_name_stats():
+    """Hit rate of the name parsing cache."""
+    info = parse_normalized_names.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit rate": f"{info.hits / lookups:.1%}" if lookups else "-",
+        "cached name lists": info.currsize,
+    }
+
+
+register_stats("name parsing", get_name_stats)
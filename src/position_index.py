@@ -0,0 +1,121 @@
+# position_index.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class PositionIndex:
+    """
+    Order-statistics index of the visible rows of a list. Positions are row
+    indices in sort order, including hidden rows. Counting the visible rows
+    before a position, and finding the n-th visible row, take O(log n).
+
+    The index is a Fenwick tree over visibility flags. It must be rebuilt
+    after rows moved, and is marked stale until then.
+    """
+    def __init__(self):
+        """Initialize empty PositionIndex."""
+        self.bits = bytearray()     # Visibility flag of each position
+        self.tree = [0]             # Fenwick tree, 1-based
+        self.stale = True           # Rows moved since the index was built
+
+    def __len__(self):
+        """Number of visible rows"""
+        return self.count_before(len(self.bits))
+
+    def rebuild(self, bits):
+        """
+        Build index from visibility flags in O(n).
+
+        Parameters
+        ----------
+        bits: bytearray
+            Visibility flag (0 or 1) of each position
+        """
+        self.bits = bits
+        tree = [0] + list(bits)
+        size = len(tree)
+        for n in range(1, size):
+            parent = n + (n & -n)
+            if parent < size:
+                tree[parent] += tree[n]
+        self.tree = tree
+        self.stale = False
+
+    def set(self, position, visible):
+        """
+        Update visibility of a single position.
+
+        Parameters
+        ----------
+        position: int
+        visible: bool
+        """
+        delta = int(visible) - self.bits[position]
+        if not delta:
+            return
+        self.bits[position] = int(visible)
+        n = position + 1
+        size = len(self.tree)
+        while n < size:
+            self.tree[n] += delta
+            n += n & -n
+
+    def count_before(self, position):
+        """
+        Count visible rows before a position.
+
+        Parameters
+        ----------
+        position: int
+
+        Returns
+        -------
+        int
+        """
+        count = 0
+        n = position
+        while n > 0:
+            count += self.tree[n]
+            n -= n & -n
+        return count
+
+    def find(self, k):
+        """
+        Find position of the k-th visible row.
+
+        Parameters
+        ----------
+        k: int
+            Zero-based rank among visible rows
+
+        Returns
+        -------
+        int or None
+            Position, None if there are not enough visible rows
+        """
+        if k < 0:
+            return None
+        size = len(self.tree)
+        position = 0
+        step = 1 << size.bit_length()
+        remaining = k + 1
+        while step:
+            n = position + step
+            if n < size and self.tree[n] < remaining:
+                position = n
+                remaining -= self.tree[n]
+            step >>= 1
+        if position >= len(self.bits):
+            return None
+        return position
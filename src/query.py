@@ -0,0 +1,213 @@
+# query.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import re
+
+from math import isfinite
+
+from .config_manager import field_dict
+
+
+# Words of a field value
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Clause of a search string: optional '-', optional 'field:', and a quoted or
+# unquoted value
+CLAUSE_PATTERN = re.compile(r'(-)?(?:([A-Za-z]\w*):)?(?:"([^"]*)"?|(\S+))')
+
+# Year or range of years, '1990', '1990..2000', '1990..' or '..2000'
+YEAR_PATTERN = re.compile(r"(\d*)\.\.(\d*)|(\d+)")
+
+# Short names of fields in search strings
+FIELD_ALIASES = {
+    "key": "ID",
+    "type": "ENTRYTYPE",
+}
+
+
+def tokenize(text):
+    """
+    Split text into lower case terms.
+
+    Parameters
+    ----------
+    text: str
+
+    Returns
+    -------
+    list of str
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TermClause:
+    """
+    Words that must be found in a field, or in any field. Words of a phrase
+    must in addition be found verbatim.
+    """
+    __slots__ = ("field", "text", "words", "phrase", "negated")
+
+    def __init__(self, field, text, negated=False):
+        self.field = field                  # Field name, None for any field
+        self.text = text                    # Lower case search text
+        self.words = tokenize(text)         # Lower case search words
+        self.phrase = self.words != [text]  # Text must be found verbatim
+        self.negated = negated
+
+    def evaluate(self, index):
+        return index.term_bits(self)
+
+    def matches(self, index, item):
+        return index.item_has_terms(item, self)
+
+
+class YearClause:
+    """Year or date within a range, including both ends."""
+    __slots__ = ("low", "high", "negated")
+
+    def __init__(self, low, high, negated=False):
+        self.low = low          # float, -infinity if open
+        self.high = high        # float, infinity if open
+        self.negated = negated
+
+    def evaluate(self, index):
+        return index.year_bits(self.low, self.high)
+
+    def matches(self, index, item):
+        year = index.item_year(item)
+        return isfinite(year) and self.low <= year <= self.high
+
+
+class TypeClause:
+    """
+    Allowed entry types. Entry types not listed in 'known' are allowed if
+    'other' is set.
+    """
+    __slots__ = ("types", "known", "other", "negated")
+
+    def __init__(self, types, known=None, other=False, negated=False):
+        self.types = frozenset(types)   # Allowed lower case entry types
+        self.known = known              # Entry types with their own setting, None for all
+        self.other = other              # Allow entry types not in 'known'
+        self.negated = negated
+
+    def allows(self, entrytype):
+        entrytype = entrytype.lower()
+        if self.known is None or entrytype in self.known:
+            return entrytype in self.types
+        return self.other
+
+    def evaluate(self, index):
+        return index.type_bits(self.allows)
+
+    def matches(self, _index, item):
+        return self.allows(item.entrytype)
+
+
+def parse_clause(field, text, negated):
+    """
+    Compile a field-scoped part of a search string.
+
+    Returns
+    -------
+    TermClause, YearClause or TypeClause
+    """
+    if field == "ENTRYTYPE":
+        return TypeClause({text}, negated=negated)
+    if field == "year":
+        match = YEAR_PATTERN.fullmatch(text)
+        if match:
+            low, high, year = match.groups()
+            if year:
+                low = high = year
+            low = float(low) if low else float("-inf")
+            high = float(high) if high else float("inf")
+            return YearClause(low, high, negated)
+    return TermClause(field, text, negated)
+
+
+class Query:
+    """
+    Parsed search string, for example 'author:knuth year:1990..2000
+    type:book -journal:arxiv'.
+
+    Words without a field must all be found in an entry, and are used to rank
+    matches. Quoted text and words containing punctuation must in addition be
+    found verbatim. 'field:value' restricts a word or quoted text to a field,
+    'year:' also accepts ranges, 'type:' the entry type, and a leading '-'
+    excludes matching entries. All clauses are evaluated on the indexes of a
+    SearchIndex.
+    """
+    __slots__ = ("text", "words", "clauses")
+
+    def __init__(self, text, type_filter=None):
+        """
+        Parse search string.
+
+        Parameters
+        ----------
+        text: str
+        type_filter: TypeClause, optional
+            Entry type filter of the itemlist. The default value is None,
+            all entry types.
+        """
+        self.text = text
+        self.words = []         # Lower case search words for ranking
+        self.clauses = []       # Clauses that must all hold
+
+        for match in CLAUSE_PATTERN.finditer(text):
+            negated, field, quoted, value = match.groups()
+            if quoted is None:
+                value = value.lower()
+            else:
+                value = quoted.lower()
+            if field:
+                name = FIELD_ALIASES.get(field.lower(), field.lower())
+                if name in field_dict or name in FIELD_ALIASES.values():
+                    if value:
+                        self.clauses.append(parse_clause(name, value, bool(negated)))
+                    continue
+                # Not a field, for example a URL
+                value = match.group().lower().lstrip("-")
+            if not value.strip():
+                continue
+            clause = TermClause(None, value, bool(negated))
+            if not negated:
+                self.words.extend(clause.words)
+            if negated or clause.phrase:
+                self.clauses.append(clause)
+
+        if type_filter is not None:
+            self.clauses.append(type_filter)
+
+    def __bool__(self):
+        return bool(self.words or self.clauses)
+
+    def needs_text_index(self):
+        """Check if words or field values are searched."""
+        return bool(self.words) or any(isinstance(clause, TermClause) for clause in self.clauses)
+
+    def needs_years(self):
+        """Check if years are searched."""
+        return any(isinstance(clause, YearClause) for clause in self.clauses)
+
+    def allows_type(self, entrytype):
+        """Check if the type clauses allow an entry type."""
+        for clause in self.clauses:
+            if isinstance(clause, TypeClause) and clause.allows(entrytype) == clause.negated:
+                return False
+        return True
+
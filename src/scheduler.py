@@ -0,0 +1,157 @@
+# scheduler.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from gi.repository import GLib
+
+from time import perf_counter
+
+
+# Time in seconds spent on jobs per main loop iteration, half a frame at 60 Hz
+FRAME_BUDGET = 0.008
+
+
+class Job:
+    """
+    Long running operation split into small steps. Obtain instances via
+    Scheduler.add, never directly.
+    """
+    __slots__ = ("owner", "steps", "total", "done", "on_progress", "on_done", "cancelled")
+
+    def __init__(self, owner, steps, total, on_progress, on_done):
+        self.owner = owner                  # Object the job works on, for cancellation
+        self.steps = steps                  # Iterator, each item is one step of work
+        self.total = total                  # Expected number of steps, 0 if unknown
+        self.done = 0                       # Number of steps done
+        self.on_progress = on_progress      # function(fraction) or None
+        self.on_done = on_done              # function() or None
+        self.cancelled = False
+
+    @property
+    def fraction(self):
+        """Fraction of steps done, between 0 and 1"""
+        if not self.total:
+            return 0.0
+        return min(self.done / self.total, 1.0)
+
+
+class Scheduler:
+    """
+    Cooperative scheduler that runs jobs on the GTK main loop while it is
+    idle. Jobs take turns, and each main loop iteration spends at most the
+    frame budget on them, so that the user interface keeps responding.
+    """
+    def __init__(self, budget=FRAME_BUDGET):
+        """
+        Initialize Scheduler.
+
+        Parameters
+        ----------
+        budget: float, optional
+            Time in seconds per main loop iteration. The default value is
+            FRAME_BUDGET.
+        """
+        self.budget = budget
+        self.jobs = []              # Jobs in the order they take turns
+        self.source_id = None       # Idle source running jobs
+
+    def add(self, owner, steps, total=0, on_progress=None, on_done=None):
+        """
+        Schedule a job.
+
+        Parameters
+        ----------
+        owner: object
+            Object the job works on. All jobs of an owner are cancelled by
+            cancel_jobs.
+        steps: iterable
+            Each iteration does one small step of work. Yielded values are
+            ignored.
+        total: int, optional
+            Expected number of steps for progress reports. The default value
+            is 0, progress unknown.
+        on_progress: function(float), optional
+            Called after each time slice with the fraction of steps done.
+        on_done: function(), optional
+            Called when all steps are done, but not if the job is cancelled.
+
+        Returns
+        -------
+        Job
+        """
+        job = Job(owner, iter(steps), total, on_progress, on_done)
+        self.jobs.append(job)
+        if not self.source_id:
+            self.source_id = GLib.idle_add(self.on_idle)
+        return job
+
+    def cancel(self, job):
+        """Cancel a job. Cancelling a job that is done has no effect."""
+        if job is None:
+            return
+        job.cancelled = True
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def cancel_jobs(self, owner):
+        """Cancel all jobs of an owner."""
+        for job in [job for job in self.jobs if job.owner is owner]:
+            self.cancel(job)
+
+    def on_idle(self):
+        deadline = perf_counter() + self.budget
+        try:
+            while self.jobs and perf_counter() < deadline:
+                # Run the first job for the rest of the slice, then let the
+                # others take their turn
+                job = self.jobs.pop(0)
+                if self.run(job, deadline):
+                    self.jobs.append(job)
+        except Exception:
+            # A failing job must not stop the other jobs
+            self.source_id = None
+            if self.jobs:
+                self.source_id = GLib.idle_add(self.on_idle)
+            raise
+
+        if self.jobs:
+            return GLib.SOURCE_CONTINUE
+        self.source_id = None
+        return GLib.SOURCE_REMOVE
+
+    def run(self, job, deadline):
+        """
+        Run steps of a job until the deadline.
+
+        Returns
+        -------
+        bool
+            True if steps are left
+        """
+        for _ in job.steps:
+            job.done += 1
+            if job.cancelled:
+                return False
+            if perf_counter() >= deadline:
+                if job.on_progress:
+                    job.on_progress(job.fraction)
+                return True
+        if not job.cancelled and job.on_done:
+            job.on_done()
+        return False
+
+
+# Scheduler shared by all itemlists
+scheduler = Scheduler()
@@ -0,0 +1,572 @@
+# search.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import heapq
+
+from array import array
+
+from bisect import bisect_left
+from bisect import bisect_right
+
+from math import inf
+from math import log
+
+from operator import itemgetter
+
+from .query import tokenize
+
+
+# Weight of a term occurrence by field, other fields have weight 1
+FIELD_WEIGHTS = {
+    "ID": 3.0,
+    "title": 2.5,
+    "author": 2.0,
+    "editor": 1.5,
+}
+
+# BM25 parameters: term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+# Score factor of a term that contains the search word, or differs by typos
+SUBSTRING_FACTOR = 0.7
+TYPO_FACTOR = 0.5
+
+
+def trigrams(term, padded=True):
+    """
+    Get trigrams of a term.
+
+    Parameters
+    ----------
+    term: str
+    padded: bool, optional
+        Include trigrams of the term's start and end. The default value is
+        True. Trigrams of a substring of a term are a subset of the term's
+        unpadded trigrams.
+
+    Returns
+    -------
+    set of str
+    """
+    if padded:
+        term = f"  {term} "
+    return {term[n:n+3] for n in range(len(term) - 2)}
+
+
+def max_typos(word):
+    """Number of typos tolerated in a search word of this length."""
+    if len(word) < 4:
+        return 0
+    if len(word) < 8:
+        return 1
+    return 2
+
+
+def edit_distance(word, term, limit):
+    """
+    Optimal string alignment distance of two strings, if it does not exceed
+    a limit. Like the Levenshtein distance, but a swap of two adjacent
+    characters counts as one edit.
+
+    Parameters
+    ----------
+    word: str
+    term: str
+    limit: int
+
+    Returns
+    -------
+    int or None
+        Distance, None if it exceeds the limit
+    """
+    if abs(len(word) - len(term)) > limit:
+        return None
+    before = None
+    previous = list(range(len(term) + 1))
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, other in enumerate(term, 1):
+            distance = min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (char != other))
+            if before and j > 1 and char == term[j-2] and word[i-2] == other:
+                distance = min(distance, before[j-2] + 1)
+            current.append(distance)
+        if min(current) > limit and min(previous) >= limit:
+            return None
+        before, previous = previous, current
+    if previous[-1] > limit:
+        return None
+    return previous[-1]
+
+
+def similarity(word, term):
+    """
+    Score factor of a term for a search word.
+
+    Parameters
+    ----------
+    word: str
+        Search word
+    term: str
+        Indexed term
+
+    Returns
+    -------
+    float
+        1 if equal, less for substrings and typos, 0 if the term does not match
+    """
+    if word == term:
+        return 1.0
+    if word in term:
+        return SUBSTRING_FACTOR
+    limit = max_typos(word)
+    if limit:
+        distance = edit_distance(word, term, limit)
+        if distance is not None:
+            return TYPO_FACTOR * (1 - distance / (len(word) + 1))
+    return 0.0
+
+
+def to_bits(indices):
+    """
+    Build bitset of item indices.
+
+    Parameters
+    ----------
+    indices: iterable of int
+
+    Returns
+    -------
+    int
+        Bit n is set if item n is included
+    """
+    flags = bytearray()
+    for idx in indices:
+        byte = idx >> 3
+        if byte >= len(flags):
+            flags.extend(bytes(byte + 1 - len(flags)))
+        flags[byte] |= 1 << (idx & 7)
+    return int.from_bytes(flags, "little")
+
+
+def iter_bits(bits):
+    """Iterate over the item indices of a bitset."""
+    flags = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for byte, value in enumerate(flags):
+        while value:
+            low = value & -value
+            yield (byte << 3) + low.bit_length() - 1
+            value ^= low
+
+
+class SearchIndex:
+    """
+    Indexes of the items of a BadaBibFile for field-scoped, ranked and typo
+    tolerant search. Queries are evaluated as bitsets of item indices:
+
+    - Words are looked up in inverted postings of the raw and pretty field
+      values, per field and for all fields. Search words are expanded to
+      indexed terms via a trigram index and candidates are verified by edit
+      distance.
+    - Years are looked up in a sorted numeric index.
+    - Entry types are looked up in bitsets per entry type.
+
+    Matches are ranked by BM25 with field weights. Items are indexed on
+    demand and re-indexed when their version changed.
+    """
+    def __init__(self, bibfile):
+        """
+        Initialize empty SearchIndex.
+
+        Parameters
+        ----------
+        bibfile: BadaBibFile
+            File whose items are indexed
+        """
+        self.bibfile = bibfile
+        self.docs = []                  # {term: weighted frequency} of each item, by index
+        self.doc_fields = []            # {field: terms} of each item, by index
+        self.versions = array("q")      # Indexed version of each item, -1 if not indexed
+        self.lengths = array("d")       # Weighted number of terms of each item
+        self.total_length = 0.0
+        self.n_docs = 0
+        self.postings = {}              # {term: {item index: weighted frequency}}
+        self.field_postings = {}        # {field: {term: set of item indices}}
+        self.term_trigrams = {}         # {trigram: set of terms}
+        self.type_cache = None          # (item versions, {entry type: bitset})
+        self.year_cache = None          # (year changes, sorted years, item indices)
+        self.query = None               # Query of the last search
+        self.results = {}               # {item index: score} of matches of the last search
+        self.result_versions = array("q")   # Item versions the results were computed for
+
+    def is_current(self, item):
+        """Check if an item is indexed with its current content."""
+        return item.idx < len(self.versions) and self.versions[item.idx] == item.version
+
+    def update(self, item):
+        """
+        Index an item, unless it is indexed already.
+
+        Parameters
+        ----------
+        item: BadaBibItem
+
+        Returns
+        -------
+        bool
+            True if the item was (re-)indexed
+        """
+        if self.is_current(item):
+            return False
+
+        idx = item.idx
+        while len(self.docs) <= idx:
+            self.docs.append(None)
+            self.doc_fields.append(None)
+            self.versions.append(-1)
+            self.lengths.append(0.0)
+        if self.docs[idx] is not None:
+            self.remove(idx)
+
+        doc = {}
+        doc_fields = {}
+        for field in item.entry:
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            terms = tokenize(item.pretty_field(field))
+            raw_terms = set(tokenize(item.raw_field(field))).difference(terms)
+            terms.extend(raw_terms)
+            for term in terms:
+                doc[term] = doc.get(term, 0.0) + weight
+            doc_fields[field] = frozenset(terms)
+
+        for term, frequency in doc.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                for trigram in trigrams(term):
+                    self.term_trigrams.setdefault(trigram, set()).add(term)
+            posting[idx] = frequency
+        for field, terms in doc_fields.items():
+            field_posting = self.field_postings.setdefault(field, {})
+            for term in terms:
+                field_posting.setdefault(term, set()).add(idx)
+
+        self.docs[idx] = doc
+        self.doc_fields[idx] = doc_fields
+        self.versions[idx] = item.version
+        self.lengths[idx] = sum(doc.values())
+        self.total_length += self.lengths[idx]
+        self.n_docs += 1
+        return True
+
+    def remove(self, idx):
+        for term in self.docs[idx]:
+            posting = self.postings[term]
+            del posting[idx]
+            if not posting:
+                del self.postings[term]
+                for trigram in trigrams(term):
+                    self.term_trigrams[trigram].discard(term)
+        for field, terms in self.doc_fields[idx].items():
+            field_posting = self.field_postings[field]
+            for term in terms:
+                field_posting[term].discard(idx)
+                if not field_posting[term]:
+                    del field_posting[term]
+        self.total_length -= self.lengths[idx]
+        self.n_docs -= 1
+        self.docs[idx] = None
+        self.doc_fields[idx] = None
+
+    def expand(self, word):
+        """
+        Find indexed terms matching a search word.
+
+        Parameters
+        ----------
+        word: str
+
+        Returns
+        -------
+        dict
+            {term: similarity}
+        """
+        inner = trigrams(word, padded=False)
+        if inner:
+            # Substrings share all inner trigrams, typos most padded ones. A
+            # swap of two adjacent characters changes up to four trigrams.
+            padded = trigrams(word)
+            counts = {}
+            for trigram in padded | inner:
+                for term in self.term_trigrams.get(trigram, ()):
+                    counts[term] = counts.get(term, 0) + 1
+            required = min(len(inner), len(padded) - 4 * max_typos(word))
+            candidates = [term for term, count in counts.items() if count >= required]
+        else:
+            # Too short for trigrams
+            candidates = [term for term in self.postings if word in term]
+
+        terms = {}
+        for term in candidates:
+            factor = similarity(word, term)
+            if factor:
+                terms[term] = factor
+        return terms
+
+    def bm25(self, frequency, idx, document_frequency):
+        average = self.total_length / max(self.n_docs, 1)
+        idf = log(1 + (self.n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = K1 * (1 - B + B * self.lengths[idx] / max(average, 1e-9))
+        return idf * frequency * (K1 + 1) / (frequency + norm)
+
+    def all_bits(self):
+        return (1 << len(self.bibfile.items)) - 1
+
+    def term_bits(self, clause):
+        """
+        Evaluate a TermClause. Items must be indexed with update first.
+
+        Returns
+        -------
+        int
+            Bitset of matching items
+        """
+        bits = self.all_bits()
+        for word in clause.words:
+            indices = set()
+            if clause.field is None:
+                for term in self.expand(word):
+                    indices.update(self.postings[term])
+            else:
+                field_posting = self.field_postings.get(clause.field, {})
+                for term in self.expand(word):
+                    indices.update(field_posting.get(term, ()))
+            bits &= to_bits(indices)
+            if not bits:
+                return 0
+        if clause.phrase:
+            # Verify candidates only
+            items = self.bibfile.items
+            bits = to_bits(idx for idx in iter_bits(bits) if self.contains_text(items[idx], clause))
+        return bits
+
+    def type_bits(self, allows):
+        """
+        Evaluate an entry type predicate.
+
+        Parameters
+        ----------
+        allows: function(str) -> bool
+
+        Returns
+        -------
+        int
+            Bitset of items of allowed entry types
+        """
+        items = self.bibfile.items
+        versions = array("q", (item.version for item in items))
+        if self.type_cache is None or self.type_cache[0] != versions:
+            indices = {}
+            for item in items:
+                indices.setdefault(item.entrytype.lower(), []).append(item.idx)
+            self.type_cache = (versions, {entrytype: to_bits(idx) for entrytype, idx in indices.items()})
+        bits = 0
+        for entrytype, type_bits in self.type_cache[1].items():
+            if allows(entrytype):
+                bits |= type_bits
+        return bits
+
+    def year_bits(self, low, high):
+        """
+        Find items with a year within a range.
+
+        Parameters
+        ----------
+        low, high: float
+            Range, including both ends
+
+        Returns
+        -------
+        int
+            Bitset of matching items
+        """
+        sort_keys = self.bibfile.sort_keys
+        if self.year_cache is None or self.year_cache[0] != sort_keys.year_changes:
+            self.bibfile.load_sort_values("year")
+            order = sorted(range(len(sort_keys.years)), key=sort_keys.years.__getitem__)
+            years = array("d", (sort_keys.years[idx] for idx in order))
+            self.year_cache = (sort_keys.year_changes, years, order)
+        _changes, years, order = self.year_cache
+        # Entries without a year sort last as infinity, open ranges leave them out
+        end = bisect_left(years, inf)
+        return to_bits(order[bisect_left(years, low, 0, end):bisect_right(years, high, 0, end)])
+
+    def item_year(self, item):
+        item.entry      # Sort keys of lazily loaded entries are set on parsing
+        return self.bibfile.sort_keys.years[item.idx]
+
+    def item_has_terms(self, item, clause):
+        """Evaluate a TermClause for a single item."""
+        if clause.field is None:
+            fields = list(item.entry)
+        elif clause.field in item.entry:
+            fields = [clause.field]
+        else:
+            return False
+        terms = set()
+        for field in fields:
+            terms.update(tokenize(item.pretty_field(field)))
+            terms.update(tokenize(item.raw_field(field)))
+        for word in clause.words:
+            if not any(similarity(word, term) for term in terms):
+                return False
+        return not clause.phrase or self.contains_text(item, clause)
+
+    def search(self, query):
+        """
+        Evaluate a query for all items. Items must be indexed with update
+        first, if the query needs the text index.
+
+        Parameters
+        ----------
+        query: Query
+
+        Returns
+        -------
+        dict
+            {item index: score} of all matching items. Scores are 0 if the
+            query has no words to rank by.
+        """
+        bits = self.all_bits()
+        for clause in query.clauses:
+            clause_bits = clause.evaluate(self)
+            if clause.negated:
+                bits &= ~clause_bits
+            else:
+                bits &= clause_bits
+
+        if query.words:
+            scores = None
+            for word in query.words:
+                word_scores = {}
+                for term, factor in self.expand(word).items():
+                    posting = self.postings[term]
+                    for idx, frequency in posting.items():
+                        score = factor * self.bm25(frequency, idx, len(posting))
+                        if score > word_scores.get(idx, 0.0):
+                            word_scores[idx] = score
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {idx: score + word_scores[idx] for idx, score in scores.items() if idx in word_scores}
+                if not scores:
+                    break
+            if query.clauses:
+                flags = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+                scores = {
+                    idx: score for idx, score in scores.items()
+                    if idx >> 3 < len(flags) and flags[idx >> 3] >> (idx & 7) & 1
+                }
+        else:
+            scores = dict.fromkeys(iter_bits(bits), 0.0)
+
+        self.query = query
+        self.result_versions = array("q", (item.version for item in self.bibfile.items))
+        self.results = scores
+        return scores
+
+    def top(self, query, k):
+        """
+        Get best matching items.
+
+        Parameters
+        ----------
+        query: Query
+        k: int
+            Maximum number of results
+
+        Returns
+        -------
+        list of tuple
+            (item, score), best first. Deleted items are skipped.
+        """
+        items = self.bibfile.items
+        if query.needs_text_index():
+            for item in items:
+                self.update(item)
+        scores = self.search(query)
+        results = ((items[idx], score) for idx, score in scores.items() if not items[idx].deleted)
+        return heapq.nlargest(k, results, key=itemgetter(1))
+
+    def score(self, item, query):
+        """
+        Evaluate a query for a single item. Uses the result of the last search
+        if the item did not change since, and evaluates the clauses on the
+        item itself otherwise.
+
+        Parameters
+        ----------
+        item: BadaBibItem
+        query: Query
+
+        Returns
+        -------
+        float or None
+            Score, None if the item does not match
+        """
+        idx = item.idx
+        if query is self.query and idx < len(self.result_versions) and self.result_versions[idx] == item.version:
+            return self.results.get(idx)
+
+        score = 0.0
+        for clause in query.clauses:
+            if clause.matches(self, item) == clause.negated:
+                score = None
+                break
+        if score is not None and query.words:
+            self.update(item)
+            doc = self.docs[idx]
+            for word in query.words:
+                best = 0.0
+                for term, frequency in doc.items():
+                    factor = similarity(word, term)
+                    if factor:
+                        best = max(best, factor * self.bm25(frequency, idx, len(self.postings[term])))
+                if not best:
+                    score = None
+                    break
+                score += best
+
+        if query is self.query and idx < len(self.result_versions):
+            self.result_versions[idx] = item.version
+            if score is None:
+                self.results.pop(idx, None)
+            else:
+                self.results[idx] = score
+        return score
+
+    @staticmethod
+    def contains_text(item, clause):
+        """Check if the text of a TermClause is found verbatim."""
+        fields = [clause.field] if clause.field else list(item.entry)
+        for field in fields:
+            if field not in item.entry:
+                continue
+            if clause.text in item.raw_field(field).lower():
+                return True
+            if clause.text in item.pretty_field(field).lower():
+                return True
+        return False
@@ -14,6 +14,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from gi.repository import Gtk
+
 from .config_manager import get_remember_strings
 from .config_manager import get_window_geom
 from .config_manager import set_window_geom
@@ -25,6 +27,10 @@ from .config_manager import get_string_imports
 from .config_manager import set_string_imports
 
 from .dialogs import WarningDialog
+from .dialogs import RecoverChangesDialog
+
+from .journal import collect_journals
+from .journal import discard_journal
 
 
 class SessionManager:
@@ -37,7 +43,30 @@ class SessionManager:
         if get_remember_strings():
             self.restore_string_imports()
         if arg_files is None:
-            arg_files = []
+            arg_files = {}
+
+        # Offer to recover unsaved changes if the last session crashed
+        journals = collect_journals()
+        if journals:
+            dialog = RecoverChangesDialog(self.main_widget.get_root(), list(journals))
+            dialog.connect("response", self.on_recover_response, journals, arg_files)
+            dialog.show()
+        else:
+            self.restore_open_files(arg_files)
+
+    def on_recover_response(self, dialog, response, journals, arg_files):
+        dialog.destroy()
+        if response == Gtk.ResponseType.YES:
+            self.main_widget.store.recovered_journals.update(journals)
+            # Make sure all files with recovered changes are opened
+            saved_files = get_open_files()
+            arg_files = dict(arg_files)
+            for name in journals:
+                if name not in saved_files and name not in arg_files:
+                    arg_files[name] = None
+        else:
+            for path in journals.values():
+                discard_journal(path)
         self.restore_open_files(arg_files)
 
     def save(self):
@@ -70,7 +99,7 @@ class SessionManager:
         if open_files:
             names = list(open_files.keys())
             states = list(open_files.values())
-            self.main_widget.open_files(names, states, open_tab=open_tab)
+            self.main_widget.open_files(names, states, open_tab=open_tab, defer=True)
         else:
             self.main_widget.new_file()
 
@@ -78,9 +107,14 @@ class SessionManager:
         open_files = {}
         tabview_pages = self.main_widget.tabbox.tabview.get_pages()
         for tabview_page in tabview_pages:
-            itemlist = tabview_page.get_child().itemlist
+            page = tabview_page.get_child()
+            itemlist = page.itemlist
             if itemlist and not itemlist.bibfile.created:
                 open_files[itemlist.bibfile.name] = itemlist.state_to_string()
+            # Remember files of pages that were never shown
+            elif page.deferred:
+                name, state = page.deferred
+                open_files[name] = state or ""
         set_open_files(open_files)
 
     def save_open_tab(self):
@@ -0,0 +1,249 @@
+# sort_store.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import re
+
+from array import array
+
+from .config_manager import sort_fields
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# maximum char to sort entries to the end of a list
+MAX_CHAR = chr(0x10FFFF)
+
+# First number in a year or date field
+YEAR_PATTERN = re.compile(r"\d+")
+
+
+def parse_year(value):
+    """
+    Parse year from a sort key of the year field.
+
+    Parameters
+    ----------
+    value: str
+
+    Returns
+    -------
+    float
+        Year, infinity if the value does not contain a number
+    """
+    match = YEAR_PATTERN.search(value)
+    if match:
+        return float(match.group())
+    return float("inf")
+
+
+def dense_ranks(column):
+    """
+    Rank values of a column. Equal values share a rank.
+
+    Parameters
+    ----------
+    column: list
+
+    Returns
+    -------
+    list of int
+        Rank of each value
+    """
+    order = sorted(range(len(column)), key=column.__getitem__)
+    ranks = [0] * len(column)
+    rank = -1
+    previous = None
+    for n, idx in enumerate(order):
+        value = column[idx]
+        if n == 0 or value != previous:
+            rank += 1
+            previous = value
+        ranks[idx] = rank
+    return ranks
+
+
+class SortKeyStore:
+    """
+    Columnar store of the sort keys of all items of a BadaBibFile, indexed by
+    item index. Orderings are computed for all items at once and cached as
+    ranks, so that comparing two items is a lookup. Items changed since the
+    ordering was computed are compared by their keys.
+    """
+    def __init__(self):
+        """Initialize SortKeyStore."""
+        self.columns = {field: [] for field in sort_fields}     # {field: list of str}
+        self.years = array("d")     # Numeric years, infinity if missing
+        self.year_changes = 0       # Incremented whenever a year changes
+        self.column_ranks = {}      # {field: list of int}, cached dense ranks
+        self.order_key = None       # (field, reverse) of cached ordering
+        self.order_cache = None     # Cached ordering, list of item indices
+        self.ranks = None           # Position of each item in cached ordering
+        self.dirty = set()          # Items changed since ordering was computed
+
+    def __len__(self):
+        return len(self.columns["ID"])
+
+    def set(self, idx, field, value):
+        """
+        Set sort key of an item. Keys of new items are appended.
+
+        Parameters
+        ----------
+        idx: int
+            Item index
+        field: str
+            One of sort_fields
+        value: str
+            Sort key
+        """
+        column = self.columns[field]
+        if idx == len(column):
+            column.append(value)
+            if field == "year":
+                self.years.append(parse_year(value))
+                self.year_changes += 1
+        else:
+            if column[idx] == value:
+                return
+            column[idx] = value
+            if field == "year":
+                self.years[idx] = parse_year(value)
+                self.year_changes += 1
+        self.column_ranks.pop(field, None)
+        self.dirty.add(idx)
+
+    def get(self, idx, field):
+        """Get sort key of an item."""
+        return self.columns[field][idx]
+
+    def has_key(self, idx):
+        """Check if an item has a BibTeX key. Items without keys come first."""
+        return self.columns["ID"][idx] != MAX_CHAR
+
+    def item_key(self, idx, field):
+        """Full sort key of an item, used for items changed since last ordering."""
+        if field == "year":
+            return (self.years[idx], self.columns["year"][idx], self.columns["ID"][idx])
+        return (self.columns[field][idx], self.columns["ID"][idx])
+
+    def get_column_ranks(self, field):
+        if field not in self.column_ranks:
+            self.column_ranks[field] = dense_ranks(self.columns[field])
+        return self.column_ranks[field]
+
+    def compute_order(self, field, reverse):
+        """
+        Order all items by a field. Items without BibTeX key come first,
+        ties are broken by BibTeX key.
+
+        Parameters
+        ----------
+        field: str
+        reverse: bool
+
+        Returns
+        -------
+        list of int
+            Item indices in sort order
+        """
+        n = len(self)
+        id_ranks = self.get_column_ranks("ID")
+        value_ranks = self.get_column_ranks(field)
+        no_key = [not self.has_key(idx) for idx in range(n)]
+        sign = -1 if reverse else 1
+
+        if numpy is not None:
+            keys = [sign * numpy.array(id_ranks), sign * numpy.array(value_ranks)]
+            if field == "year":
+                keys.append(sign * numpy.frombuffer(self.years, dtype=numpy.float64))
+            keys.append(numpy.array(no_key, dtype=bool) * -1)
+            # numpy.lexsort uses the last key as primary key
+            order = numpy.lexsort(keys).tolist()
+        else:
+            if field == "year":
+                years = self.years
+                def key(idx):
+                    return (not no_key[idx], sign * years[idx], sign * value_ranks[idx], sign * id_ranks[idx])
+            else:
+                def key(idx):
+                    return (not no_key[idx], sign * value_ranks[idx], sign * id_ranks[idx])
+            order = sorted(range(n), key=key)
+
+        return order
+
+    def order(self, field, reverse):
+        """
+        Get cached ordering, recompute it if the sort field or direction
+        changed, or if items changed since.
+
+        Parameters
+        ----------
+        field: str
+        reverse: bool
+
+        Returns
+        -------
+        list of int
+            Item indices in sort order
+        """
+        if self.order_key != (field, reverse) or self.dirty or self.ranks is None:
+            order = self.compute_order(field, reverse)
+            ranks = [0] * len(order)
+            for position, idx in enumerate(order):
+                ranks[idx] = position
+            self.ranks = ranks
+            self.order_cache = order
+            self.order_key = (field, reverse)
+            self.dirty.clear()
+        return self.order_cache
+
+    def compare(self, idx1, idx2, field, reverse):
+        """
+        Compare two items, like a sort function of Gtk.ListBox.
+
+        Parameters
+        ----------
+        idx1, idx2: int
+            Item indices
+        field: str
+        reverse: bool
+
+        Returns
+        -------
+        int
+            Negative if the first item comes first, positive otherwise
+        """
+        if self.order_key != (field, reverse) or self.ranks is None:
+            self.order(field, reverse)
+
+        # Items without key come first, irrespective of sort order
+        has_key1 = self.has_key(idx1)
+        if has_key1 != self.has_key(idx2):
+            return 1 if has_key1 else -1
+
+        # Use ranks of cached ordering, unless items changed since
+        if idx1 not in self.dirty and idx2 not in self.dirty and idx1 < len(self.ranks) and idx2 < len(self.ranks):
+            return self.ranks[idx1] - self.ranks[idx2]
+
+        key1 = self.item_key(idx1, field)
+        key2 = self.item_key(idx2, field)
+        if key1 == key2:
+            return idx1 - idx2
+        comp = 1 if key1 > key2 else -1
+        return -comp if reverse else comp
@@ -14,10 +14,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from gi.repository import Gio
+
+from os import replace
+
 from os.path import split
 from os.path import exists
 
-from shutil import copyfile
+from shutil import copymode
 
 from bibtexparser.bparser import BibTexParser
 from bibtexparser.bwriter import BibTexWriter
@@ -33,36 +37,19 @@ from .config_manager import get_create_backup
 
 from .bibfile import BadaBibFile
 
+from .backup import backup_in_background
+from .backup import wait_for_backup
+from .backup import create_backup
 
-BACKUP_TAG = "% Bada Bib! Backup File"
-
-
-def has_backup_tag(filename):
-    try:
-        with open(filename, 'r') as file:
-            tag = file.read(len(BACKUP_TAG))
-        return tag == BACKUP_TAG
-    except OSError:
-        return False
+from .journal import Journal
+from .journal import discard_journal
+from .journal import replay_journal
 
+from .lazy import LazyIndex
+from .lazy import use_lazy_loading
 
-def backup_file(name):
-    backup = name + ".bak"
-    if exists(backup) and not has_backup_tag(backup):
-        return False
 
-    try:
-        if has_backup_tag(name):
-            copyfile(name, backup)
-        else:
-            with open(name, 'r') as infile, open(backup, 'w+') as outfile:
-                outfile.write(BACKUP_TAG + "\n\n")
-                for line in infile:
-                    outfile.write(line)
-    except OSError:
-        return False
-
-    return True
+BACKUP_TAG = "% Bada Bib! Backup File"
 
 
 def get_shortest_unique_names(files):
@@ -91,6 +78,7 @@ class BadaBibStore:
         self.bibfiles = {}
         self.string_files = {}
         self.global_strings = {}
+        self.recovered_journals = {}    # {file name: journal of crashed session}
 
     @staticmethod
     def get_default_parser():
@@ -115,30 +103,68 @@ class BadaBibStore:
             return ["file_open"]
 
         try:
-            # try parsing
-            with open(name) as bibtex_file:
+            lazy_index = None
+            if use_lazy_loading(name):
+                # index entries, only parse strings, comments and preambles
+                try:
+                    lazy_index = LazyIndex(name)
+                except ValueError:
+                    # entries cannot be told apart or are not valid UTF-8,
+                    # parse the whole file, which reports invalid UTF-8
+                    lazy_index = None
+            if lazy_index is not None:
                 parser = self.get_default_parser()
                 try:
-                    database = parser.parse_file(bibtex_file)
+                    database = parser.parse(lazy_index.header_text())
                 except UnicodeDecodeError:
+                    lazy_index.close()
                     return ["error", "parse_error"]
+            else:
+                # try parsing
+                with open(name) as bibtex_file:
+                    parser = self.get_default_parser()
+                    try:
+                        database = parser.parse_file(bibtex_file)
+                    except UnicodeDecodeError:
+                        return ["error", "parse_error"]
 
             # initialize bibfile
-            bibfile = BadaBibFile(self, name, database)
+            bibfile = BadaBibFile(self, name, database, lazy_index=lazy_index)
             self.bibfiles[name] = bibfile
             self.update_global_strings(bibfile)
             self.update_short_names()
 
-            # remove backup tags, if present
+            # remove backup tags of old .bak-files, if present
             while BACKUP_TAG in database.comments:
                 database.comments.remove(BACKUP_TAG)
 
+            # back up file in the background, unless it is empty
+            bibfile.backup_on_save = False
+            if get_create_backup() and bibfile.items:
+                backup_in_background(name)
+
+            status = []
+
+            # replay unsaved changes of a crashed session, if requested
+            records = []
+            journal_path = self.recovered_journals.pop(name, None)
+            if journal_path:
+                records = replay_journal(bibfile, journal_path)
+                if records:
+                    bibfile.unsaved = True
+                    status.append("recovered")
+                else:
+                    status.append("recovery_failed")
+
+            bibfile.journal = Journal(name, bibfile.items, records)
+            if journal_path:
+                discard_journal(journal_path)
+
             # check if file contain bibtex entries
-            if len(bibfile.database.entries) == 0:
-                bibfile.backup_on_save = False
-                return ["empty"]
+            if not bibfile.items:
+                status.append("empty")
 
-            return []
+            return status
 
         except OSError:
             return ["error", "file_error"]
@@ -146,6 +172,7 @@ class BadaBibStore:
     def rename_file(self, old_name, new_name):
         bibfile = self.bibfiles.pop(old_name)
         bibfile.update_filename(new_name)
+        bibfile.backup_on_save = True
         self.bibfiles[new_name] = bibfile
         self.update_short_names()
 
@@ -166,34 +193,67 @@ class BadaBibStore:
 
         return bibfile
 
-    def save_file(self, name):
+    def backup_before_save(self, name, callback):
+        # make sure the backup is complete before overwriting the file, or
+        # back up files that were not opened in this session. Compressing
+        # takes a while for large files, so wait and back up in a thread.
         bibfile = self.bibfiles[name]
-        errors = []
+        back_up = get_create_backup() and bibfile.backup_on_save
+        bibfile.backup_on_save = False
 
-        # create backup, if desired
-        backup = True
-        if get_create_backup() and bibfile.backup_on_save:
-            bibfile.backup_on_save = False
-            if exists(name + ".bak"):
-                backup = backup_file(name + ".bak")
-            backup = backup and backup_file(name)
+        def backup_thread(task, _obj, _data, _cancellable):
+            backup = wait_for_backup(name)
+            if back_up and exists(name):
+                backup = create_backup(name)
+            task.return_value(backup)
+
+        def on_backed_up(_obj, task):
+            success, backup = task.propagate_value()
+            callback(success and backup)
+
+        task = Gio.Task.new(None, None, on_backed_up)
+        task.run_in_thread(backup_thread)
+
+    def save_file(self, name, backup=True):
+        bibfile = self.bibfiles[name]
+        errors = []
 
         if not backup:
             errors.append("backup")
 
         try:
-            with open(name, "w") as file:
-                file.seek(0)
-                file.write(bibfile.to_text())
-                file.truncate()
+            if bibfile.lazy_index:
+                # the file is mapped into memory and must not be overwritten
+                # in place, replace it instead
+                text = bibfile.to_text()
+                temp_name = name + ".saving"
+                with open(temp_name, "w") as file:
+                    file.write(text)
+                if exists(name):
+                    copymode(name, temp_name)
+                replace(temp_name, name)
+            else:
+                with open(name, "w") as file:
+                    file.seek(0)
+                    file.write(bibfile.to_text())
+                    file.truncate()
         except OSError:
             errors.append("save")
+        else:
+            # saved file contains all changes, start journal over
+            saved_items = [item for item in bibfile.ordered_items() if not item.deleted]
+            if bibfile.journal:
+                bibfile.journal.reset(name, saved_items)
+            else:
+                bibfile.journal = Journal(name, saved_items)
 
         return errors
 
     def remove_file(self, name):
         if name in self.bibfiles:
             bibfile = self.bibfiles.pop(name)
+            if bibfile.journal:
+                bibfile.journal.close()
             bibfile.unref()
 
     def get_state_strings(self):
@@ -0,0 +1,117 @@
+# transform.py
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from gi.repository import Gio
+
+from .customization import title_case
+from .customization import upper_case
+from .customization import lower_case
+from .customization import protect_caps
+from .customization import sanitize_range
+from .customization import convert_to_unicode
+from .customization import convert_to_latex
+
+
+# Customizations available for bulk transformations, {label: function}
+TRANSFORMS = {
+    "Title Case": title_case,
+    "Upper Case": upper_case,
+    "Lower Case": lower_case,
+    "Protect Upper Case": protect_caps,
+    "Sanitize Ranges": sanitize_range,
+    "Convert to Unicode": convert_to_unicode,
+    "Convert to LaTeX": convert_to_latex,
+}
+
+
+def compute_transform(func, values, bibstrings, cancellable=None):
+    """
+    Apply customization to many values. Safe to run in a thread, as it does
+    not touch items or widgets.
+
+    Parameters
+    ----------
+    func: function(str, set) -> str or None
+        Customization, see customization.py
+    values: list of str
+        Raw field values
+    bibstrings: set of str
+        Names of all strings defined for the file
+    cancellable: Gio.Cancellable, optional
+        Stop early if cancelled. The default value is None.
+
+    Returns
+    -------
+    list of tuple
+        (index, new value) for all values that changed
+    """
+    results = []
+    for n, value in enumerate(values):
+        if cancellable and n % 1000 == 0 and cancellable.is_cancelled():
+            break
+        new_value = func(value, bibstrings)
+        if new_value is not None and new_value != value:
+            results.append((n, new_value))
+    return results
+
+
+def transform_items(items, field, func, bibstrings, callback):
+    """
+    Compute bulk transformation of a field in a thread.
+
+    Parameters
+    ----------
+    items: list of BadaBibItem
+        Items to transform. Items without the field are skipped.
+    field: str
+    func: function(str, set) -> str or None
+        Customization, see customization.py
+    bibstrings: dict
+        Strings defined for the file
+    callback: function(list of tuple)
+        Called on the main loop with the edits (item, field, old value,
+        new value) that change an item. Empty if the transformation failed
+        or was cancelled.
+
+    Returns
+    -------
+    Gio.Cancellable
+    """
+    # Collect values on the main loop, items must not be touched by the thread
+    items = [item for item in items if field in item.entry]
+    values = [item.raw_field(field) for item in items]
+    string_names = frozenset(bibstrings)
+
+    def transform_thread(task, _obj, _data, cancellable):
+        task.return_value(compute_transform(func, values, string_names, cancellable))
+
+    def on_transformed(_obj, task):
+        success, results = task.propagate_value()
+        if not success or cancellable.is_cancelled():
+            callback([])
+            return
+        # Skip items that were closed or edited in the meantime
+        edits = [
+            (items[n], field, values[n], new_value)
+            for n, new_value in results
+            if items[n].bibfile and items[n].raw_field(field) == values[n]
+        ]
+        callback(edits)
+
+    cancellable = Gio.Cancellable()
+    task = Gio.Task.new(None, cancellable, on_transformed)
+    task.run_in_thread(transform_thread)
+    return cancellable
@@ -14,27 +14,226 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from gi.repository import Gio
+from os import stat
 
+from hashlib import sha1
 
-DELETED_EVENTS = (Gio.FileMonitorEvent.MOVED_OUT, Gio.FileMonitorEvent.DELETED)
-CHANGED_EVENTS = (Gio.FileMonitorEvent.CHANGED, Gio.FileMonitorEvent.RENAMED)
+from gi.repository import Gio, GLib
+
+
+# Events are coalesced until the file has been quiet for this many milliseconds
+SETTLE_DELAY = 500
+
+# Chunk size used when hashing files
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_signature(name):
+    """
+    Get cheap signature of a file on disk.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the file
+
+    Returns
+    -------
+    tuple or None
+        Modification time and size of the file, None if the file is missing
+    """
+    try:
+        stat_result = stat(name)
+    except OSError:
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def get_digest(name):
+    """
+    Hash file content. Intended to be run in a thread.
+
+    Parameters
+    ----------
+    name: str
+        Full path of the file
+
+    Returns
+    -------
+    str or None
+        Hex digest of the file content, None if the file cannot be read
+    """
+    digest = sha1()
+    try:
+        with open(name, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
 
 
 class Watcher:
-    def __init__(self, main_widget, name):
-        self.main_widget = main_widget
+    """
+    Watch a single file for changes made by other applications. Bursts of
+    events are coalesced, writes by Bada Bib! itself are recognized by
+    comparing signature and content hash with the last known state, and the
+    monitor stays armed after each event.
+    """
+    def __init__(self, service, name):
+        """
+        Initialize Watcher.
+
+        Parameters
+        ----------
+        service: WatcherService
+            Service managing this watcher
+        name: str
+            Full path of the watched file
+        """
+        self.service = service
         self.name = name
+        self.monitor = None         # Gio.FileMonitor of the watched file
+        self.timeout_id = None      # Pending settle timeout
+        self.signature = None       # (mtime, size) of last known state
+        self.digest = None          # Content hash of last known state
+        self.hash_count = 0         # Number of hash requests, the latest one wins
+        self.active = True          # False once the watcher was removed
+
+        self.arm()
+        self.record_state()
 
-        gfile = Gio.File.new_for_path(name)
+    def arm(self):
+        """(Re-)create the file monitor."""
+        if self.monitor:
+            self.monitor.cancel()
+        gfile = Gio.File.new_for_path(self.name)
         self.monitor = gfile.monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
         self.monitor.connect("changed", self.on_changed)
 
-    def on_changed(self, file_monitor, _file, _other_file, event_type):
-        file_monitor.cancel()
-        self.main_widget.declare_file_created(self.name)
-        page = self.main_widget.store.bibfiles[self.name].itemlist.page
-        if event_type in CHANGED_EVENTS:
+    def cancel(self):
+        """Stop watching the file."""
+        self.active = False
+        if self.timeout_id:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = None
+        if self.monitor:
+            self.monitor.cancel()
+            self.monitor = None
+
+    def record_state(self):
+        """
+        Remember the current state of the file as the known one, for example,
+        right after Bada Bib! saved it. The signature is read immediately, the
+        content hash in a thread.
+        """
+        self.signature = get_signature(self.name)
+        self.digest = None
+        self.hash_file(self.on_state_hashed)
+
+    def hash_file(self, callback):
+        """
+        Hash the watched file in a thread. Only the latest request calls back,
+        results of older ones describe an outdated state of the file.
+
+        Parameters
+        ----------
+        callback: function(str or None)
+            Called on the main loop with the digest
+        """
+        name = self.name
+        self.hash_count += 1
+        request = self.hash_count
+
+        def hash_thread(task, _obj, _data, _cancellable):
+            task.return_value(get_digest(name))
+
+        def on_hashed(_obj, task):
+            success, digest = task.propagate_value()
+            if self.active and request == self.hash_count:
+                callback(digest if success else None)
+
+        task = Gio.Task.new(None, None, on_hashed)
+        task.run_in_thread(hash_thread)
+
+    def on_state_hashed(self, digest):
+        self.digest = digest
+
+    def on_changed(self, _file_monitor, _file, _other_file, _event_type):
+        """Coalesce events by (re-)starting the settle timeout."""
+        if self.timeout_id:
+            GLib.source_remove(self.timeout_id)
+        self.timeout_id = GLib.timeout_add(SETTLE_DELAY, self.on_settled)
+
+    def on_settled(self):
+        """
+        Inspect the file once events have settled. Decide based on the state
+        on disk rather than on the last event, which is unreliable for
+        editors that save by renaming temporary files.
+        """
+        self.timeout_id = None
+        signature = get_signature(self.name)
+
+        if signature is None:
+            self.service.notify_deleted(self.name)
+        elif signature != self.signature:
+            self.hash_file(self.on_changed_hashed)
+
+        return GLib.SOURCE_REMOVE
+
+    def on_changed_hashed(self, digest):
+        """Compare content with last known state and notify on changes."""
+        self.signature = get_signature(self.name)
+        if digest is None or digest != self.digest:
+            self.digest = digest
+            self.service.notify_changed(self.name)
+        # The file might have been replaced rather than modified
+        self.arm()
+
+
+class WatcherService:
+    """Manage watchers of all open files. Never blocks the main loop."""
+    def __init__(self, main_widget):
+        self.main_widget = main_widget
+        self.watchers = {}
+
+    def __contains__(self, name):
+        return name in self.watchers
+
+    def add(self, name):
+        """
+        Watch file, or remember its current state if it is already watched.
+
+        Parameters
+        ----------
+        name: str
+            Full path of the file
+        """
+        if name in self.watchers:
+            self.watchers[name].record_state()
+        else:
+            self.watchers[name] = Watcher(self, name)
+
+    def remove(self, name):
+        """
+        Stop watching file.
+
+        Parameters
+        ----------
+        name: str
+            Full path of the file
+        """
+        if name in self.watchers:
+            self.watchers.pop(name).cancel()
+
+    def notify_changed(self, name):
+        if name in self.main_widget.store.bibfiles:
+            self.main_widget.declare_file_created(name)
+            page = self.main_widget.store.bibfiles[name].itemlist.page
             page.changed_bar.reveal()
-        if event_type in DELETED_EVENTS:
+
+    def notify_deleted(self, name):
+        if name in self.main_widget.store.bibfiles:
+            self.main_widget.declare_file_created(name)
+            page = self.main_widget.store.bibfiles[name].itemlist.page
             page.deleted_bar.reveal()
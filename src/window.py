@@ -30,6 +30,8 @@ from .main_widget import MainWidget
 
 from .session_manager import SessionManager
 
+from .instrumentation import profile_step
+
 
 class Spacer(Gtk.Separator):
     def __init__(self):
@@ -44,8 +46,10 @@ class BadaBibWindow(Adw.ApplicationWindow):
         self.set_title("Bada Bib! - BibTeX Editor")
 
         self.store = BadaBibStore()
-        self.main_widget = MainWidget(self.store)
-        self.header_bar = self.assemble_header_bar()
+        with profile_step("build main widget"):
+            self.main_widget = MainWidget(self.store)
+        with profile_step("build header bar"):
+            self.header_bar = self.assemble_header_bar()
 
         content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
         content_box.append(self.header_bar)
@@ -53,7 +57,8 @@ class BadaBibWindow(Adw.ApplicationWindow):
         self.set_content(content_box)
 
         self.session_manager = SessionManager(self.main_widget)
-        self.session_manager.restore(self.app.arg_files)
+        with profile_step("restore session"):
+            self.session_manager.restore(self.app.arg_files)
 
     def update_recent_file_menu(self):
         recent_files = get_recent_files()